@@ -5,9 +5,10 @@ This replicates the EXACT C# logic to identify differences.
 """
 
 import binascii
-import struct
 import time
 
+from sauna_frame import FRAME_PREFIX, FRAME_TAIL, HEADER, TRAILER, build_frame_into, frame_len
+
 # ==== C# CRC32 REPLICATION (initial=0, no final XOR) ====
 def build_crc32_table():
     poly = 0xEDB88320
@@ -37,33 +38,16 @@ def crc32_python_style(data: bytes) -> int:
 
 
 # ==== Frame building ====
-def write_u32_be(buf: bytearray, offset: int, value: int):
-    buf[offset:offset+4] = struct.pack(">I", value)
-
 def build_frame(cmd: int, payload: bytes, prefix: bytes, use_csharp_crc: bool) -> bytes:
-    payload_len = len(prefix) + len(payload)
-    len_field = payload_len + 8
-    total_len = 16 + len_field
-    
-    frame = bytearray(total_len)
-    write_u32_be(frame, 0, 0x000055AA)
     seq = int(time.time() * 1000) & 0xFFFFFFFF
-    write_u32_be(frame, 4, seq)
-    write_u32_be(frame, 8, cmd)
-    write_u32_be(frame, 12, len_field)
-    
-    frame[16:16+len(prefix)] = prefix
-    frame[16+len(prefix):16+len(prefix)+len(payload)] = payload
-    
+    if not use_csharp_crc:
+        frame = bytearray(frame_len(len(prefix) + len(payload)))
+        build_frame_into(frame, 0, cmd, payload, prefix, seq)
+        return bytes(frame)
+
     # CRC computation - the key difference!
-    if use_csharp_crc:
-        crc = crc32_csharp_style(bytes(frame[:-8]))
-    else:
-        crc = crc32_python_style(bytes(frame[:-8]))
-    
-    write_u32_be(frame, len(frame) - 8, crc)
-    write_u32_be(frame, len(frame) - 4, 0x0000AA55)
-    return bytes(frame)
+    covered = HEADER.pack(FRAME_PREFIX, seq, cmd, len(prefix) + len(payload) + TRAILER.size) + prefix + payload
+    return covered + TRAILER.pack(crc32_csharp_style(covered), FRAME_TAIL)
 
 
 def main():
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark suite for the hot paths: CRC, frame build, frame parse, AES encrypt/decrypt and
+DPS extraction. No device needed.
+
+The corpus is the captured frames in sauna_frame_bench.CAPTURED_FRAMES_HEX. For the decrypt/DPS
+cases the captured ciphertexts are swapped for the captured plaintexts (docs/saunalogic-pcap-notes.md)
+re-encrypted under a test key, so header layout and ciphertext lengths match the real traffic.
+
+The telemetry group replays the Type-8 frames of --pcap (default PCAPdroid_15_Jan_22_43_37.pcap),
+re-encrypted the same way with a different temperature each, through the full decrypt_frame_json
+path and the partial-decrypt decrypt_frame_dps path; both are checked to give identical dps first.
+
+The eta group turns the same Type-8 frames into a heat-up series: capture timestamps, dps 3 from
+decrypt_frame_dps, repeated end to end (each copy continuing the climb) to --eta-samples readings.
+It times the O(1) EtaEstimator over the whole series against the windowed least-squares refit
+sauna_scheduler does per reading, and sauna_eta.backfill with and without NumPy.
+
+sauna_frame's plaintext cache is off for every case except the "cache" group, which times the
+same decrypt_frame_json calls answered from it (a repeated frame).
+
+Each case is auto-ranged to ~--min-time per run, repeated --repeat times, and the best run is
+reported as ns/op. --out writes the results as JSON; --compare checks them against an earlier
+file and exits 1 if any case got slower than --threshold.
+
+Usage:
+  python3 saunalogic_extract/sauna_bench.py
+  python3 saunalogic_extract/sauna_bench.py --out bench.json
+  python3 saunalogic_extract/sauna_bench.py --compare bench.json --threshold 0.2 --filter crc
+"""
+
+from __future__ import annotations
+
+import argparse
+import binascii
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable
+
+import diagnose_csharp_vs_python as diag
+import sauna_crypto
+import sauna_eta
+import sauna_frame
+import test_csharp_logic as cs
+from sauna_frame import (
+    TYPE7_PREFIX_15,
+    FrameDecoder,
+    build_dps_write_json,
+    build_frame,
+    build_frame_into,
+    crc32_ieee,
+    decrypt_frame_dps,
+    decrypt_frame_json,
+    locate_ciphertext,
+)
+from sauna_frame_bench import CAPTURED_FRAMES_HEX, legacy_parse_one_frame
+from sauna_scheduler import DeviceSchedule
+
+TEST_KEY = "0123456789abcdef"
+TELEMETRY_PCAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PCAPdroid_15_Jan_22_43_37.pcap")
+
+SNAPSHOT_JSON = (
+    b'{"devId":"eb0000000000000000test","dps":{"1":false,"2":194,"3":73,"4":"ONLY_TRAD",'
+    b'"9":"1","10":0,"11":0,"101":"0","103":false,"105":"1","106":0,"107":"F"}}'
+)
+TELEMETRY_JSON = b'{"devId":"eb0000000000000000test","dps":{"3":156},"t":1768545835}'
+
+
+# ==== corpus ====
+def captured_frames() -> list[bytes]:
+    return [binascii.unhexlify(h) for h in CAPTURED_FRAMES_HEX]
+
+
+def reencrypt(frame: bytes, plaintext: bytes, key: str) -> bytes:
+    """
+    Replaces the ciphertext of a captured frame with `plaintext` encrypted under `key` (same header).
+    """
+    cmd = int.from_bytes(frame[8:12], "big")
+    body = frame[16:]
+    span = locate_ciphertext(cmd, body)
+    if span is None:
+        raise ValueError(f"no ciphertext in cmd={cmd} frame")
+    ct = sauna_crypto.aes_128_ecb_encrypt(plaintext, key)
+    return build_frame(cmd, ct, body[: span[0]], seq=int.from_bytes(frame[4:8], "big"))
+
+
+def decrypt_corpus(key: str) -> dict[str, bytes]:
+    frames = captured_frames()
+    by_cmd = {int.from_bytes(f[8:12], "big"): f for f in frames if len(f) > 100}
+    return {
+        "type10": reencrypt(by_cmd[10], SNAPSHOT_JSON, key),
+        "type8": reencrypt(by_cmd[8], TELEMETRY_JSON, key),
+    }
+
+
+def telemetry_corpus(path: str, key: str) -> list[bytes]:
+    """
+    Type-8 frames from a capture, re-encrypted under `key` with a varying temperature.
+    """
+    from sauna_pcap import iter_frames
+
+    out = []
+    for i, fr in enumerate(f for f in iter_frames(path) if f.cmd == 8):
+        pt = b'{"devId":"eb0000000000000000test","dps":{"3":%d},"t":%d}' % (150 + i, 1768545835 + i)
+        out.append(reencrypt(fr.frame, pt, key))
+    return out
+
+
+def eta_series(path: str, key: str, n: int) -> tuple[list[float], list[float]]:
+    """
+    (ts, dps 3) for `n` readings: the capture's Type-8 timestamps with the temperatures decrypted
+    from telemetry_corpus(), repeated back to back so the series keeps climbing.
+    """
+    from sauna_pcap import iter_frames
+
+    stamps = [f.ts for f in iter_frames(path) if f.cmd == 8]
+    temps = [float(decrypt_frame_dps(f, key)["3"]) for f in telemetry_corpus(path, key)]  # type: ignore[index]
+    period = stamps[-1] - stamps[0] + (stamps[-1] - stamps[0]) / max(1, len(stamps) - 1)
+    rise = temps[-1] - temps[0] + 1.0
+    ts: list[float] = []
+    ys: list[float] = []
+    k = 0
+    while len(ts) < n:
+        ts.extend(t + k * period for t in stamps)
+        ys.extend(y + k * rise for y in temps)
+        k += 1
+    return ts[:n], ys[:n]
+
+
+# ==== timing ====
+def measure(fn: Callable[[], Any], min_time: float, repeat: int) -> tuple[float, int]:
+    """
+    Returns (best ns per call, calls per run).
+    """
+    n = 1
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter_ns() - t0
+        if dt >= min_time * 1e9:
+            break
+        n *= 2 if dt < min_time * 1e8 else 4
+    best = dt / n
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter_ns()
+        for _ in range(n):
+            fn()
+        best = min(best, (time.perf_counter_ns() - t0) / n)
+    return best, n
+
+
+def build_cases(key: str, pcap: str | None = None, eta_samples: int = 1000) -> list[tuple[str, str, Callable[[], Any], int]]:
+    """
+    (group, name, fn, bytes processed per call) for every benchmark case.
+    """
+    frames = captured_frames()
+    t7 = next(f for f in frames if int.from_bytes(f[8:12], "big") == 7)
+    crc_input = t7[:-8]
+    stream = b"".join(frames) * 16
+    n_stream = len(frames) * 16
+    dec = decrypt_corpus(key)
+    snap_ct = sauna_crypto.aes_128_ecb_encrypt(SNAPSHOT_JSON, key)
+    write_json = build_dps_write_json("eb0000000000000000test", None, {"1": True}).encode("utf-8")
+    write_ct = sauna_crypto.aes_128_ecb_encrypt(write_json, key)
+    cs_cipher = sauna_crypto.get_cipher(key)
+    frame_buf = bytearray(len(t7))
+
+    def parse_decoder() -> int:
+        d = FrameDecoder()
+        return sum(1 for _ in d.feed(stream))
+
+    def parse_legacy() -> int:
+        n = 0
+        buf = stream
+        while True:
+            fr, buf = legacy_parse_one_frame(buf)
+            if fr is None:
+                return n
+            n += 1
+
+    def parse_csharp() -> int:
+        n = 0
+        off = 0
+        end = len(stream)
+        while True:
+            ok, start, flen = cs.SaunaTuyaFrame.try_parse_one_frame(stream, off, end - off)
+            if not ok:
+                return n
+            off = start + flen
+            n += 1
+
+    for fn in (parse_decoder, parse_legacy, parse_csharp):
+        if fn() != n_stream:
+            raise SystemExit(f"{fn.__name__}: parsed {fn()} of {n_stream} frames")
+
+    def dps_snapshot() -> Any:
+        return decrypt_frame_json(dec["type10"], key)["dps"]  # type: ignore[index]
+
+    def dps_telemetry() -> Any:
+        return decrypt_frame_json(dec["type8"], key)["dps"]  # type: ignore[index]
+
+    if dps_snapshot()["2"] != 194 or dps_telemetry()["3"] != 156:
+        raise SystemExit("dps extraction mismatch")
+
+    telemetry: list[tuple[str, str, Callable[[], Any], int]] = []
+    if pcap and os.path.exists(pcap):
+        frames8 = telemetry_corpus(pcap, key)
+        for fr in frames8:
+            full = decrypt_frame_json(fr, key)
+            if full is None or decrypt_frame_dps(fr, key) != full["dps"]:
+                raise SystemExit("decrypt_frame_dps differs from full decryption")
+        nbytes = sum(len(f) for f in frames8)
+        telemetry = [
+            ("telemetry", f"full decrypt_frame_json ({len(frames8)} Type-8)", lambda: [decrypt_frame_json(f, key)["dps"] for f in frames8], nbytes),  # type: ignore[index]
+            ("telemetry", f"partial decrypt_frame_dps ({len(frames8)} Type-8)", lambda: [decrypt_frame_dps(f, key) for f in frames8], nbytes),
+        ]
+
+    eta: list[tuple[str, str, Callable[[], Any], int]] = []
+    if pcap and os.path.exists(pcap):
+        ts, ys = eta_series(pcap, key, eta_samples)
+        setpoint = ys[-1] + 10.0
+        n_eta = len(ts)
+
+        def eta_stream() -> Any:
+            est = sauna_eta.EtaEstimator()
+            for t, y in zip(ts, ys):
+                est.update(t, y, setpoint)
+            return est.eta()
+
+        def eta_refit() -> Any:
+            d = DeviceSchedule("bench")
+            for t, y in zip(ts, ys):
+                d.samples.append((t, y))
+                while t - d.samples[0][0] > 180.0:
+                    d.samples.popleft()
+                d.slope()
+            return d.slope()
+
+        def eta_backfill_loop() -> Any:
+            np_, sauna_eta.np = sauna_eta.np, None
+            try:
+                return sauna_eta.backfill(ts, ys, setpoint)
+            finally:
+                sauna_eta.np = np_
+
+        if eta_stream() is None:
+            raise SystemExit("EtaEstimator gave no ETA on the capture series")
+        eta = [
+            ("eta", f"EtaEstimator.update x{n_eta}", eta_stream, 0),
+            ("eta", f"180 s least-squares refit x{n_eta}", eta_refit, 0),
+            ("eta", f"backfill, pure Python x{n_eta}", eta_backfill_loop, 0),
+        ]
+        if sauna_eta.np is not None:
+            eta.append(("eta", f"backfill, NumPy x{n_eta}", lambda: sauna_eta.backfill(ts, ys, setpoint), 0))
+
+    return [
+        ("crc", "binascii.crc32 (sauna_frame.crc32_ieee)", lambda: crc32_ieee(crc_input), len(crc_input)),
+        ("crc", "table loop (diagnose_csharp_vs_python)", lambda: diag.crc32_csharp_style(crc_input), len(crc_input)),
+        ("crc", "SaunaCrc32.compute (test_csharp_logic)", lambda: cs.SaunaCrc32.compute(crc_input, 0, len(crc_input)), len(crc_input)),
+        ("build", "sauna_frame.build_frame", lambda: build_frame(7, write_ct, TYPE7_PREFIX_15, seq=1), len(t7)),
+        ("build", "sauna_frame.build_frame_into (reused buffer)", lambda: build_frame_into(frame_buf, 0, 7, write_ct, TYPE7_PREFIX_15, 1), len(t7)),
+        ("build", "SaunaTuyaFrame.build_frame (C# port)", lambda: cs.SaunaTuyaFrame.build_frame(1, 7, write_ct, TYPE7_PREFIX_15), len(t7)),
+        ("build", "diagnose build_frame (zlib crc)", lambda: diag.build_frame(7, write_ct, TYPE7_PREFIX_15, False), len(t7)),
+        ("parse", f"FrameDecoder.feed ({n_stream} frames)", parse_decoder, len(stream)),
+        ("parse", f"legacy parse_one_frame ({n_stream} frames)", parse_legacy, len(stream)),
+        ("parse", f"try_parse_one_frame C# port ({n_stream} frames)", parse_csharp, len(stream)),
+        ("encrypt", f"aes_128_ecb_encrypt {len(SNAPSHOT_JSON)}B", lambda: sauna_crypto.aes_128_ecb_encrypt(SNAPSHOT_JSON, key), len(SNAPSHOT_JSON)),
+        ("encrypt", "SaunaCrypto.aes_128_ecb_encrypt (C# port)", lambda: cs.SaunaCrypto.aes_128_ecb_encrypt(key, SNAPSHOT_JSON), len(SNAPSHOT_JSON)),
+        ("decrypt", f"aes_128_ecb_decrypt {len(snap_ct)}B", lambda: sauna_crypto.aes_128_ecb_decrypt(snap_ct, key), len(snap_ct)),
+        ("decrypt", "decrypt_blocks (no unpad)", lambda: cs_cipher.decrypt_blocks(snap_ct), len(snap_ct)),
+        ("dps", "decrypt_frame_json Type-10 -> dps", dps_snapshot, len(dec["type10"])),
+        ("dps", "decrypt_frame_json Type-8 -> dps", dps_telemetry, len(dec["type8"])),
+        ("dps", "json.loads snapshot -> dps", lambda: json.loads(SNAPSHOT_JSON)["dps"], len(SNAPSHOT_JSON)),
+        ("cache", "decrypt_frame_json Type-10 (cached)", dps_snapshot, len(dec["type10"])),
+        ("cache", "decrypt_frame_json Type-8 (cached)", dps_telemetry, len(dec["type8"])),
+    ] + telemetry + eta
+
+
+def compare(results: list[dict[str, Any]], baseline_path: str, threshold: float) -> int:
+    with open(baseline_path, encoding="utf-8") as f:
+        base = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"--- vs {baseline_path} (threshold +{threshold:.0%})")
+    for r in results:
+        b = base.get(r["name"])
+        if b is None:
+            continue
+        change = r["ns_per_op"] / b["ns_per_op"] - 1.0
+        flag = "REGRESSION" if change > threshold else ""
+        regressions += bool(flag)
+        print(f"{r['name']:<48} {b['ns_per_op']:12.0f} -> {r['ns_per_op']:12.0f} ns  {change:+7.1%}  {flag}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--key", default=TEST_KEY)
+    ap.add_argument("--min-time", type=float, default=0.1, help="seconds per timed run")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--pcap", default=TELEMETRY_PCAP, help="capture for the telemetry cases")
+    ap.add_argument("--eta-samples", type=int, default=1000, help="readings in the eta series")
+    ap.add_argument("--filter", help="only cases whose group or name contains this")
+    ap.add_argument("--out", help="write results as JSON")
+    ap.add_argument("--compare", help="earlier --out file to compare against")
+    ap.add_argument("--threshold", type=float, default=0.25, help="slowdown ratio counted as a regression")
+    args = ap.parse_args()
+
+    cases = build_cases(args.key, args.pcap, args.eta_samples)
+    if args.filter:
+        cases = [c for c in cases if args.filter in c[0] or args.filter in c[1]]
+
+    print(f"python {platform.python_version()}  crypto backend: {sauna_crypto.backend_name()}")
+    print(f"{'case':<48} {'ns/op':>12} {'ops/s':>12} {'MB/s':>9}")
+    results: list[dict[str, Any]] = []
+    group = ""
+    for g, name, fn, nbytes in cases:
+        if g != group:
+            print(f"[{g}]")
+            group = g
+        sauna_frame.set_plaintext_cache(g == "cache")
+        ns, n = measure(fn, args.min_time, args.repeat)
+        mbs = nbytes / ns * 1e3
+        print(f"{name:<48} {ns:12.0f} {1e9 / ns:12.0f} {mbs:9.1f}")
+        results.append({"group": g, "name": name, "ns_per_op": ns, "ops_per_s": 1e9 / ns, "mb_per_s": mbs, "bytes": nbytes, "calls": n})
+
+    if args.out:
+        doc = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "crypto_backend": sauna_crypto.backend_name(),
+            "argv": sys.argv[1:],
+            "results": results,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+        print("wrote", args.out)
+    if args.compare:
+        return compare(results, args.compare, args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
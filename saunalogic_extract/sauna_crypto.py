@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+In-process AES-128-ECB (PKCS7) for the SaunaLogic LAN helpers.
+
+The scripts used to fork `openssl enc` for every encrypt/decrypt; a single brute-force
+poll could spawn hundreds of processes. This module keeps one cipher object per localKey
+(key schedule computed once) and runs entirely in-process:
+
+- libcrypto via ctypes (EVP API, padding disabled, context reused) when it can be loaded
+- otherwise a pure-Python table-driven AES (T-tables), stdlib only
+
+Set SAUNA_CRYPTO_BACKEND=python to force the fallback (useful for comparing results).
+
+ECB encrypts each 16-byte block independently, so aes_128_ecb_encrypt() keeps a per-key cache
+of plaintext block -> ciphertext block: the constant {"devId":"..","dps":{ prefix of every write
+is looked up instead of encrypted. That pays off on the pure-Python backend (~25x per write); with
+libcrypto one EVP call for the whole body is cheaper than the per-block lookups, so by default the
+cache is only on for the fallback. SAUNA_ECB_CACHE=1/0 (or set_encrypt_cache()) forces it either
+way; encrypt_cache_stats() reports the hit rate.
+
+AES-128-GCM decrypt (CTR over the same block cipher + GHASH) is here too, for the 3.5-style
+6699 UDP discovery broadcasts.
+
+Usage:
+  from sauna_crypto import aes_128_ecb_decrypt, aes_128_ecb_encrypt
+  pt = aes_128_ecb_decrypt(ct, "<LOCAL_KEY>")   # None if the padding is invalid
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import threading
+from functools import lru_cache
+
+BLOCK_SIZE = 16
+ENCRYPT_CACHE_MAX_BLOCKS = 4096  # per key; cleared when full
+
+
+# ==== Pure-Python AES tables ====
+def _xtime(a: int) -> int:
+    a <<= 1
+    return (a ^ 0x11B) & 0xFF if a & 0x100 else a
+
+
+def _gmul(a: int, b: int) -> int:
+    r = 0
+    while b:
+        if b & 1:
+            r ^= a
+        a = _xtime(a)
+        b >>= 1
+    return r
+
+
+def _build_sbox() -> tuple[list[int], list[int]]:
+    sbox = [0] * 256
+    inv = [0] * 256
+    for x in range(256):
+        # multiplicative inverse in GF(2^8) (0 maps to 0), then the affine transform
+        y = 0
+        if x:
+            y = next(c for c in range(1, 256) if _gmul(x, c) == 1)
+        s = y
+        for i in range(1, 5):
+            s ^= ((y << i) | (y >> (8 - i))) & 0xFF
+        s ^= 0x63
+        sbox[x] = s
+        inv[s] = x
+    return sbox, inv
+
+
+def _ror8(w: int) -> int:
+    return ((w >> 8) | (w << 24)) & 0xFFFFFFFF
+
+
+SBOX, INV_SBOX = _build_sbox()
+
+TE0 = [(_gmul(s, 2) << 24) | (s << 16) | (s << 8) | _gmul(s, 3) for s in SBOX]
+TE1 = [_ror8(w) for w in TE0]
+TE2 = [_ror8(w) for w in TE1]
+TE3 = [_ror8(w) for w in TE2]
+
+TD0 = [(_gmul(s, 14) << 24) | (_gmul(s, 9) << 16) | (_gmul(s, 13) << 8) | _gmul(s, 11) for s in INV_SBOX]
+TD1 = [_ror8(w) for w in TD0]
+TD2 = [_ror8(w) for w in TD1]
+TD3 = [_ror8(w) for w in TD2]
+
+_RCON = (0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80, 0x1B, 0x36)
+
+
+class _PyAes128:
+    """Table-driven AES-128 with the encrypt and (equivalent inverse) decrypt schedules precomputed."""
+
+    backend = "python"
+
+    def __init__(self, key: bytes) -> None:
+        w = [int.from_bytes(key[i : i + 4], "big") for i in range(0, 16, 4)]
+        for i in range(4, 44):
+            t = w[i - 1]
+            if i % 4 == 0:
+                t = ((t << 8) | (t >> 24)) & 0xFFFFFFFF
+                t = (
+                    (SBOX[t >> 24] << 24)
+                    | (SBOX[(t >> 16) & 0xFF] << 16)
+                    | (SBOX[(t >> 8) & 0xFF] << 8)
+                    | SBOX[t & 0xFF]
+                )
+                t ^= _RCON[i // 4 - 1] << 24
+            w.append(w[i - 4] ^ t)
+        self._ek = w
+        self._ek_last = (w[40] << 96) | (w[41] << 64) | (w[42] << 32) | w[43]
+
+        # Decryption round keys: reversed order, InvMixColumns on the middle rounds.
+        dk: list[int] = []
+        for r in range(10, -1, -1):
+            for c in range(4):
+                k = w[4 * r + c]
+                if 0 < r < 10:
+                    k = (
+                        TD0[SBOX[k >> 24]]
+                        ^ TD1[SBOX[(k >> 16) & 0xFF]]
+                        ^ TD2[SBOX[(k >> 8) & 0xFF]]
+                        ^ TD3[SBOX[k & 0xFF]]
+                    )
+                dk.append(k)
+        self._dk = dk
+        self._dk_last = (dk[40] << 96) | (dk[41] << 64) | (dk[42] << 32) | dk[43]
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        ek = self._ek
+        out = bytearray(len(data))
+        for off in range(0, len(data), 16):
+            s0 = int.from_bytes(data[off : off + 4], "big") ^ ek[0]
+            s1 = int.from_bytes(data[off + 4 : off + 8], "big") ^ ek[1]
+            s2 = int.from_bytes(data[off + 8 : off + 12], "big") ^ ek[2]
+            s3 = int.from_bytes(data[off + 12 : off + 16], "big") ^ ek[3]
+            for r in range(1, 10):
+                k = 4 * r
+                t0 = TE0[s0 >> 24] ^ TE1[(s1 >> 16) & 0xFF] ^ TE2[(s2 >> 8) & 0xFF] ^ TE3[s3 & 0xFF] ^ ek[k]
+                t1 = TE0[s1 >> 24] ^ TE1[(s2 >> 16) & 0xFF] ^ TE2[(s3 >> 8) & 0xFF] ^ TE3[s0 & 0xFF] ^ ek[k + 1]
+                t2 = TE0[s2 >> 24] ^ TE1[(s3 >> 16) & 0xFF] ^ TE2[(s0 >> 8) & 0xFF] ^ TE3[s1 & 0xFF] ^ ek[k + 2]
+                t3 = TE0[s3 >> 24] ^ TE1[(s0 >> 16) & 0xFF] ^ TE2[(s1 >> 8) & 0xFF] ^ TE3[s2 & 0xFF] ^ ek[k + 3]
+                s0, s1, s2, s3 = t0, t1, t2, t3
+            block = bytes(
+                (
+                    SBOX[s0 >> 24], SBOX[(s1 >> 16) & 0xFF], SBOX[(s2 >> 8) & 0xFF], SBOX[s3 & 0xFF],
+                    SBOX[s1 >> 24], SBOX[(s2 >> 16) & 0xFF], SBOX[(s3 >> 8) & 0xFF], SBOX[s0 & 0xFF],
+                    SBOX[s2 >> 24], SBOX[(s3 >> 16) & 0xFF], SBOX[(s0 >> 8) & 0xFF], SBOX[s1 & 0xFF],
+                    SBOX[s3 >> 24], SBOX[(s0 >> 16) & 0xFF], SBOX[(s1 >> 8) & 0xFF], SBOX[s2 & 0xFF],
+                )
+            )
+            out[off : off + 16] = (int.from_bytes(block, "big") ^ self._ek_last).to_bytes(16, "big")
+        return bytes(out)
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        dk = self._dk
+        out = bytearray(len(data))
+        for off in range(0, len(data), 16):
+            s0 = int.from_bytes(data[off : off + 4], "big") ^ dk[0]
+            s1 = int.from_bytes(data[off + 4 : off + 8], "big") ^ dk[1]
+            s2 = int.from_bytes(data[off + 8 : off + 12], "big") ^ dk[2]
+            s3 = int.from_bytes(data[off + 12 : off + 16], "big") ^ dk[3]
+            for r in range(1, 10):
+                k = 4 * r
+                t0 = TD0[s0 >> 24] ^ TD1[(s3 >> 16) & 0xFF] ^ TD2[(s2 >> 8) & 0xFF] ^ TD3[s1 & 0xFF] ^ dk[k]
+                t1 = TD0[s1 >> 24] ^ TD1[(s0 >> 16) & 0xFF] ^ TD2[(s3 >> 8) & 0xFF] ^ TD3[s2 & 0xFF] ^ dk[k + 1]
+                t2 = TD0[s2 >> 24] ^ TD1[(s1 >> 16) & 0xFF] ^ TD2[(s0 >> 8) & 0xFF] ^ TD3[s3 & 0xFF] ^ dk[k + 2]
+                t3 = TD0[s3 >> 24] ^ TD1[(s2 >> 16) & 0xFF] ^ TD2[(s1 >> 8) & 0xFF] ^ TD3[s0 & 0xFF] ^ dk[k + 3]
+                s0, s1, s2, s3 = t0, t1, t2, t3
+            block = bytes(
+                (
+                    INV_SBOX[s0 >> 24], INV_SBOX[(s3 >> 16) & 0xFF], INV_SBOX[(s2 >> 8) & 0xFF], INV_SBOX[s1 & 0xFF],
+                    INV_SBOX[s1 >> 24], INV_SBOX[(s0 >> 16) & 0xFF], INV_SBOX[(s3 >> 8) & 0xFF], INV_SBOX[s2 & 0xFF],
+                    INV_SBOX[s2 >> 24], INV_SBOX[(s1 >> 16) & 0xFF], INV_SBOX[(s0 >> 8) & 0xFF], INV_SBOX[s3 & 0xFF],
+                    INV_SBOX[s3 >> 24], INV_SBOX[(s2 >> 16) & 0xFF], INV_SBOX[(s1 >> 8) & 0xFF], INV_SBOX[s0 & 0xFF],
+                )
+            )
+            out[off : off + 16] = (int.from_bytes(block, "big") ^ self._dk_last).to_bytes(16, "big")
+        return bytes(out)
+
+
+# ==== libcrypto (ctypes) backend ====
+def _load_libcrypto() -> ctypes.CDLL | None:
+    name = ctypes.util.find_library("crypto")
+    candidates = [name] if name else []
+    candidates += ["libcrypto.so.3", "libcrypto.so.1.1", "libcrypto.dylib"]
+    for c in candidates:
+        try:
+            lib = ctypes.CDLL(c)
+        except OSError:
+            continue
+        try:
+            lib.EVP_CIPHER_CTX_new.restype = ctypes.c_void_p
+            lib.EVP_CIPHER_CTX_free.argtypes = [ctypes.c_void_p]
+            lib.EVP_aes_128_ecb.restype = ctypes.c_void_p
+            lib.EVP_CipherInit_ex.argtypes = [
+                ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int,
+            ]
+            lib.EVP_CIPHER_CTX_set_padding.argtypes = [ctypes.c_void_p, ctypes.c_int]
+            lib.EVP_CipherUpdate.argtypes = [
+                ctypes.c_void_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_int), ctypes.c_char_p, ctypes.c_int,
+            ]
+        except AttributeError:
+            continue
+        return lib
+    return None
+
+
+_LIBCRYPTO = None if os.environ.get("SAUNA_CRYPTO_BACKEND") == "python" else _load_libcrypto()
+
+
+class _LibcryptoAes128:
+    """AES-128-ECB through OpenSSL EVP; one initialized context per direction, padding handled by us."""
+
+    backend = "libcrypto"
+
+    def __init__(self, key: bytes, lib: ctypes.CDLL) -> None:
+        self._lib = lib
+        # ctypes drops the GIL during the call; don't let two threads share a context mid-update.
+        self._lock = threading.Lock()
+        self._enc = self._new_ctx(key, 1)
+        self._dec = self._new_ctx(key, 0)
+
+    def _new_ctx(self, key: bytes, enc: int) -> int:
+        lib = self._lib
+        ctx = lib.EVP_CIPHER_CTX_new()
+        if not ctx:
+            raise MemoryError("EVP_CIPHER_CTX_new failed")
+        if lib.EVP_CipherInit_ex(ctx, lib.EVP_aes_128_ecb(), None, key, None, enc) != 1:
+            lib.EVP_CIPHER_CTX_free(ctx)
+            raise RuntimeError("EVP_CipherInit_ex failed")
+        lib.EVP_CIPHER_CTX_set_padding(ctx, 0)
+        return ctx
+
+    def _update(self, ctx: int, data: bytes) -> bytes:
+        # ECB with padding disabled keeps no state between block-aligned updates,
+        # so the context can be reused without re-initializing the key schedule.
+        out = ctypes.create_string_buffer(len(data) + BLOCK_SIZE)
+        out_len = ctypes.c_int(0)
+        with self._lock:
+            ok = self._lib.EVP_CipherUpdate(ctx, out, ctypes.byref(out_len), bytes(data), len(data))
+        if ok != 1:
+            raise RuntimeError("EVP_CipherUpdate failed")
+        return out.raw[: out_len.value]
+
+    def encrypt_blocks(self, data: bytes) -> bytes:
+        return self._update(self._enc, data)
+
+    def decrypt_blocks(self, data: bytes) -> bytes:
+        return self._update(self._dec, data)
+
+    def __del__(self) -> None:
+        try:
+            self._lib.EVP_CIPHER_CTX_free(self._enc)
+            self._lib.EVP_CIPHER_CTX_free(self._dec)
+        except Exception:
+            pass
+
+
+# ==== Public API ====
+def backend_name() -> str:
+    return "libcrypto" if _LIBCRYPTO is not None else "python"
+
+
+def get_cipher(key_ascii: str) -> _PyAes128 | _LibcryptoAes128:
+    """
+    Returns the cached cipher for a localKey (key schedule computed once per key).
+    """
+    key = key_ascii.encode("utf-8")
+    if len(key) != 16:
+        raise ValueError("localKey must be 16 ASCII bytes")
+    return get_cipher_bytes(key)
+
+
+@lru_cache(maxsize=32)
+def get_cipher_bytes(key: bytes) -> _PyAes128 | _LibcryptoAes128:
+    """
+    Same as get_cipher() for a raw 16-byte key (e.g. the MD5-derived UDP discovery key).
+    """
+    if len(key) != 16:
+        raise ValueError("AES-128 key must be 16 bytes")
+    if _LIBCRYPTO is not None:
+        return _LibcryptoAes128(key, _LIBCRYPTO)
+    return _PyAes128(key)
+
+
+def pkcs7_pad(data: bytes) -> bytes:
+    n = BLOCK_SIZE - (len(data) % BLOCK_SIZE)
+    return bytes(data) + bytes((n,)) * n
+
+
+def pkcs7_unpad(data: bytes) -> bytes | None:
+    if not data:
+        return None
+    n = data[-1]
+    if n < 1 or n > BLOCK_SIZE or data[-n:] != bytes((n,)) * n:
+        return None
+    return data[:-n]
+
+
+_encrypt_cache_enabled = os.environ.get("SAUNA_ECB_CACHE", "0" if _LIBCRYPTO is not None else "1") != "0"
+_encrypt_stats = {"hits": 0, "misses": 0}
+
+
+@lru_cache(maxsize=32)
+def _encrypt_block_cache(key_ascii: str) -> dict[bytes, bytes]:
+    return {}
+
+
+def set_encrypt_cache(enabled: bool) -> None:
+    global _encrypt_cache_enabled
+    _encrypt_cache_enabled = enabled
+    _encrypt_block_cache.cache_clear()
+
+
+def encrypt_cache_stats() -> dict[str, float]:
+    hits, misses = _encrypt_stats["hits"], _encrypt_stats["misses"]
+    total = hits + misses
+    return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+
+def aes_128_ecb_encrypt(plaintext: bytes, key_ascii: str) -> bytes:
+    padded = pkcs7_pad(plaintext)
+    cipher = get_cipher(key_ascii)
+    if not _encrypt_cache_enabled:
+        return cipher.encrypt_blocks(padded)
+    cache = _encrypt_block_cache(key_ascii)
+    blocks = [padded[i : i + BLOCK_SIZE] for i in range(0, len(padded), BLOCK_SIZE)]
+    out = [cache.get(b) for b in blocks]
+    miss = [i for i, c in enumerate(out) if c is None]
+    _encrypt_stats["hits"] += len(blocks) - len(miss)
+    _encrypt_stats["misses"] += len(miss)
+    if miss:
+        # Only the blocks that changed go through AES, in one call.
+        ct = cipher.encrypt_blocks(b"".join(blocks[i] for i in miss))
+        if len(cache) + len(miss) > ENCRYPT_CACHE_MAX_BLOCKS:
+            cache.clear()
+        for j, i in enumerate(miss):
+            c = ct[j * BLOCK_SIZE : (j + 1) * BLOCK_SIZE]
+            out[i] = c
+            cache[blocks[i]] = c
+    return b"".join(out)  # type: ignore[arg-type]
+
+
+def aes_128_ecb_decrypt(ciphertext: bytes, key_ascii: str) -> bytes | None:
+    """
+    Same contract as the old `openssl enc -d` helpers: plaintext, or None when the input is not
+    block-aligned or the PKCS7 padding does not check out (wrong key / wrong slice).
+    """
+    if not ciphertext or len(ciphertext) % BLOCK_SIZE != 0:
+        return None
+    return pkcs7_unpad(get_cipher(key_ascii).decrypt_blocks(ciphertext))
+
+
+# ==== AES-128-GCM (decrypt only) ====
+_GCM_R = 0xE1 << 120
+
+
+def _gf128_mul(x: int, y: int) -> int:
+    z = 0
+    v = y
+    for i in range(127, -1, -1):
+        if (x >> i) & 1:
+            z ^= v
+        v = (v >> 1) ^ _GCM_R if v & 1 else v >> 1
+    return z
+
+
+def _ghash(h: int, aad: bytes, ct: bytes) -> int:
+    y = 0
+    for data in (aad, ct):
+        for i in range(0, len(data), BLOCK_SIZE):
+            block = data[i : i + BLOCK_SIZE]
+            y = _gf128_mul(y ^ int.from_bytes(block.ljust(BLOCK_SIZE, b"\x00"), "big"), h)
+    lengths = ((len(aad) * 8) << 64) | (len(ct) * 8)
+    return _gf128_mul(y ^ lengths, h)
+
+
+def aes_128_gcm_decrypt(ciphertext: bytes, key: bytes, iv: bytes, aad: bytes, tag: bytes) -> bytes | None:
+    """
+    AES-128-GCM with a 12-byte IV; returns the plaintext, or None if the tag doesn't verify.
+    """
+    if len(iv) != 12 or not 12 <= len(tag) <= 16:
+        return None
+    cipher = get_cipher_bytes(key)
+    nblocks = (len(ciphertext) + BLOCK_SIZE - 1) // BLOCK_SIZE
+    # Counter blocks J0 (tag mask), J0+1, J0+2, ... encrypted in one ECB call.
+    counters = b"".join(iv + (i + 1).to_bytes(4, "big") for i in range(nblocks + 1))
+    stream = cipher.encrypt_blocks(bytes(BLOCK_SIZE) + counters)
+    h = int.from_bytes(stream[:BLOCK_SIZE], "big")
+    s = stream[BLOCK_SIZE : 2 * BLOCK_SIZE]
+    expected = (_ghash(h, bytes(aad), bytes(ciphertext)) ^ int.from_bytes(s, "big")).to_bytes(BLOCK_SIZE, "big")
+    if expected[: len(tag)] != bytes(tag):
+        return None
+    ks = stream[2 * BLOCK_SIZE : 2 * BLOCK_SIZE + len(ciphertext)]
+    return (int.from_bytes(ciphertext, "big") ^ int.from_bytes(ks, "big")).to_bytes(len(ciphertext), "big")
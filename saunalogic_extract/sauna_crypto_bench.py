@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark AES-128-ECB decrypts/sec: `openssl enc` per call (old behavior) vs the in-process
+sauna_crypto backends (libcrypto via ctypes, pure-Python fallback).
+
+No device needed: a DP snapshot-shaped JSON is encrypted under a test key and decrypted repeatedly.
+
+Usage:
+  python3 saunalogic_extract/sauna_crypto_bench.py
+  python3 saunalogic_extract/sauna_crypto_bench.py --key "<LOCAL_KEY>" --count 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import subprocess
+import time
+from typing import Callable
+
+import sauna_crypto
+
+SAMPLE_JSON = (
+    b'{"devId":"eb0000000000000000test","dps":{"1":false,"2":194,"3":73,"4":"ONLY_TRAD",'
+    b'"9":"1","10":0,"11":0,"101":"0","103":false,"105":"1","106":0,"107":"F"}}'
+)
+
+
+def openssl_subprocess_decrypt(ciphertext: bytes, key_ascii: str) -> bytes | None:
+    # The pre-sauna_crypto implementation, kept here only as the "before" baseline.
+    p = subprocess.run(
+        ["openssl", "enc", "-aes-128-ecb", "-d", "-K", key_ascii.encode("utf-8").hex(), "-nosalt"],
+        input=ciphertext,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=False,
+    )
+    return p.stdout if p.returncode == 0 else None
+
+
+def bench(name: str, fn: Callable[[bytes, str], bytes | None], ct: bytes, key: str, count: int) -> float:
+    if fn(ct, key) != SAMPLE_JSON:
+        raise SystemExit(f"{name}: decrypt mismatch")
+    t0 = time.perf_counter()
+    for _ in range(count):
+        fn(ct, key)
+    dt = time.perf_counter() - t0
+    rate = count / dt if dt > 0 else float("inf")
+    print(f"{name:<22} {count:>7} decrypts  {dt * 1000.0:9.1f} ms  {rate:12.0f} /s")
+    return rate
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--key", default="0123456789abcdef", help="16-char test key (any value works)")
+    ap.add_argument("--count", type=int, default=5000, help="in-process iterations per backend")
+    ap.add_argument("--openssl-count", type=int, default=50, help="iterations for the subprocess baseline")
+    args = ap.parse_args()
+
+    ct = sauna_crypto.aes_128_ecb_encrypt(SAMPLE_JSON, args.key)
+    print(f"ciphertext: {len(ct)} bytes ({len(ct) // 16} blocks); default backend: {sauna_crypto.backend_name()}")
+
+    rates: dict[str, float] = {}
+    if shutil.which("openssl") and args.openssl_count > 0:
+        rates["openssl subprocess"] = bench("openssl subprocess", openssl_subprocess_decrypt, ct, args.key, args.openssl_count)
+    else:
+        print("openssl subprocess     skipped (openssl not on PATH)")
+
+    key = args.key.encode("utf-8")
+    py = sauna_crypto._PyAes128(key)
+    rates["python tables"] = bench(
+        "python tables", lambda c, k: sauna_crypto.pkcs7_unpad(py.decrypt_blocks(c)), ct, args.key, args.count
+    )
+    if sauna_crypto._LIBCRYPTO is not None:
+        lc = sauna_crypto._LibcryptoAes128(key, sauna_crypto._LIBCRYPTO)
+        rates["libcrypto ctypes"] = bench(
+            "libcrypto ctypes", lambda c, k: sauna_crypto.pkcs7_unpad(lc.decrypt_blocks(c)), ct, args.key, args.count
+        )
+    rates["aes_128_ecb_decrypt"] = bench("aes_128_ecb_decrypt", sauna_crypto.aes_128_ecb_decrypt, ct, args.key, args.count)
+
+    base = rates.get("openssl subprocess")
+    if base:
+        print("---")
+        for name, rate in rates.items():
+            print(f"{name:<22} x{rate / base:,.0f} vs openssl subprocess")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Passive LAN discovery of SaunaLogic (Tuya) controllers plus an on-disk devId -> IP directory.
+
+Tuya devices announce themselves by UDP broadcast every few seconds:
+- 6666: 55aa frame, plaintext JSON (protocol 3.1)
+- 6667: 55aa frame, JSON AES-128-ECB encrypted with md5("yGAdlopoPVldABfn") (3.3, the SL-2)
+- 7000: 6699 frame, AES-128-GCM with the same key (3.4/3.5). The phone's own broadcast seen in
+  the captures ({"from":"app","ip":..}) uses this format; it is decoded but isn't a device.
+
+A device broadcast carries {"ip":..,"gwId":<devId>,"version":..,"productKey":..}. The listener
+records gwId -> ip in a JSON directory (default ~/.cache/saunalogic/devices.json, or
+$SAUNA_DEVICE_DIRECTORY); entries older than the TTL are ignored. The poll/command tools resolve
+their target from it by devId, so a DHCP address change costs one broadcast interval instead of
+timeouts against the old IP.
+
+Usage:
+  python3 saunalogic_extract/sauna_discovery.py --listen --duration 30
+  python3 saunalogic_extract/sauna_discovery.py --list
+  python3 saunalogic_extract/sauna_discovery.py --pcap PCAPdroid_*.pcap
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import select
+import socket
+import tempfile
+import time
+from typing import Any, Callable
+
+from sauna_crypto import aes_128_gcm_decrypt, get_cipher_bytes, pkcs7_pad, pkcs7_unpad
+from sauna_frame import build_frame
+
+UDP_KEY = hashlib.md5(b"yGAdlopoPVldABfn").digest()
+DISCOVERY_PORTS = (6666, 6667, 7000)
+CMD_UDP_NEW = 0x13
+DEFAULT_TTL = 300.0
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "saunalogic", "devices.json")
+
+_PREFIX_55AA = b"\x00\x00\x55\xaa"
+_PREFIX_6699 = b"\x00\x00\x66\x99"
+_HEADER_6699 = 18  # prefix, u16 reserved, seq, cmd, length
+_GCM_IV_LEN = 12
+_GCM_TAG_LEN = 16
+
+
+# ==== broadcast codec ====
+def _json_payload(data: bytes) -> dict[str, Any] | None:
+    i = data.find(b"{")
+    if i < 0 or i > 4:  # optional 4-byte return code before the JSON
+        return None
+    try:
+        j = json.loads(data[i:].rstrip(b"\x00").decode("utf-8"))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return j if isinstance(j, dict) else None
+
+
+def decode_broadcast(data: bytes) -> dict[str, Any] | None:
+    """
+    Decodes one discovery datagram (55aa plaintext/ECB or 6699 GCM) to its JSON, else None.
+    """
+    if data[:4] == _PREFIX_55AA and len(data) >= 24:
+        ll = int.from_bytes(data[12:16], "big")
+        body = data[16 : 16 + ll - 8]
+        j = _json_payload(body)
+        if j is not None:
+            return j
+        for start in (4, 0):  # return code present or not
+            ct = body[start:]
+            if ct and len(ct) % 16 == 0:
+                pt = pkcs7_unpad(get_cipher_bytes(UDP_KEY).decrypt_blocks(ct))
+                if pt is not None and (j := _json_payload(pt)) is not None:
+                    return j
+        return None
+    if data[:4] == _PREFIX_6699 and len(data) >= _HEADER_6699 + _GCM_IV_LEN + _GCM_TAG_LEN + 4:
+        ll = int.from_bytes(data[14:18], "big")
+        body = data[_HEADER_6699 : _HEADER_6699 + ll]
+        if len(body) < _GCM_IV_LEN + _GCM_TAG_LEN:
+            return None
+        pt = aes_128_gcm_decrypt(
+            body[_GCM_IV_LEN:-_GCM_TAG_LEN], UDP_KEY, body[:_GCM_IV_LEN], data[4:_HEADER_6699], body[-_GCM_TAG_LEN:]
+        )
+        return _json_payload(pt) if pt is not None else None
+    return None
+
+
+def encode_broadcast_v33(info: dict[str, Any]) -> bytes:
+    """
+    Builds a 3.3-style 6667 broadcast (what the SL-2 sends); used by the simulator.
+    """
+    ct = get_cipher_bytes(UDP_KEY).encrypt_blocks(pkcs7_pad(json.dumps(info, separators=(",", ":")).encode("utf-8")))
+    return build_frame(CMD_UDP_NEW, ct, b"\x00\x00\x00\x00", seq=0)
+
+
+# ==== directory ====
+class DeviceDirectory:
+    """
+    devId -> {"ip", "version", "productKey", "seen", "port"} persisted as JSON.
+    """
+
+    def __init__(self, path: str | None = None, ttl: float = DEFAULT_TTL) -> None:
+        self.path = path or os.environ.get("SAUNA_DEVICE_DIRECTORY") or DEFAULT_DIRECTORY
+        self.ttl = ttl
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(raw, dict):
+            self.entries = {k: v for k, v in raw.items() if isinstance(v, dict) and "ip" in v}
+
+    def save(self) -> None:
+        d = os.path.dirname(self.path) or "."
+        os.makedirs(d, exist_ok=True)
+        # Write-then-rename so a concurrent reader never sees a half-written file.
+        fd, tmp = tempfile.mkstemp(prefix=".devices.", dir=d)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def update(self, info: dict[str, Any], port: int = 0, now: float | None = None) -> str | None:
+        """
+        Records a device broadcast; returns its devId, or None if it isn't a device announcement.
+        """
+        dev_id = info.get("gwId") or info.get("devId")
+        ip = info.get("ip")
+        if not dev_id or not ip:
+            return None
+        self.entries[str(dev_id)] = {
+            "ip": str(ip),
+            "version": info.get("version", ""),
+            "productKey": info.get("productKey", ""),
+            "port": port,
+            "seen": time.time() if now is None else now,
+        }
+        return str(dev_id)
+
+    def lookup(self, dev_id: str, now: float | None = None) -> str | None:
+        """
+        IP last announced by dev_id, or None if unknown or older than the TTL.
+        """
+        e = self.entries.get(dev_id)
+        if e is None:
+            return None
+        if (time.time() if now is None else now) - float(e.get("seen", 0)) > self.ttl:
+            return None
+        return e["ip"]
+
+
+def resolve_host(host: str | None, dev_id: str | None, default: str = "192.168.1.100") -> str:
+    """
+    Target for the CLI tools: an explicit host wins, then a fresh directory entry for dev_id, then default.
+    """
+    if host:
+        return host
+    if dev_id:
+        ip = DeviceDirectory().lookup(dev_id)
+        if ip:
+            return ip
+    return default
+
+
+# ==== listener ====
+def _bind_udp(port: int) -> socket.socket | None:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    try:
+        s.bind(("", port))
+    except OSError:
+        s.close()
+        return None
+    return s
+
+
+def listen(
+    directory: DeviceDirectory,
+    ports: tuple[int, ...] = DISCOVERY_PORTS,
+    duration: float | None = None,
+    on_device: Callable[[str, dict[str, Any]], None] | None = None,
+    save_interval: float = 5.0,
+) -> int:
+    """
+    Listens for broadcasts until `duration` elapses (None = forever); returns the number of
+    device announcements. on_device is called for new devices and address changes; the directory
+    is saved at most every save_interval seconds and on exit.
+    """
+    socks = [s for s in (_bind_udp(p) for p in ports) if s is not None]
+    if not socks:
+        raise OSError(f"could not bind any of UDP {ports}")
+    n = 0
+    dirty = False
+    last_save = time.monotonic()
+    stop_at = None if duration is None else time.monotonic() + duration
+    try:
+        while stop_at is None or time.monotonic() < stop_at:
+            wait = 1.0 if stop_at is None else max(0.0, min(1.0, stop_at - time.monotonic()))
+            r, _, _ = select.select(socks, [], [], wait)
+            for s in r:
+                data, addr = s.recvfrom(4096)
+                info = decode_broadcast(data)
+                if info is None:
+                    continue
+                info.setdefault("ip", addr[0])
+                prev = directory.entries.get(str(info.get("gwId") or info.get("devId") or ""), {}).get("ip")
+                dev_id = directory.update(info, port=s.getsockname()[1])
+                if dev_id is None:
+                    continue
+                n += 1
+                dirty = True
+                if on_device is not None and prev != info["ip"]:
+                    on_device(dev_id, directory.entries[dev_id])
+            if dirty and time.monotonic() - last_save >= save_interval:
+                directory.save()
+                dirty = False
+                last_save = time.monotonic()
+    finally:
+        for s in socks:
+            s.close()
+        if dirty:
+            directory.save()
+    return n
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    mode = ap.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--listen", action="store_true", help="listen for broadcasts and update the directory")
+    mode.add_argument("--list", action="store_true", help="print the directory")
+    mode.add_argument("--pcap", nargs="+", help="decode discovery broadcasts found in captures")
+    ap.add_argument("--directory", help=f"directory file (default {DEFAULT_DIRECTORY})")
+    ap.add_argument("--ttl", type=float, default=DEFAULT_TTL, help="seconds an entry stays valid")
+    ap.add_argument("--duration", type=float, default=0.0, help="--listen for this many seconds (0 = forever)")
+    ap.add_argument("--ports", type=int, nargs="+", default=list(DISCOVERY_PORTS))
+    args = ap.parse_args()
+
+    directory = DeviceDirectory(args.directory, ttl=args.ttl)
+    if args.list:
+        now = time.time()
+        for dev_id, e in sorted(directory.entries.items()):
+            age = now - float(e.get("seen", 0))
+            state = "ok" if age <= directory.ttl else "stale"
+            print(f"{dev_id:<24} {e['ip']:<16} v{e.get('version', '')}  seen {age:.0f}s ago ({state})")
+        return 0
+
+    if args.pcap:
+        from sauna_pcap import iter_udp
+
+        for path in args.pcap:
+            for ts, src, dst, dport, payload in iter_udp(path, tuple(args.ports)):
+                info = decode_broadcast(payload)
+                print(f"{path} {ts:.3f} {src} -> {dst}:{dport} {json.dumps(info) if info is not None else '(undecodable)'}")
+        return 0
+
+    def on_device(dev_id: str, e: dict[str, Any]) -> None:
+        print(f"{time.strftime('%H:%M:%S')} {dev_id} {e['ip']} v{e['version']} (udp/{e['port']})", flush=True)
+
+    print(f"listening on UDP {', '.join(map(str, args.ports))}; directory {directory.path}", flush=True)
+    try:
+        n = listen(directory, tuple(args.ports), args.duration or None, on_device)
+    except KeyboardInterrupt:
+        return 0
+    print(f"{n} announcements")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
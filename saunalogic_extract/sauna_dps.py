@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Typed SaunaLogic DPS snapshot with in-place deltas and change detection.
+
+The pollers get {"devId":..,"dps":{"1":..,"2":..,..}} back on every Type-10 poll and Type-8
+push; at 1 Hz nearly all of them repeat the previous state. DpsSnapshot keeps the known dps
+(1 heater, 2 setpoint, 3 current temp, 4 mode) as slots and everything else in `extras`, so
+apply(delta) and diff(prev) are a handful of comparisons and consumers only react to (and
+re-serialize) what changed. Both return changes keyed by dps id, the same shape as a Type-8 delta;
+a dps that disappeared shows up as None.
+
+Usage:
+  from sauna_dps import DpsSnapshot
+  prev = DpsSnapshot.from_dps(snap["dps"])
+  changed = prev.apply({"3": 157})          # {"3": 157}, or {} if it already read 157
+  changed = DpsSnapshot.from_dps(next_snap["dps"]).diff(prev)
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+# dps id -> slot
+KNOWN_DPS = (("1", "heater"), ("2", "setpoint"), ("3", "temp"), ("4", "mode"))
+_SLOT_BY_DPS = dict(KNOWN_DPS)
+_MISSING = object()
+
+
+class DpsSnapshot:
+    """
+    heater (dps 1), setpoint (2), temp (3), mode (4); other dps ids in extras. None = not reported.
+    """
+
+    __slots__ = ("heater", "setpoint", "temp", "mode", "extras")
+
+    def __init__(
+        self,
+        heater: bool | None = None,
+        setpoint: int | None = None,
+        temp: int | None = None,
+        mode: str | None = None,
+        extras: dict[str, Any] | None = None,
+    ) -> None:
+        self.heater = heater
+        self.setpoint = setpoint
+        self.temp = temp
+        self.mode = mode
+        self.extras: dict[str, Any] = extras if extras is not None else {}
+
+    @classmethod
+    def from_dps(cls, dps: dict[str, Any]) -> DpsSnapshot:
+        get = dps.get
+        extras = {str(k): v for k, v in dps.items() if str(k) not in _SLOT_BY_DPS}
+        return cls(get("1"), get("2"), get("3"), get("4"), extras)
+
+    def apply(self, delta: dict[str, Any]) -> dict[str, Any]:
+        """
+        Merges a dps delta in place; returns the entries that actually changed.
+        """
+        changed = {}
+        extras = self.extras
+        for k, v in delta.items():
+            k = str(k)
+            slot = _SLOT_BY_DPS.get(k)
+            if slot is not None:
+                if getattr(self, slot) != v:
+                    setattr(self, slot, v)
+                    changed[k] = v
+            elif extras.get(k, _MISSING) != v:
+                extras[k] = v
+                changed[k] = v
+        return changed
+
+    def diff(self, prev: DpsSnapshot | None) -> dict[str, Any]:
+        """
+        dps id -> value for every field that differs from `prev` (all reported fields if None).
+        """
+        if prev is None:
+            return self.to_dps()
+        changed = {}
+        for k, slot in KNOWN_DPS:
+            v = getattr(self, slot)
+            if v != getattr(prev, slot):
+                changed[k] = v
+        if self.extras != prev.extras:
+            for k, v in self.extras.items():
+                if prev.extras.get(k, _MISSING) != v:
+                    changed[k] = v
+            for k in prev.extras.keys() - self.extras.keys():
+                changed[k] = None
+        return changed
+
+    def to_dps(self) -> dict[str, Any]:
+        out = {k: getattr(self, slot) for k, slot in KNOWN_DPS if getattr(self, slot) is not None}
+        out.update(self.extras)
+        return out
+
+    def copy(self) -> DpsSnapshot:
+        return DpsSnapshot(self.heater, self.setpoint, self.temp, self.mode, dict(self.extras))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, DpsSnapshot):
+            return NotImplemented
+        return not self.diff(other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return (
+            f"DpsSnapshot(heater={self.heater!r}, setpoint={self.setpoint!r}, temp={self.temp!r}, "
+            f"mode={self.mode!r}, extras={self.extras!r})"
+        )
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Heat-up ETA ("when will it be at setpoint?") from the dps 2 / dps 3 stream, in O(1) per sample.
+
+Regressing the whole history on every poll costs O(n) per sample and per sauna. EtaEstimator
+keeps only the running sufficient statistics of an exponentially weighted linear fit of dps 3
+over time (weight halves every `half_life` seconds): total weight, weighted means of t and temp,
+and the weighted co-moments Cxx / Cxy, updated West-style so there is no cancellation between
+large sums. Each sample is a handful of float operations; memory is fixed.
+
+  slope     Cxy / Cxx (degrees per second)
+  fitted    mean_temp + slope x (t_last - mean_t), the smoothed current temperature
+  eta       (setpoint - fitted) / slope seconds after the last sample; 0 once dps 3 >= setpoint,
+            None while the fit isn't rising by at least min_slope
+
+update_snapshot() starts over whenever the heater (dps 1) is switched off.
+
+backfill() is the batch form for recorded history: with NumPy the same weighted sums come from
+cumulative sums (rebased every ~50 decay constants so the exponentials stay finite), without it
+falls back to running the estimator. backfill_rows() splits sauna_history rows into heater-on
+runs first. The "eta" group of sauna_bench.py times both against a windowed least-squares
+refit per sample (python3 saunalogic_extract/sauna_bench.py --filter eta).
+
+Usage:
+  est = EtaEstimator(half_life=300)
+  for t, temp in samples:
+      eta = est.update(t, temp, setpoint=194)       # seconds, 0.0, or None
+  etas = backfill(ts, temps, setpoints)             # one ETA per sample (NaN = unknown)
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Any, Sequence
+
+from sauna_dps import DpsSnapshot
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; backfill() falls back to the streaming estimator.
+    np = None  # type: ignore[assignment]
+
+DEFAULT_HALF_LIFE = 300.0
+MIN_SLOPE_PER_MIN = 0.05  # degrees/minute below which no ETA is given
+_REBASE = 50.0  # decay constants per NumPy chunk: e**50 ~ 5e21, well inside float range
+
+
+class EtaEstimator:
+    __slots__ = ("half_life", "min_slope", "setpoint", "temp", "last_t", "n", "_t0", "_w", "_mx", "_my", "_cxx", "_cxy")
+
+    def __init__(self, half_life: float = DEFAULT_HALF_LIFE, min_slope_per_min: float = MIN_SLOPE_PER_MIN) -> None:
+        self.half_life = half_life
+        self.min_slope = min_slope_per_min / 60.0
+        self.setpoint: float | None = None
+        self.reset()
+
+    def reset(self) -> None:
+        self.temp: float | None = None
+        self.last_t: float | None = None
+        self.n = 0
+        self._t0 = 0.0  # time origin, so the means stay small
+        self._w = 0.0
+        self._mx = 0.0
+        self._my = 0.0
+        self._cxx = 0.0
+        self._cxy = 0.0
+
+    def update(self, t: float, temp: float, setpoint: float | None = None) -> float | None:
+        """
+        Adds one dps 3 reading at time t (seconds); returns the ETA as eta() would.
+        Readings older than the last one are ignored.
+        """
+        if setpoint is not None:
+            self.setpoint = setpoint
+        last = self.last_t
+        if last is None:
+            self._t0 = t
+        elif t < last:
+            return self.eta()
+        x = t - self._t0
+        decay = 0.5 ** ((t - last) / self.half_life) if last is not None else 0.0
+        w = self._w * decay + 1.0
+        dx = x - self._mx
+        mx = self._mx + dx / w
+        my = self._my + (temp - self._my) / w
+        self._cxx = self._cxx * decay + dx * (x - mx)
+        self._cxy = self._cxy * decay + dx * (temp - my)
+        self._w, self._mx, self._my = w, mx, my
+        self.temp = temp
+        self.last_t = t
+        self.n += 1
+        return self.eta()
+
+    def update_snapshot(self, snap: DpsSnapshot, t: float) -> float | None:
+        """
+        Feeds a DpsSnapshot (dps 1/2/3); a heater that is off resets the fit and gives None.
+        """
+        if snap.setpoint is not None:
+            self.setpoint = snap.setpoint
+        if snap.heater is False:
+            self.reset()
+            return None
+        if snap.temp is None:
+            return self.eta()
+        return self.update(t, snap.temp)
+
+    @property
+    def slope(self) -> float | None:
+        """
+        Fitted degrees per second, None until two distinct sample times.
+        """
+        if self._cxx <= 0.0:
+            return None
+        return self._cxy / self._cxx
+
+    def fitted(self) -> float | None:
+        slope = self.slope
+        if slope is None or self.last_t is None:
+            return self.temp
+        return self._my + slope * (self.last_t - self._t0 - self._mx)
+
+    def eta(self, setpoint: float | None = None) -> float | None:
+        """
+        Seconds from the last sample until the fit reaches `setpoint` (default: the last dps 2 seen).
+        """
+        sp = self.setpoint if setpoint is None else setpoint
+        if sp is None or self.temp is None:
+            return None
+        if self.temp >= sp:
+            return 0.0
+        slope = self.slope
+        if slope is None or slope < self.min_slope:
+            return None
+        return max(0.0, (sp - self.fitted()) / slope)  # type: ignore[operator]
+
+
+def backfill(
+    ts: Sequence[float],
+    temps: Sequence[float],
+    setpoints: Sequence[float] | float,
+    half_life: float = DEFAULT_HALF_LIFE,
+    min_slope_per_min: float = MIN_SLOPE_PER_MIN,
+) -> Any:
+    """
+    The ETA after each sample of one heat-up run (ts ascending), as EtaEstimator.update() would
+    give it: a NumPy float array with NaN for None, or a list with None when NumPy is missing.
+    """
+    if np is None:
+        est = EtaEstimator(half_life, min_slope_per_min)
+        sps = [setpoints] * len(ts) if isinstance(setpoints, (int, float)) else setpoints
+        return [est.update(t, y, sp) for t, y, sp in zip(ts, temps, sps)]
+
+    t = np.asarray(ts, dtype=np.float64)
+    y = np.asarray(temps, dtype=np.float64)
+    sp = np.broadcast_to(np.asarray(setpoints, dtype=np.float64), t.shape)
+    n = len(t)
+    if n == 0:
+        return np.empty(0)
+    lam = math.log(2.0) / half_life
+    s0 = np.empty(n)
+    s1 = np.empty(n)
+    s2 = np.empty(n)
+    sy = np.empty(n)
+    sxy = np.empty(n)
+    x = np.empty(n)
+    # Carried sums at the end of the previous chunk, x relative to that chunk's origin.
+    carry = np.zeros(5)
+    prev_origin = prev_t = t[0]
+    start = 0
+    while start < n:
+        origin = t[start]
+        end = int(np.searchsorted(t, origin + _REBASE / lam, side="right"))
+        end = max(end, start + 1)
+        # Move the carry to this origin and decay it to the first sample of the chunk.
+        d = origin - prev_origin
+        c0, c1, c2, cy, cxy = carry
+        carry = np.array([c0, c1 - d * c0, c2 - 2 * d * c1 + d * d * c0, cy, cxy - d * cy])
+        carry *= math.exp(-lam * (origin - prev_t))
+        xc = t[start:end] - origin
+        grow = np.exp(lam * xc)
+        shrink = np.exp(-lam * xc)
+        yc = y[start:end]
+        s0[start:end] = shrink * (carry[0] + np.cumsum(grow))
+        s1[start:end] = shrink * (carry[1] + np.cumsum(grow * xc))
+        s2[start:end] = shrink * (carry[2] + np.cumsum(grow * xc * xc))
+        sy[start:end] = shrink * (carry[3] + np.cumsum(grow * yc))
+        sxy[start:end] = shrink * (carry[4] + np.cumsum(grow * xc * yc))
+        x[start:end] = xc
+        carry = np.array([s0[end - 1], s1[end - 1], s2[end - 1], sy[end - 1], sxy[end - 1]])
+        prev_origin, prev_t = origin, t[end - 1]
+        start = end
+
+    den = s0 * s2 - s1 * s1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(den > 0, (s0 * sxy - s1 * sy) / den, np.nan)
+        fitted = sy / s0 + slope * (x - s1 / s0)
+        eta = np.maximum(0.0, (sp - fitted) / slope)
+    eta = np.where(slope >= min_slope_per_min / 60.0, eta, np.nan)
+    return np.where(y >= sp, 0.0, eta)
+
+
+def backfill_rows(rows: Sequence[Any], half_life: float = DEFAULT_HALF_LIFE) -> list[tuple[int, float | None]]:
+    """
+    (ts, eta) for sauna_history rows (ts, heater, setpoint, temp): each heater-on run with a
+    setpoint and temp is backfilled on its own; other rows get None.
+    """
+    out: list[tuple[int, float | None]] = []
+    run: list[Any] = []
+
+    def flush() -> None:
+        if run:
+            etas = backfill([r.ts for r in run], [r.temp for r in run], [r.setpoint for r in run], half_life)
+            out.extend((r.ts, None if e is None or e != e else float(e)) for r, e in zip(run, etas))
+            run.clear()
+
+    for r in rows:
+        if r.heater and r.setpoint is not None and r.temp is not None:
+            run.append(r)
+        else:
+            flush()
+            out.append((r.ts, None))
+    flush()
+    return out
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Asyncio Type-10 polling / Type-7 writes across a fleet of SaunaLogic controllers.
+
+A sweep starts every device at once (bounded by --concurrency), so N controllers cost about one
+round trip plus the slowest responder instead of N x timeout when one is offline. Each device keeps
+its own timeout and failure state; after repeated failures a device is backed off (skipped) for a
+while, like the Crestron facade does, so a dead controller doesn't eat a slot every sweep.
+
+Hosts come from the discovery directory (sauna_discovery.py) when it has a fresh entry for the
+devId, so a controller that moved to a new DHCP address is found again without editing the list;
+"host" is the fallback.
+
+Each device keeps its last poll as a sauna_dps.DpsSnapshot; a sweep records only what changed
+(Device.changes) and the printout skips devices whose state didn't change.
+
+With --adaptive there are no sweeps: a sauna_scheduler.PollScheduler polls each device when it is
+due, fast while it heats and rarely while it sits idle or fails, and prints each decision.
+
+Device list (JSON array; name/host/port/timeout optional):
+  [{"name": "main", "host": "192.168.1.100", "key": "<LOCAL_KEY>", "devId": "<DEV_ID>", "uid": "<UID>"}]
+
+Usage:
+  python3 saunalogic_extract/sauna_fleet.py --devices devices.json
+  python3 saunalogic_extract/sauna_fleet.py --devices devices.json --count 0 --interval 5
+  python3 saunalogic_extract/sauna_fleet.py --devices devices.json --write '{"1": false}' --only main
+  python3 saunalogic_extract/sauna_fleet.py --devices devices.json --adaptive --idle-interval 120
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from sauna_crypto import aes_128_ecb_encrypt
+from sauna_discovery import DeviceDirectory
+from sauna_dps import DpsSnapshot
+from sauna_frame import (
+    DP_QUERY_REQ,
+    TYPE7_PREFIX_15,
+    FrameDecoder,
+    build_dps_write_json,
+    build_frame,
+    decrypt_frame_json,
+    write_u32_be,
+)
+from sauna_scheduler import PollScheduler, SchedulerConfig
+
+FAILURE_THRESHOLD_FOR_BACKOFF = 2
+BACKOFF_S = 10.0
+
+
+class FleetError(Exception):
+    pass
+
+
+@dataclass
+class Device:
+    name: str
+    host: str
+    key: str
+    dev_id: str = ""
+    uid: str = ""
+    port: int = 6668
+    timeout: float = 2.0
+
+    # failure state
+    consecutive_failures: int = 0
+    backoff_until: float = 0.0
+    last_error: str = ""
+    last_ok: float = 0.0
+    last_snapshot: dict[str, Any] | None = field(default=None, repr=False)
+    state: DpsSnapshot | None = field(default=None, repr=False)
+    changes: dict[str, Any] = field(default_factory=dict, repr=False)
+
+    def note_success(self) -> None:
+        self.consecutive_failures = 0
+        self.backoff_until = 0.0
+        self.last_error = ""
+        self.last_ok = time.time()
+
+    def note_failure(self, err: str) -> None:
+        self.consecutive_failures += 1
+        self.last_error = err
+        if self.consecutive_failures >= FAILURE_THRESHOLD_FOR_BACKOFF:
+            self.backoff_until = time.monotonic() + BACKOFF_S
+
+    def in_backoff(self) -> bool:
+        return time.monotonic() < self.backoff_until
+
+
+def load_devices(path: str, directory: DeviceDirectory | None = None) -> list[Device]:
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    devices = []
+    for d in raw:
+        discovered = directory.lookup(d["devId"]) if directory is not None and d.get("devId") else None
+        host = discovered or d.get("host")
+        if not host:
+            raise FleetError(f"{d.get('name') or d.get('devId')}: no host and not in the discovery directory")
+        devices.append(
+            Device(
+                name=str(d.get("name") or d.get("devId") or host),
+                host=host,
+                key=d["key"],
+                dev_id=d.get("devId", ""),
+                uid=d.get("uid", ""),
+                port=int(d.get("port", 6668)),
+                timeout=float(d.get("timeout", 2.0)),
+            )
+        )
+    return devices
+
+
+# ==== per-connection protocol ====
+async def _read_until_cmd(
+    reader: asyncio.StreamReader, decoder: FrameDecoder, cmd: int, local_key: str | None
+) -> dict[str, Any] | bytes:
+    """
+    Reads frames until one with `cmd` arrives; decrypts it when local_key is given.
+    """
+    while True:
+        data = await reader.read(4096)
+        if not data:
+            raise FleetError("Connection closed by device.")
+        for frame in decoder.feed(data):
+            if int.from_bytes(frame[8:12], "big") != cmd:
+                continue
+            if local_key is None:
+                return bytes(frame)
+            j = decrypt_frame_json(bytes(frame), local_key)
+            if j is not None:
+                return j
+
+
+async def _handshake(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, dev: Device
+) -> tuple[FrameDecoder, dict[str, Any]]:
+    writer.write(DP_QUERY_REQ)
+    await writer.drain()
+    decoder = FrameDecoder()
+    snap = await _read_until_cmd(reader, decoder, 10, dev.key)
+    if not isinstance(snap, dict):
+        raise FleetError("Unexpected cmd=10 response.")
+    return decoder, snap
+
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+async def poll_snapshot_async(dev: Device) -> dict[str, Any]:
+    """
+    Type-10 DP snapshot poll (connect -> query -> cmd=10 -> decrypt) within dev.timeout.
+    """
+
+    async def run() -> dict[str, Any]:
+        reader, writer = await asyncio.open_connection(dev.host, dev.port)
+        try:
+            _decoder, snap = await _handshake(reader, writer, dev)
+            return snap
+        finally:
+            await _close(writer)
+
+    try:
+        return await asyncio.wait_for(run(), dev.timeout)
+    except asyncio.TimeoutError:
+        raise FleetError("No DP snapshot response received.") from None
+
+
+async def write_dps_async(dev: Device, dps: dict[str, Any]) -> bool:
+    """
+    Type-10 handshake, then one Type-7 write carrying `dps`. Returns True if the device ACKed.
+    """
+    if not dev.dev_id:
+        raise FleetError("DevId empty.")
+    body = build_dps_write_json(dev.dev_id, dev.uid or None, dps)
+    ct = aes_128_ecb_encrypt(body.encode("utf-8"), dev.key)
+    prefix = bytearray(TYPE7_PREFIX_15)
+    write_u32_be(prefix, 11, int(time.time() * 1000) & 0xFFFFFFFF)
+    frame = build_frame(7, ct, bytes(prefix))
+
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(dev.host, dev.port), dev.timeout)
+    except asyncio.TimeoutError:
+        raise FleetError("Handshake timeout: no cmd=10 response.") from None
+    try:
+        try:
+            decoder, snap = await asyncio.wait_for(_handshake(reader, writer, dev), dev.timeout)
+        except asyncio.TimeoutError:
+            raise FleetError("Handshake timeout: no cmd=10 response.") from None
+        dev.last_snapshot = snap
+        writer.write(frame)
+        await writer.drain()
+        try:
+            await asyncio.wait_for(_read_until_cmd(reader, decoder, 7, None), dev.timeout)
+            return True
+        except (asyncio.TimeoutError, FleetError):
+            return False  # some firmwares don't ACK
+    finally:
+        await _close(writer)
+
+
+# ==== fleet scheduler ====
+class FleetPoller:
+    def __init__(self, devices: list[Device], concurrency: int = 32, directory: DeviceDirectory | None = None) -> None:
+        self.devices = devices
+        self.directory = directory
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self.scheduler: PollScheduler | None = None  # set while run_adaptive() runs
+
+    def refresh_hosts(self) -> None:
+        """
+        Re-reads the discovery directory; a device announced at a new IP gets it and leaves backoff.
+        """
+        if self.directory is None:
+            return
+        self.directory.load()
+        for dev in self.devices:
+            ip = self.directory.lookup(dev.dev_id) if dev.dev_id else None
+            if ip and ip != dev.host:
+                dev.host = ip
+                dev.consecutive_failures = 0
+                dev.backoff_until = 0.0
+
+    async def _guarded(self, dev: Device, coro_fn: Any, backoff: bool = True) -> tuple[Device, Any, str | None]:
+        if backoff and dev.in_backoff():
+            return dev, None, "backoff: " + dev.last_error
+        async with self._sem:
+            try:
+                result = await coro_fn(dev)
+            except (OSError, FleetError) as ex:
+                dev.note_failure(str(ex) or type(ex).__name__)
+                return dev, None, dev.last_error
+            except Exception as ex:  # e.g. a malformed localKey: fail this device, not the sweep
+                dev.note_failure(f"{type(ex).__name__}: {ex}")
+                return dev, None, dev.last_error
+        dev.note_success()
+        return dev, result, None
+
+    async def sweep(self) -> list[tuple[Device, dict[str, Any] | None, str | None]]:
+        """
+        Polls every device concurrently; returns (device, snapshot_or_none, error) in device order.
+        """
+
+        self.refresh_hosts()
+        return list(await asyncio.gather(*(self._guarded(d, self._poll) for d in self.devices)))
+
+    async def _poll(self, dev: Device) -> dict[str, Any]:
+        dev.last_snapshot = await poll_snapshot_async(dev)
+        new = DpsSnapshot.from_dps(dev.last_snapshot.get("dps") or {})
+        dev.changes = new.diff(dev.state)
+        dev.state = new
+        return dev.last_snapshot
+
+    async def run_adaptive(self, scheduler: PollScheduler, duration: float = 0.0) -> None:
+        """
+        Polls each device when `scheduler` says it is due, for `duration` seconds (0 = forever).
+        Every poll is its own task and is fed back as soon as it finishes, so a device hanging to
+        its timeout doesn't hold back the others. The scheduler does the backing off, so the
+        per-device backoff window is not applied.
+        """
+        by_name = {d.name: d for d in self.devices}
+        for name in by_name:
+            scheduler.add(name)
+        self.scheduler = scheduler
+        inflight: dict[str, asyncio.Task[tuple[Device, Any, str | None]]] = {}
+        stop_at = time.monotonic() + duration if duration > 0 else None
+        try:
+            while stop_at is None or time.monotonic() < stop_at:
+                wait = scheduler.wait_time(exclude=inflight)
+                if stop_at is not None:
+                    wait = min(wait, max(0.0, stop_at - time.monotonic()))
+                if inflight:
+                    done, _ = await asyncio.wait(inflight.values(), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(wait)
+                    done = set()
+                for task in done:
+                    dev, _snap, err = task.result()
+                    del inflight[dev.name]
+                    if err is None and dev.state is not None:
+                        scheduler.note_poll(dev.name, dev.state)
+                    else:
+                        scheduler.note_failure(dev.name, err or "")
+                due = scheduler.due(exclude=inflight)
+                if not due:
+                    continue
+                self.refresh_hosts()
+                for name in due:
+                    inflight[name] = asyncio.ensure_future(self._guarded(by_name[name], self._poll, backoff=False))
+        finally:
+            self.scheduler = None
+            for task in inflight.values():
+                task.cancel()
+            await asyncio.gather(*inflight.values(), return_exceptions=True)
+
+    async def write(self, dps: dict[str, Any], names: set[str] | None = None) -> list[tuple[Device, Any, str | None]]:
+        targets = [d for d in self.devices if not names or d.name in names or d.dev_id in names]
+
+        async def write(dev: Device) -> bool:
+            if self.scheduler is not None and dev.name in self.scheduler.devices:
+                self.scheduler.note_request(dev.name)  # counts against the adaptive poller's rate cap
+            return await write_dps_async(dev, dps)
+
+        self.refresh_hosts()
+        return list(await asyncio.gather(*(self._guarded(d, write) for d in targets)))
+
+
+def _print_sweep(results: list[tuple[Device, Any, str | None]], dt: float) -> None:
+    ok = sum(1 for _, r, e in results if e is None)
+    unchanged = sum(1 for d, r, e in results if e is None and isinstance(r, dict) and not d.changes)
+    print(f"--- sweep: {ok}/{len(results)} ok ({unchanged} unchanged) in {dt * 1000.0:.0f}ms")
+    for dev, snap, err in results:
+        if err is not None:
+            print(f"{dev.name:<16} FAIL  {err} (failures={dev.consecutive_failures})")
+        elif isinstance(snap, dict):
+            if dev.changes and dev.state is not None:
+                st = dev.state
+                print(f"{dev.name:<16} ok    heater={st.heater} setpoint={st.setpoint} temp={st.temp}  changed={dev.changes}")
+        else:
+            print(f"{dev.name:<16} ok    ack={snap}")
+
+
+async def _amain(args: argparse.Namespace) -> int:
+    directory = None if args.no_discovery else DeviceDirectory(args.directory)
+    fleet = FleetPoller(load_devices(args.devices, directory), concurrency=args.concurrency, directory=directory)
+    if args.adaptive:
+        cfg = SchedulerConfig(heat_interval=args.heat_interval, idle_interval=args.idle_interval, max_rate=args.max_rate)
+        scheduler = PollScheduler(cfg, on_decision=lambda d: print(f"{time.strftime('%H:%M:%S')} {d}", flush=True))
+        try:
+            await fleet.run_adaptive(scheduler, args.duration)
+        finally:
+            for name, st in scheduler.stats().items():
+                print(f"--- {name:<16} polls={st['polls']} failed={st['failed']} last={st['reason']} every {st['interval']}s")
+        return 0
+    if args.write:
+        t0 = time.perf_counter()
+        names = set(args.only) if args.only else None
+        results = await fleet.write(json.loads(args.write), names)
+        _print_sweep(results, time.perf_counter() - t0)
+        return 0 if all(e is None for _, _, e in results) else 2
+
+    n = 0
+    rc = 0
+    while args.count <= 0 or n < args.count:
+        if n:
+            await asyncio.sleep(args.interval)
+        n += 1
+        t0 = time.perf_counter()
+        results = await fleet.sweep()
+        _print_sweep(results, time.perf_counter() - t0)
+        rc = 0 if all(e is None for _, _, e in results) else 2
+    return rc
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", required=True, help="JSON device list (host, key, devId, uid per device)")
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--count", type=int, default=1, help="number of sweeps (0 = until interrupted)")
+    ap.add_argument("--interval", type=float, default=5.0)
+    ap.add_argument("--write", help='JSON dps to write, e.g. \'{"1": true, "2": 190}\'')
+    ap.add_argument("--only", nargs="+", help="limit --write to these device names/devIds")
+    ap.add_argument("--adaptive", action="store_true", help="poll each device on its own adaptive schedule")
+    ap.add_argument("--duration", type=float, default=0.0, help="with --adaptive: stop after this many seconds")
+    ap.add_argument("--heat-interval", type=float, default=SchedulerConfig.heat_interval)
+    ap.add_argument("--idle-interval", type=float, default=SchedulerConfig.idle_interval)
+    ap.add_argument("--max-rate", type=float, default=SchedulerConfig.max_rate, help="requests/s cap per controller")
+    ap.add_argument("--directory", help="discovery directory file (default: sauna_discovery's)")
+    ap.add_argument("--no-discovery", action="store_true", help="use the hosts in the device list as-is")
+    args = ap.parse_args()
+    if args.max_rate <= 0:
+        ap.error("--max-rate must be > 0")
+    try:
+        return asyncio.run(_amain(args))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark 55aa frame parsing: the old parse_one_frame/`buf += data` loop vs sauna_frame.FrameDecoder.
+
+The corpus is the captured frames from docs/saunalogic-pcap-notes.md (Type-7/8/10), repeated into
+megabytes of back-to-back frames. Two feeds are timed:
+- chunked: 4096-byte recv()-sized pieces (steady state)
+- burst: one large chunk, i.e. many frames arriving at once (old loop is quadratic here)
+
+Usage:
+  python3 saunalogic_extract/sauna_frame_bench.py --mb 4 --burst-kb 512
+"""
+
+from __future__ import annotations
+
+import argparse
+import binascii
+import time
+
+from sauna_frame import DP_QUERY_REQ_HEX, FrameDecoder
+
+CAPTURED_FRAMES_HEX = (
+    DP_QUERY_REQ_HEX,
+    # Type-10 response (PCAPdroid_15_Jan_21_33_01.pcap)
+    "000055aa000005950000000a000000ac00000000462ebb16e2667b75b5c3eefed6886d5610fffe31bb2a4954da937633eb4da222"
+    "e5aa8b005e19995c84ffdc3cf3bc514e80f731cb8dd1c57e1c8a7af1bed2881e5537f240f076275e470018a360183f1a63d2dfdc"
+    "c42ad416028278be28fac7e3a34436b674e9c4b907e0c534cd6f6fa34d29a905656cbca4c5cc1118f17ad6d1273492c384901a5d"
+    "b9d37aea8281463f0cb8b1dfd5285f9187587575548e4a0155fb10fa0000aa55",
+    # Type-7 heater ON (PCAPdroid_15_Jan_17_46_44.pcap)
+    "000055aa000007630000000700000077332e330000000000000003000482ee462ebb16e2667b75b5c3eefed6886d5610fffe31bb"
+    "2a4954da937633eb4da2220629f319eac976cc9cac614a6978ba68beeb36753184d7b1b48fe3740aef8d26cc25757f4bbd227eb2"
+    "a6d680d4c6f931f816f274c808c87153245479a47ec8ab6c0a592b0000aa55",
+    # Type-8 telemetry (PCAPdroid_15_Jan_22_43_37.pcap)
+    "000055aa00000000000000080000005b00000000332e33000000000000ddac00000001462ebb16e2667b75b5c3eefed6886d5610"
+    "fffe31bb2a4954da937633eb4da222089baf36ecb86c059f0165d3e244f7ad9f7ae1542b07bff423a6fb5ee587c653b5a25f3f00"
+    "00aa55",
+    "000055aa00000000000000080000005b00000000332e33000000000000ddad00000001462ebb16e2667b75b5c3eefed6886d5610"
+    "fffe31bb2a4954da937633eb4da222514ae85447c35c7dcf112065120887350e18d75ec94e08ee4d0e3efb01dd19f560e4f85b00"
+    "00aa55",
+)
+
+
+def legacy_parse_one_frame(buf: bytes) -> tuple[bytes | None, bytes]:
+    # The pre-FrameDecoder parser, kept here only as the baseline.
+    i = buf.find(b"\x00\x00\x55\xaa")
+    if i < 0:
+        return None, b""
+    if i > 0:
+        buf = buf[i:]
+    if len(buf) < 16:
+        return None, buf
+    ll = int.from_bytes(buf[12:16], "big")
+    total_len = 16 + ll
+    if len(buf) < total_len:
+        return None, buf
+    return buf[:total_len], buf[total_len:]
+
+
+def run_legacy(chunks: list[bytes]) -> int:
+    n = 0
+    buf = b""
+    for data in chunks:
+        buf += data
+        while True:
+            frame, buf = legacy_parse_one_frame(buf)
+            if frame is None:
+                break
+            n += 1
+    return n
+
+
+def run_decoder(chunks: list[bytes]) -> int:
+    n = 0
+    dec = FrameDecoder()
+    for data in chunks:
+        for _frame in dec.feed(data):
+            n += 1
+    return n
+
+
+def make_stream(size: int) -> tuple[bytes, int]:
+    frames = [binascii.unhexlify(h) for h in CAPTURED_FRAMES_HEX]
+    out = bytearray()
+    n = 0
+    while len(out) < size:
+        out += frames[n % len(frames)]
+        n += 1
+    return bytes(out), n
+
+
+def bench(label: str, fn, chunks: list[bytes], expect: int, nbytes: int) -> None:
+    t0 = time.perf_counter()
+    n = fn(chunks)
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {n:>8} frames  {dt * 1000.0:9.1f} ms  {nbytes / dt / 1e6:8.1f} MB/s  {n / dt:10.0f} frames/s")
+    if n != expect:
+        # The old loop discards the buffer when no full prefix is present, losing frames whose
+        # 000055aa straddles a chunk boundary.
+        print(f"{'':<28} ({expect - n} of {expect} frames lost)")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=4.0, help="stream size for the chunked run")
+    ap.add_argument("--burst-kb", type=int, default=512, help="stream size for the single-chunk run")
+    args = ap.parse_args()
+
+    stream, n = make_stream(int(args.mb * 1024 * 1024))
+    chunks = [stream[i : i + 4096] for i in range(0, len(stream), 4096)]
+    print(f"chunked: {len(stream)} bytes in {len(chunks)} x 4096-byte chunks")
+    bench("legacy parse_one_frame", run_legacy, chunks, n, len(stream))
+    bench("FrameDecoder.feed", run_decoder, chunks, n, len(stream))
+
+    burst, n = make_stream(args.burst_kb * 1024)
+    print(f"burst: {len(burst)} bytes in one chunk")
+    bench("legacy parse_one_frame", run_legacy, [burst], n, len(burst))
+    bench("FrameDecoder.feed", run_decoder, [burst], n, len(burst))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Local HTTP gateway for SaunaLogic controllers: cached state, a dps change stream and writes.
+
+One SaunaSession per controller is kept connected (watch(): Type-8 pushes and reconnect
+handshakes update its state), and every --refresh seconds a Type-10 snapshot goes through a
+sauna_snapshot_cache.SnapshotCache so readers never cause device traffic. Other services talk
+plain HTTP/JSON on localhost instead of 55aa framing and AES:
+
+  GET  /state               {"<name>": {"dps": {..}, "age": <s>, "connected": .., "devId": .., "eta": <s>}, ..}
+                            eta: seconds until dps 3 reaches dps 2 (sauna_eta), null when not heating
+  GET  /state/<name>        one controller
+  GET  /events[?device=n]   text/event-stream; "event: dps" with {"device", "delta", "state"}
+  POST /dps/<name>          body {"1": true, "2": 190} -> one Type-7 write via the session
+                            (coalesced with --write-window), then a fresh snapshot:
+                            {"ok": <acked>, "state": {..}}
+  POST /dps                 same, when only one controller is configured
+  GET  /history/<name>      ?hours=24&bucket=900&column=temp: rows, or per-bucket min/max/mean,
+                            from the --store file (sauna_history)
+  GET  /metrics             sauna_metrics in Prometheus text format (with --metrics)
+
+The device list has the sauna_fleet.py format; hosts are resolved through the discovery directory.
+
+Usage:
+  python3 saunalogic_extract/sauna_gateway.py --devices devices.json --port 8787
+  curl -s localhost:8787/state
+  curl -sN localhost:8787/events
+  curl -s -XPOST localhost:8787/dps/main -d '{"1": true}'
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+from sauna_discovery import DeviceDirectory
+from sauna_dps import DpsSnapshot
+from sauna_eta import EtaEstimator
+from sauna_fleet import Device, load_devices
+from sauna_history import COLUMNS, StoreError, TelemetryStore
+from sauna_metrics import CONTENT_TYPE, METRICS, set_metrics
+from sauna_session import SaunaSession, SessionError
+from sauna_snapshot_cache import SnapshotCache
+
+SSE_KEEPALIVE_S = 15.0
+LISTENER_QUEUE_MAX = 256  # events buffered per /events client before it is dropped
+
+
+def _end_stream(q: queue.Queue[dict[str, Any] | None]) -> None:
+    """
+    Replaces whatever a listener queue holds with the end-of-stream None, under the queue's own
+    lock (the SSE handler may be in get()), so it can't race the reader or raise queue.Full.
+    """
+    with q.mutex:
+        q.queue.clear()
+        q.queue.append(None)
+        q.not_empty.notify()
+
+
+class Controller:
+    """
+    One configured device: its session and the snapshot cache in front of it.
+    """
+
+    def __init__(self, dev: Device, refresh: float, write_window: float, store: TelemetryStore | None = None) -> None:
+        self.name = dev.name
+        self.store = store
+        self.store_key = dev.dev_id or dev.name
+        self.session = SaunaSession(
+            dev.host, dev.key, dev_id=dev.dev_id, uid=dev.uid, port=dev.port, timeout=dev.timeout, write_window=write_window
+        )
+        self.cache: SnapshotCache[dict[str, Any]] = SnapshotCache(self.session.query_snapshot, max_age=refresh)
+        self.store_error = ""
+        self.eta = EtaEstimator()
+        self._eta_lock = threading.Lock()  # record() runs on the reader and refresh threads
+        self.last_error = ""
+
+    def refresh(self) -> None:
+        try:
+            self.cache.get()
+            self.last_error = ""
+        except (OSError, SessionError) as ex:
+            self.last_error = str(ex) or type(ex).__name__
+            return
+        self.record(self.session.state)
+
+    def record(self, state: dict[str, Any]) -> None:
+        snap = DpsSnapshot.from_dps(state)
+        with self._eta_lock:
+            self.eta.update_snapshot(snap, time.time())
+        if self.store is not None:
+            # Also runs on the session reader and the refresher: a full store must not kill either.
+            try:
+                self.store.record_snapshot(self.store_key, snap)
+            except StoreError as ex:
+                if str(ex) != self.store_error:
+                    print(f"{self.name}: history not recorded: {ex}", file=sys.stderr, flush=True)
+                self.store_error = str(ex)
+
+    def eta_seconds(self) -> float | None:
+        with self._eta_lock:
+            eta, last_t = self.eta.eta(), self.eta.last_t
+        if eta is None or last_t is None:
+            return None
+        return round(max(0.0, eta - (time.time() - last_t)), 1)
+
+    def describe(self) -> dict[str, Any]:
+        s = self.session
+        state_at = s.state_at
+        return {
+            "devId": s.dev_id,
+            "host": s.host,
+            "connected": s.connected,
+            "dps": s.state,
+            "age": round(time.time() - state_at, 3) if state_at else None,
+            "error": self.last_error,
+            "eta": self.eta_seconds(),
+        }
+
+
+class Gateway:
+    def __init__(
+        self, devices: list[Device], refresh: float = 30.0, write_window: float = 0.05, store: TelemetryStore | None = None
+    ) -> None:
+        self.controllers = {d.name: Controller(d, refresh, write_window, store) for d in devices}
+        self.store = store
+        self.refresh = refresh
+        self._listeners: list[tuple[queue.Queue[dict[str, Any] | None], str | None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._refresher: threading.Thread | None = None
+
+    def start(self) -> None:
+        for c in self.controllers.values():
+            c.session.subscribe(lambda delta, state, name=c.name: self._publish(name, delta, state))
+            c.session.watch()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="sauna-gateway-refresh", daemon=True)
+        self._refresher.start()
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            for q, _ in self._listeners:
+                _end_stream(q)
+        for c in self.controllers.values():
+            c.session.close()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.is_set():
+            for c in list(self.controllers.values()):
+                c.refresh()
+            self._stop.wait(self.refresh)
+
+    # ---- state / writes ----
+    def states(self) -> dict[str, dict[str, Any]]:
+        return {n: c.describe() for n, c in self.controllers.items()}
+
+    def state(self, name: str) -> dict[str, Any] | None:
+        c = self.controllers.get(name)
+        return c.describe() if c is not None else None
+
+    def write(self, name: str, dps: dict[str, Any]) -> dict[str, Any]:
+        """
+        Writes through the session (raises SessionError/OSError), then re-polls so the reply
+        carries the state the device reports after the write.
+        """
+        c = self.controllers[name]
+        ok = c.session.write_dps(dps)
+        c.cache.invalidate()
+        c.refresh()
+        return {"ok": ok, "state": c.session.state}
+
+    # ---- event fan-out ----
+    def listen(self, device: str | None = None) -> queue.Queue[dict[str, Any] | None]:
+        q: queue.Queue[dict[str, Any] | None] = queue.Queue(LISTENER_QUEUE_MAX)
+        with self._lock:
+            self._listeners.append((q, device))
+        return q
+
+    def unlisten(self, q: queue.Queue[dict[str, Any] | None]) -> None:
+        with self._lock:
+            self._listeners = [(lq, d) for lq, d in self._listeners if lq is not q]
+
+    def history(self, name: str, hours: float, bucket: float, column: str) -> list[Any] | None:
+        c = self.controllers.get(name)
+        if c is None or self.store is None:
+            return None
+        t1 = time.time()
+        t0 = t1 - hours * 3600.0
+        if bucket > 0:
+            return [b._asdict() for b in self.store.downsample(c.store_key, t0, t1, bucket, column)]
+        return [r._asdict() for r in self.store.range(c.store_key, t0, t1)]
+
+    def _publish(self, name: str, delta: dict[str, Any], state: dict[str, Any]) -> None:
+        # Runs on a session reader thread: never block it on a slow client.
+        self.controllers[name].record(state)
+        event = {"device": name, "delta": delta, "state": state, "t": time.time()}
+        with self._lock:
+            listeners = list(self._listeners)
+        for q, device in listeners:
+            if device is not None and device != name:
+                continue
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                self.unlisten(q)
+                _end_stream(q)
+
+
+class GatewayHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr: tuple[str, int], gateway: Gateway, verbose: bool = False) -> None:
+        super().__init__(addr, _Handler)
+        self.gateway = gateway
+        self.verbose = verbose
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body are separate writes on keep-alive connections
+    server: GatewayHTTPServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _json(self, status: int, obj: Any) -> None:
+        body = json.dumps(obj, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        gw = self.server.gateway
+        if parts == ["state"]:
+            self._json(200, gw.states())
+        elif len(parts) == 2 and parts[0] == "state":
+            st = gw.state(parts[1])
+            if st is None:
+                self._json(404, {"error": f"unknown device {parts[1]}"})
+            else:
+                self._json(200, st)
+        elif len(parts) == 2 and parts[0] == "history":
+            q = parse_qs(url.query)
+            column = q.get("column", ["temp"])[0]
+            try:
+                hours = float(q.get("hours", ["24"])[0])
+                bucket = float(q.get("bucket", ["0"])[0])
+            except ValueError:
+                hours = bucket = -1.0
+            if hours <= 0 or bucket < 0 or column not in COLUMNS:
+                self._json(400, {"error": f"hours > 0, bucket >= 0, column in {list(COLUMNS)}"})
+                return
+            rows = gw.history(parts[1], hours, bucket, column)
+            if rows is None:
+                self._json(404, {"error": f"unknown device {parts[1]} or no --store"})
+            else:
+                self._json(200, rows)
+        elif parts == ["metrics"] and METRICS.enabled:
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif parts == ["events"]:
+            device = parse_qs(url.query).get("device", [None])[0]
+            if device is not None and device not in gw.controllers:
+                self._json(404, {"error": f"unknown device {device}"})
+                return
+            self._events(device)
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        parts = [p for p in urlsplit(self.path).path.split("/") if p]
+        gw = self.server.gateway
+        if parts == ["dps"] and len(gw.controllers) == 1:
+            name = next(iter(gw.controllers))
+        elif len(parts) == 2 and parts[0] == "dps":
+            name = parts[1]
+        else:
+            self._json(404, {"error": "POST /dps/<device>"})
+            return
+        if name not in gw.controllers:
+            self._json(404, {"error": f"unknown device {name}"})
+            return
+        try:
+            dps = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"null")
+        except ValueError:
+            dps = None
+        if not isinstance(dps, dict) or not dps:
+            self._json(400, {"error": 'body must be a JSON object of dps, e.g. {"1": true}'})
+            return
+        try:
+            self._json(200, gw.write(name, {str(k): v for k, v in dps.items()}))
+        except (OSError, SessionError) as ex:
+            self._json(502, {"error": str(ex) or type(ex).__name__})
+
+    def _events(self, device: str | None) -> None:
+        gw = self.server.gateway
+        q = gw.listen(device)
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            # Current state first, so a client doesn't need a separate GET /state.
+            for name, st in gw.states().items():
+                if device is None or name == device:
+                    self._send_event({"device": name, "delta": st["dps"], "state": st["dps"], "t": time.time()})
+            while True:
+                try:
+                    event = q.get(timeout=SSE_KEEPALIVE_S)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    return
+                self._send_event(event)
+        except OSError:
+            pass  # client went away
+        finally:
+            gw.unlisten(q)
+
+    def _send_event(self, event: dict[str, Any]) -> None:
+        self.wfile.write(b"event: dps\ndata: " + json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", required=True, help="JSON device list (sauna_fleet.py format)")
+    ap.add_argument("--bind", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--refresh", type=float, default=30.0, help="seconds between Type-10 snapshot refreshes")
+    ap.add_argument("--write-window", type=float, default=0.05, help="coalesce writes arriving within this many seconds")
+    ap.add_argument("--directory", help="discovery directory file (default: sauna_discovery's)")
+    ap.add_argument("--no-discovery", action="store_true", help="use the hosts in the device list as-is")
+    ap.add_argument("--store", help="record dps history in this sauna_history store file (GET /history)")
+    ap.add_argument("--metrics", action="store_true", help="record sauna_metrics and serve them at GET /metrics")
+    ap.add_argument("--verbose", action="store_true", help="log every request")
+    args = ap.parse_args()
+    if args.metrics:
+        set_metrics(True)
+
+    directory = None if args.no_discovery else DeviceDirectory(args.directory)
+    devices = load_devices(args.devices, directory)
+    store = TelemetryStore(args.store, max_devices=max(16, len(devices))) if args.store else None
+    gateway = Gateway(devices, refresh=args.refresh, write_window=args.write_window, store=store)
+    server = GatewayHTTPServer((args.bind, args.port), gateway, verbose=args.verbose)
+    gateway.start()
+    host, port = server.server_address[:2]
+    print(f"gateway on http://{host}:{port} for {', '.join(gateway.controllers)}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        gateway.close()
+        if store is not None:
+            store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
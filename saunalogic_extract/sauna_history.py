@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Per-controller temperature/setpoint/heater history in a fixed-size memory-mapped file.
+
+No database: one file holds a bounded ring per device, and survives restarts. Each ring has four
+fixed-width columns, read and written through memoryview.cast() views of the mmap, so nothing is
+copied or parsed:
+
+  ts        u32  unix seconds
+  heater    i8   dps 1 (1/0, -1 = not reported)
+  setpoint  i16  dps 2 (-32768 = not reported)
+  temp      i16  dps 3 (-32768 = not reported)
+
+At 1 Hz almost every poll repeats the previous state, so record() only appends a row when a value
+changes or `keepalive` seconds (default 60) have passed since the last row; a row's values hold
+until the next row. A week of one sauna is then ~10k-20k rows, and the default 32768 rows x 9
+bytes is ~300 KB per device (a dozen saunas: under 4 MB). A gap longer than 2 x keepalive reads
+as "no data" in downsample().
+
+range() finds its rows by binary search over the ts column; downsample() gives per-bucket min,
+max and time-weighted mean of one column.
+
+File layout (little endian): 64-byte header (magic "SLTS", version, max_devices, capacity,
+keepalive), max_devices 48-byte slots (devId, head, count), then per slot the four columns of
+`capacity` entries.
+
+Usage:
+  with TelemetryStore("telemetry.slts") as store:
+      store.record_snapshot(dev_id, DpsSnapshot.from_dps(snap["dps"]))
+      rows = store.range(dev_id, time.time() - 3600, time.time())
+      buckets = store.downsample(dev_id, time.time() - 86400, time.time(), bucket=900)
+  python3 saunalogic_extract/sauna_history.py --list
+  python3 saunalogic_extract/sauna_history.py --device <DEV_ID> --hours 24 --bucket 900
+  python3 saunalogic_extract/sauna_history.py --device <DEV_ID> --hours 2 --eta
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, NamedTuple
+
+from sauna_dps import DpsSnapshot
+
+MAGIC = b"SLTS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIf")  # magic, version, max_devices, capacity, keepalive
+HEADER_SIZE = 64
+SLOT = struct.Struct("<32sII")  # devId (utf-8, NUL padded), head (next write index), count
+SLOT_SIZE = 48
+ROW_SIZE = 4 + 1 + 2 + 2
+MISSING = -32768
+COLUMNS = ("heater", "setpoint", "temp")
+DEFAULT_STORE = os.environ.get(
+    "SAUNA_TELEMETRY_STORE", os.path.join(os.path.expanduser("~"), ".cache", "saunalogic", "telemetry.slts")
+)
+
+
+class StoreError(Exception):
+    pass
+
+
+class Row(NamedTuple):
+    ts: int
+    heater: bool | None
+    setpoint: int | None
+    temp: int | None
+
+
+class Bucket(NamedTuple):
+    start: int
+    min: float | None
+    max: float | None
+    mean: float | None
+
+
+class _Ring:
+    """
+    Column views of one device's ring; logical index 0 is the oldest row.
+    """
+
+    __slots__ = ("slot", "dev_id", "capacity", "head", "count", "ts", "heater", "setpoint", "temp")
+
+    def __init__(self, mv: memoryview, slot: int, max_devices: int, capacity: int) -> None:
+        self.slot = slot
+        self.capacity = capacity
+        dev, self.head, self.count = SLOT.unpack_from(mv, HEADER_SIZE + slot * SLOT_SIZE)
+        self.dev_id = dev.rstrip(b"\0").decode("utf-8")
+        base = HEADER_SIZE + max_devices * SLOT_SIZE + slot * capacity * ROW_SIZE
+        self.ts = mv[base : base + 4 * capacity].cast("I")
+        base += 4 * capacity
+        self.heater = mv[base : base + capacity].cast("b")
+        base += capacity
+        self.setpoint = mv[base : base + 2 * capacity].cast("h")
+        base += 2 * capacity
+        self.temp = mv[base : base + 2 * capacity].cast("h")
+
+    def index(self, i: int) -> int:
+        return (self.head - self.count + i) % self.capacity
+
+    def ts_at(self, i: int) -> int:
+        return self.ts[(self.head - self.count + i) % self.capacity]
+
+    def row(self, i: int) -> Row:
+        p = self.index(i)
+        h, sp, t = self.heater[p], self.setpoint[p], self.temp[p]
+        return Row(self.ts[p], None if h < 0 else bool(h), None if sp == MISSING else sp, None if t == MISSING else t)
+
+    def bisect(self, t: float, right: bool = False) -> int:
+        """
+        First logical index whose ts is >= t (> t with right=True).
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            v = self.ts_at(mid)
+            if v < t or (right and v == t):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def release(self) -> None:
+        for col in (self.ts, self.heater, self.setpoint, self.temp):
+            col.release()
+
+
+class TelemetryStore:
+    def __init__(
+        self, path: str = DEFAULT_STORE, max_devices: int = 16, capacity: int = 32768, keepalive: float = 60.0
+    ) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "w+b" if fresh else "r+b")
+        if fresh:
+            size = HEADER_SIZE + max_devices * (SLOT_SIZE + capacity * ROW_SIZE)
+            self._f.truncate(size)
+            self._f.write(HEADER.pack(MAGIC, VERSION, max_devices, capacity, keepalive))
+            self._f.flush()
+        else:
+            magic, version, max_devices, capacity, keepalive = HEADER.unpack(self._f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                self._f.close()
+                raise StoreError(f"{path}: not a telemetry store (or an unknown version)")
+        # The file's own parameters win over the arguments when reopening.
+        self.max_devices = max_devices
+        self.capacity = capacity
+        self.keepalive = keepalive
+        self._rings: dict[str, _Ring] = {}
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        self._mv = memoryview(self._mm)
+        if len(self._mv) < HEADER_SIZE + max_devices * (SLOT_SIZE + capacity * ROW_SIZE):
+            self.close()
+            raise StoreError(f"{path}: truncated")
+        for slot in range(max_devices):
+            ring = _Ring(self._mv, slot, max_devices, capacity)
+            if ring.dev_id:
+                self._rings[ring.dev_id] = ring
+            else:
+                ring.release()
+
+    # ---- lifecycle ----
+    def __enter__(self) -> TelemetryStore:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def flush(self) -> None:
+        self._mm.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._mm.closed:
+                return
+            for ring in self._rings.values():
+                ring.release()
+            self._rings.clear()
+            self._mv.release()
+            self._mm.flush()
+            self._mm.close()
+            self._f.close()
+
+    # ---- writes ----
+    def _ring(self, dev_id: str) -> _Ring:
+        ring = self._rings.get(dev_id)
+        if ring is not None:
+            return ring
+        raw = dev_id.encode("utf-8")
+        if not raw or len(raw) > 32:
+            raise StoreError(f"devId must be 1..32 bytes: {dev_id!r}")
+        used = {r.slot for r in self._rings.values()}
+        free = next((i for i in range(self.max_devices) if i not in used), None)
+        if free is None:
+            raise StoreError(f"{self.path}: all {self.max_devices} device slots are in use")
+        SLOT.pack_into(self._mv, HEADER_SIZE + free * SLOT_SIZE, raw, 0, 0)
+        ring = self._rings[dev_id] = _Ring(self._mv, free, self.max_devices, self.capacity)
+        return ring
+
+    def record(
+        self,
+        dev_id: str,
+        heater: bool | None,
+        setpoint: int | None,
+        temp: int | None,
+        ts: float | None = None,
+    ) -> bool:
+        """
+        Appends a row unless it repeats the last one within keepalive; returns True if appended.
+        Timestamps going backwards (clock steps) are clamped to the last row's.
+        """
+        t = int(time.time() if ts is None else ts)
+        h = -1 if heater is None else int(bool(heater))
+        sp = MISSING if setpoint is None else max(-32767, min(32767, int(setpoint)))
+        tp = MISSING if temp is None else max(-32767, min(32767, int(temp)))
+        with self._lock:
+            ring = self._ring(dev_id)
+            if ring.count:
+                p = (ring.head - 1) % ring.capacity
+                last_t = ring.ts[p]
+                t = max(t, last_t)
+                if (ring.heater[p], ring.setpoint[p], ring.temp[p]) == (h, sp, tp) and t - last_t < self.keepalive:
+                    return False
+            p = ring.head
+            ring.ts[p] = t
+            ring.heater[p] = h
+            ring.setpoint[p] = sp
+            ring.temp[p] = tp
+            ring.head = (p + 1) % ring.capacity
+            ring.count = min(ring.count + 1, ring.capacity)
+            struct.pack_into("<II", self._mv, HEADER_SIZE + ring.slot * SLOT_SIZE + 32, ring.head, ring.count)
+        return True
+
+    def record_snapshot(self, dev_id: str, snap: DpsSnapshot, ts: float | None = None) -> bool:
+        return self.record(dev_id, snap.heater, snap.setpoint, snap.temp, ts)
+
+    # ---- queries ----
+    def devices(self) -> dict[str, int]:
+        """
+        devId -> number of rows kept.
+        """
+        with self._lock:
+            return {d: r.count for d, r in self._rings.items()}
+
+    def latest(self, dev_id: str) -> Row | None:
+        with self._lock:
+            ring = self._rings.get(dev_id)
+            if ring is None or not ring.count:
+                return None
+            return ring.row(ring.count - 1)
+
+    def range(self, dev_id: str, t0: float, t1: float) -> list[Row]:
+        """
+        Rows with t0 <= ts <= t1, oldest first.
+        """
+        with self._lock:
+            ring = self._rings.get(dev_id)
+            if ring is None:
+                return []
+            lo, hi = ring.bisect(t0), ring.bisect(t1, right=True)
+            return [ring.row(i) for i in range(lo, hi)]
+
+    def downsample(self, dev_id: str, t0: float, t1: float, bucket: float, column: str = "temp") -> list[Bucket]:
+        """
+        Per bucket of `bucket` seconds in [t0, t1): min, max and time-weighted mean of `column`
+        (heater reads as 0/1, so its mean is the duty cycle). Each row's value holds until the
+        next row, or for at most 2 x keepalive; buckets without data get None.
+        """
+        if column not in COLUMNS:
+            raise ValueError(f"column must be one of {COLUMNS}")
+        if bucket <= 0 or t1 <= t0:
+            return []
+        n = math.ceil((t1 - t0) / bucket)
+        lo_v: list[float | None] = [None] * n
+        hi_v: list[float | None] = [None] * n
+        wsum = [0.0] * n
+        wt = [0.0] * n
+        hold = 2 * self.keepalive
+        with self._lock:
+            ring = self._rings.get(dev_id)
+            if ring is None:
+                return [Bucket(int(t0 + i * bucket), None, None, None) for i in range(n)]
+            col = getattr(ring, column)
+            missing = -1 if column == "heater" else MISSING
+            # Start from the row before t0 so its value carries into the first bucket.
+            i = max(0, ring.bisect(t0) - 1)
+            end = ring.bisect(t1)
+            cap, start = ring.capacity, ring.head - ring.count
+            ts_col = ring.ts
+            while i < end:
+                p = (start + i) % cap
+                a = ts_col[p]
+                b = ts_col[(p + 1) % cap] if i + 1 < ring.count else a + hold
+                v = col[p]
+                i += 1
+                b = min(b, a + hold, t1)
+                a = max(a, t0)
+                if v == missing or b <= a:
+                    continue
+                k = int((a - t0) // bucket)
+                while a < b and k < n:
+                    edge = min(b, t0 + (k + 1) * bucket)
+                    if lo_v[k] is None or v < lo_v[k]:
+                        lo_v[k] = v
+                    if hi_v[k] is None or v > hi_v[k]:
+                        hi_v[k] = v
+                    wsum[k] += v * (edge - a)
+                    wt[k] += edge - a
+                    a = edge
+                    k += 1
+        return [
+            Bucket(int(t0 + k * bucket), lo_v[k], hi_v[k], wsum[k] / wt[k] if wt[k] else None) for k in range(n)
+        ]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "bytes": len(self._mm),
+            "max_devices": self.max_devices,
+            "capacity": self.capacity,
+            "keepalive": self.keepalive,
+            "devices": self.devices(),
+        }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store", default=DEFAULT_STORE, help="store file (default: %(default)s)")
+    ap.add_argument("--list", action="store_true", help="list devices and row counts")
+    ap.add_argument("--device", help="devId to query")
+    ap.add_argument("--hours", type=float, default=24.0)
+    ap.add_argument("--bucket", type=float, default=0.0, help="downsample into buckets of this many seconds")
+    ap.add_argument("--column", default="temp", choices=COLUMNS)
+    ap.add_argument("--eta", action="store_true", help="add the heat-up ETA after each row, or as of each bucket's last row (sauna_eta.backfill)")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.store):
+        print("no store at", args.store)
+        return 1
+    with TelemetryStore(args.store) as store:
+        if args.list or not args.device:
+            st = store.stats()
+            print(f"{st['path']}: {st['bytes']} bytes, {st['capacity']} rows x {st['max_devices']} devices")
+            for dev, n in st["devices"].items():
+                last = store.latest(dev)
+                print(f"{dev:<34} rows={n:<7} last={last}")
+            return 0
+        t1 = time.time()
+        t0 = t1 - args.hours * 3600.0
+        rows = store.range(args.device, t0, t1)
+        etas: list[Any] = [None] * len(rows)
+        if args.eta:
+            from sauna_eta import backfill_rows
+
+            etas = [e for _, e in backfill_rows(rows)]
+        if args.bucket > 0:
+            # With --eta a bucket shows the ETA as of its last row.
+            row_ts = [r.ts for r in rows]
+            for i, b in enumerate(store.downsample(args.device, t0, t1, args.bucket, args.column)):
+                if b.mean is None:
+                    continue
+                line = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(b.start))}  min={b.min} max={b.max} mean={b.mean:.1f}"
+                last = bisect.bisect_left(row_ts, t0 + (i + 1) * args.bucket) - 1
+                eta = etas[last] if last >= 0 else None
+                print(line + (f"  eta={eta:.0f}s" if eta is not None else ""))
+        else:
+            for r, eta in zip(rows, etas):
+                line = f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(r.ts))}  heater={r.heater} setpoint={r.setpoint} temp={r.temp}"
+                print(line + (f"  eta={eta:.0f}s" if eta is not None else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,95 +5,131 @@ Live polling of SaunaLogic/TyloHelo controller over LAN (Tuya/Thing 55aa framing
 Key idea (from docs/saunalogic-pcap-notes.md):
 - The "handshake" Type-10 (cmd=10) request/response is effectively a DP_QUERY that returns a full DPS snapshot.
 - So polling is: TCP connect -> send Type-10 request -> read Type-10 response -> decrypt JSON -> interpret DPS.
+- A single poll (the default) is one short-lived connection (poll_snapshot). Repeated polls
+  (--count/--interval) reuse one SaunaSession: the socket stays open with cmd=9 heartbeats,
+  so only the first poll pays for TCP setup + handshake; the exit status is that of the last poll. After the first full snapshot only the
+  dps that changed are printed (sauna_dps.DpsSnapshot.diff), or "unchanged".
+- --watch doesn't poll at all: it prints dps deltas from the Type-8 pushes the controller sends while
+  heating (one Type-10 snapshot per (re)connect only).
+- --metrics-port serves sauna_metrics (phase latencies, frames by cmd, errors) at /metrics.
+- --store FILE appends every snapshot/delta to a sauna_history.TelemetryStore (mmap ring per devId).
+- --trace FILE writes sauna_trace spans (poll, connect, send, recv, frame, decrypt..) as JSONL;
+  --profile FILE writes a cProfile/pstats dump of the run.
+- A snapshot or push whose ciphertext was seen before is answered from sauna_frame's plaintext
+  cache instead of being decrypted and parsed again (--no-cache turns that off).
 
 No Android/emulator required at runtime.
 
 Usage:
   python3 saunalogic_extract/sauna_live_poll.py --host <DEVICE_IP> --key "<LOCAL_KEY>"
+  python3 saunalogic_extract/sauna_live_poll.py --host <DEVICE_IP> --key "<LOCAL_KEY>" --count 0 --interval 5
+  python3 saunalogic_extract/sauna_live_poll.py --host <DEVICE_IP> --key "<LOCAL_KEY>" --watch
+  python3 saunalogic_extract/sauna_live_poll.py --devid <DEV_ID> --key "<LOCAL_KEY>"   # host from sauna_discovery
 """
 
 from __future__ import annotations
 
 import argparse
-import binascii
-import json
 import socket
-import subprocess
 import time
 from typing import Any
 
+from sauna_discovery import resolve_host
+from sauna_dps import DpsSnapshot
+from sauna_frame import DP_QUERY_REQ, FrameDecoder, decrypt_frame_json, set_plaintext_cache
+from sauna_history import TelemetryStore
+from sauna_metrics import METRICS, serve_metrics
+from sauna_session import SaunaSession, SessionError
+from sauna_trace import TRACE, JsonlSink, profile_to, record, set_sink
+from sauna_trace import span as trace_span
 
-# Captured Type-10 request (cmd=10) from docs/saunalogic-pcap-notes.md (Seq 0x0595).
-# This appears to be sufficient to trigger a DP snapshot response on connect.
-DP_QUERY_REQ_HEX = (
-    "000055aa000005950000000a00000048"
-    "462ebb16e2667b75b5c3eefed6886d5610fffe31bb2a4954da937633eb4da222"
-    "13e58805e31f87ed159506545b2366e98b06c2f6f0199f8a2f35996f580cd2bbab2eb66f"
-    "0000aa55"
-)
+POLL_PHASES = ("connect", "send", "first_byte", "frame", "decrypt")
 
 
-def openssl_aes_128_ecb_decrypt(ciphertext: bytes, key_ascii: str) -> bytes | None:
-    key_hex = key_ascii.encode("utf-8").hex()
-    p = subprocess.run(
-        ["openssl", "enc", "-aes-128-ecb", "-d", "-K", key_hex, "-nosalt"],
-        input=ciphertext,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        check=False,
-    )
-    return p.stdout if p.returncode == 0 else None
-
-
-def parse_one_frame(buf: bytes) -> tuple[bytes | None, bytes]:
-    """
-    Returns (frame_or_none, remaining_buf).
-    Frame layout: prefix 000055aa, then LL at bytes 12..15, total_len = 16 + LL (LL includes crc+tail).
-    """
-    i = buf.find(b"\x00\x00\x55\xaa")
-    if i < 0:
-        return None, b""
-    if i > 0:
-        buf = buf[i:]
-    if len(buf) < 16:
-        return None, buf
-    ll = int.from_bytes(buf[12:16], "big")
-    total_len = 16 + ll
-    if len(buf) < total_len:
-        return None, buf
-    return buf[:total_len], buf[total_len:]
-
-
-def decrypt_frame_json(frame: bytes, local_key: str) -> dict[str, Any] | None:
+def poll_snapshot(
+    host: str, local_key: str, port: int = 6668, timeout: float = 2.0
+) -> tuple[dict[str, Any] | None, dict[str, float], str | None]:
     """
-    Brute-decrypt body slices (AES-128-ECB) until we find JSON containing 'dps'.
-    Works for cmd=7/8/10 in our captures.
+    One-shot poll on a fresh socket: connect -> Type-10 query -> cmd=10 response -> decrypt.
+
+    Returns (json_or_none, phase_ms, error). phase_ms holds the duration of each completed phase:
+    connect, send, first_byte (send -> first recv), frame (first byte -> complete cmd=10 frame), decrypt.
+    With sauna_metrics enabled the phases and the outcome are recorded under path="poll"; with a
+    sauna_trace sink it is a "poll" span over connect/send/recv/frame/decrypt spans.
     """
-    ll = int.from_bytes(frame[12:16], "big")
-    body = frame[16 : 16 + ll]
-
-    tail_trims = (0, 4, 8, 12, 16)
-    for start in range(0, min(len(body), 256)):
-        for trim in tail_trims:
-            end = len(body) - trim
-            if end <= start:
-                continue
-            ct = body[start:end]
-            if len(ct) == 0 or len(ct) % 16 != 0:
-                continue
-            pt = openssl_aes_128_ecb_decrypt(ct, local_key)
-            if not pt:
-                continue
-            pt2 = pt.strip(b"\x00").strip()
-            if b"{" not in pt2 or b"}" not in pt2:
-                continue
+    if not METRICS.enabled and not TRACE.enabled:
+        return _poll_snapshot(host, local_key, port, timeout)
+    t0 = time.perf_counter()
+    with trace_span("poll", host=host, port=port) as sp:
+        j, phases, err = _poll_snapshot(host, local_key, port, timeout)
+        sp.set(ok=j is not None)
+        if err is not None:
+            sp.set(error=err)
+    if not METRICS.enabled:
+        return j, phases, err
+    METRICS.request_done("poll", time.perf_counter() - t0, err)
+    for name in ("connect", "send", "first_byte", "frame"):
+        if name in phases:
+            METRICS.phase_seconds.observe(phases[name] / 1000.0, "reassembly" if name == "frame" else name)
+    return j, phases, err
+
+
+def _poll_snapshot(
+    host: str, local_key: str, port: int, timeout: float
+) -> tuple[dict[str, Any] | None, dict[str, float], str | None]:
+    phases: dict[str, float] = {}
+    req = DP_QUERY_REQ
+    t0 = time.perf_counter()
+    try:
+        s = socket.create_connection((host, port), timeout=timeout)
+    except OSError as ex:
+        return None, phases, f"connect: {ex}"
+    t1 = time.perf_counter()
+    phases["connect"] = (t1 - t0) * 1000.0
+    traced = TRACE.enabled
+    if traced:
+        record("connect", t0)
+    try:
+        s.sendall(req)
+        t_send = time.perf_counter()
+        phases["send"] = (t_send - t1) * 1000.0
+        if traced:
+            record("send", t1, cmd=10, bytes=len(req))
+        t_first = None
+        deadline = t_send + timeout
+        decoder = FrameDecoder()
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None, phases, "No DP snapshot response received."
+            s.settimeout(remaining)
+            t_recv = time.perf_counter()
             try:
-                j = json.loads(pt2.decode("utf-8", "ignore"))
-            except Exception:
-                continue
-            if isinstance(j, dict) and "dps" in j:
-                return j
-    return None
+                data = s.recv(4096)
+            except socket.timeout:
+                if traced:
+                    record("recv", t_recv, bytes=0, error="timeout")
+                return None, phases, "No DP snapshot response received."
+            if traced:
+                record("recv", t_recv, bytes=len(data))
+            if not data:
+                return None, phases, "Connection closed by device."
+            if t_first is None:
+                t_first = time.perf_counter()
+                phases["first_byte"] = (t_first - t_send) * 1000.0
+            for frame in decoder.feed(data):
+                if int.from_bytes(frame[8:12], "big") != 10:
+                    continue
+                t_frame = time.perf_counter()
+                phases["frame"] = (t_frame - t_first) * 1000.0
+                j = decrypt_frame_json(bytes(frame), local_key)
+                phases["decrypt"] = (time.perf_counter() - t_frame) * 1000.0
+                if j is not None:
+                    return j, phases, None
+    except OSError as ex:
+        return None, phases, str(ex)
+    finally:
+        s.close()
 
 
 def dps_get(dps: dict[str, Any], key: str) -> Any:
@@ -101,51 +137,7 @@ def dps_get(dps: dict[str, Any], key: str) -> Any:
     return dps.get(key)
 
 
-def main() -> int:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--host", default="192.168.1.100")
-    ap.add_argument("--port", type=int, default=6668)
-    ap.add_argument("--key", required=True, help="Tuya/Thing localKey (ASCII; typically 16 chars)")
-    ap.add_argument("--timeout", type=float, default=2.0)
-    args = ap.parse_args()
-
-    req = binascii.unhexlify(DP_QUERY_REQ_HEX)
-
-    s = socket.socket()
-    s.settimeout(args.timeout)
-    s.connect((args.host, args.port))
-    s.sendall(req)
-
-    buf = b""
-    deadline = time.time() + args.timeout
-    got = None
-    while time.time() < deadline and got is None:
-        try:
-            data = s.recv(4096)
-            if not data:
-                break
-            buf += data
-        except socket.timeout:
-            break
-        while True:
-            frame, buf = parse_one_frame(buf)
-            if frame is None:
-                break
-            cmd = int.from_bytes(frame[8:12], "big")
-            if cmd != 10:
-                # DP snapshot is usually cmd=10 response; ignore others.
-                continue
-            j = decrypt_frame_json(frame, args.key)
-            if j:
-                got = j
-                break
-
-    s.close()
-
-    if not got:
-        print("No decryptable DP snapshot received.")
-        return 2
-
+def print_snapshot(got: dict[str, Any]) -> None:
     dps = got.get("dps", {})
     heater = dps_get(dps, "1")
     setpoint = dps_get(dps, "2")
@@ -156,9 +148,118 @@ def main() -> int:
     print("setpoint(dps2):", setpoint)
     print("temp(dps3):", temp)
     print("raw_dps:", dps)
+
+
+def watch(session: SaunaSession, store: TelemetryStore | None = None, store_key: str = "") -> int:
+    def on_dps(delta: dict[str, Any], state: dict[str, Any]) -> None:
+        ts = time.strftime("%H:%M:%S")
+        print(f"{ts} delta={delta} heater={state.get('1')} setpoint={state.get('2')} temp={state.get('3')}", flush=True)
+        if store is not None:
+            store.record_snapshot(store_key, DpsSnapshot.from_dps(state))
+
+    session.subscribe(on_dps)
+    session.watch()
+    try:
+        while True:
+            # Pushes only come on changes; a keepalive row keeps a quiet period from reading as a gap.
+            time.sleep(store.keepalive if store is not None else 3600)
+            if store is not None and session.connected:
+                store.record_snapshot(store_key, session.snapshot.copy())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
     return 0
 
 
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", help="device IP (default: looked up by --devid in the discovery directory, else 192.168.1.100)")
+    ap.add_argument("--devid", help="resolve the host from the discovery directory")
+    ap.add_argument("--port", type=int, default=6668)
+    ap.add_argument("--key", required=True, help="Tuya/Thing localKey (ASCII; typically 16 chars)")
+    ap.add_argument("--timeout", type=float, default=2.0)
+    ap.add_argument("--count", type=int, default=1, help="number of polls (0 = until interrupted); exits 2 if the last one failed")
+    ap.add_argument("--interval", type=float, default=5.0, help="seconds between polls when --count != 1")
+    ap.add_argument("--watch", action="store_true", help="print Type-8 pushes as they arrive instead of polling")
+    ap.add_argument("--store", help="record snapshots in this sauna_history store file (keyed by --devid, else host)")
+    ap.add_argument("--metrics-port", type=int, help="serve Prometheus-style metrics on this local port")
+    ap.add_argument("--trace", help="append trace spans to this JSONL file")
+    ap.add_argument("--profile", help="write a cProfile/pstats dump of the run to this file")
+    ap.add_argument("--no-cache", action="store_true", help="decrypt every frame even if its ciphertext repeats")
+    args = ap.parse_args()
+    if args.no_cache:
+        set_plaintext_cache(False)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.trace:
+        set_sink(JsonlSink(args.trace))
+    args.host = resolve_host(args.host, args.devid)
+    if args.profile:
+        with profile_to(args.profile):
+            return run(args)
+    return run(args)
+
+
+def run(args: argparse.Namespace) -> int:
+    store = TelemetryStore(args.store) if args.store else None
+    try:
+        return poll_loop(args, store)
+    finally:
+        if store is not None:
+            store.close()
+
+
+def poll_loop(args: argparse.Namespace, store: TelemetryStore | None) -> int:
+    """
+    Exit status: 0 if the last poll got a snapshot, else 2 (earlier failures are only printed).
+    """
+    store_key = args.devid or args.host
+    if args.count == 1 and not args.watch:
+        # A single poll doesn't need the session's reader and heartbeat threads.
+        got, _phases, err = poll_snapshot(args.host, args.key, port=args.port, timeout=args.timeout)
+        if not got:
+            print("No decryptable DP snapshot received." + (f" ({err})" if err else ""))
+            return 2
+        if store is not None:
+            store.record_snapshot(store_key, DpsSnapshot.from_dps(got.get("dps", {})))
+        print_snapshot(got)
+        return 0
+    session = SaunaSession(args.host, args.key, port=args.port, timeout=args.timeout)
+    if args.watch:
+        return watch(session, store, store_key)
+    rc = 0
+    n = 0
+    prev: DpsSnapshot | None = None
+    try:
+        while args.count <= 0 or n < args.count:
+            if n:
+                time.sleep(args.interval)
+            n += 1
+            try:
+                got = session.query_snapshot()
+            except (OSError, SessionError):
+                got = None
+            if not got:
+                print("No decryptable DP snapshot received.")
+                rc = 2
+                continue
+            rc = 0
+            snap = DpsSnapshot.from_dps(got.get("dps", {}))
+            if store is not None:
+                store.record_snapshot(store_key, snap)
+            if prev is None:
+                print_snapshot(got)
+            else:
+                changed = snap.diff(prev)
+                print(f"{time.strftime('%H:%M:%S')} {'changed: ' + str(changed) if changed else 'unchanged'}", flush=True)
+            prev = snap
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+    return rc
+
+
 if __name__ == "__main__":
     raise SystemExit(main())
-
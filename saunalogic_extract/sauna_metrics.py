@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+In-process counters and latency histograms for the SaunaLogic poll and command paths.
+
+A failed poll used to leave one lastError string ("No DP snapshot response received.",
+"Handshake timeout: no cmd=10 response.") and no timings. With metrics on, the client records:
+
+  sauna_phase_seconds{phase}          connect, send, first_byte, reassembly, decrypt, parse
+  sauna_request_seconds{path}         whole request: poll (one-shot), query/write (session)
+  sauna_requests_total{path,result}   ok / error per path
+  sauna_errors_total{path,error}      the lastError message (or exception type for socket errors)
+  sauna_frames_total{cmd}             complete CRC-checked frames by cmd (7/8/9/10/..)
+  sauna_frame_crc_errors_total        frames dropped on a bad CRC/tail
+  sauna_frame_resyncs_total           times the decoder skipped bytes to find the next 000055aa
+
+Metrics are off unless SAUNA_METRICS=1 or set_metrics(True). Every call site checks
+METRICS.enabled before reading the clock, so the disabled path is one attribute test.
+render() gives the Prometheus text exposition format; serve_metrics() answers GET /metrics on a
+local port (the gateway also serves it).
+
+Usage:
+  from sauna_metrics import METRICS, serve_metrics, set_metrics
+  set_metrics(True)
+  serve_metrics(9108)           # curl -s localhost:9108/metrics
+  print(METRICS.render())
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+# Histogram bucket upper bounds (seconds), roughly x2.5 apart from 0.1 ms to 5 s.
+BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, math.inf)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    __slots__ = ("name", "help", "labels", "_values", "_lock")
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: Any, value: float = 1.0) -> None:
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + value
+
+    def value(self, *label_values: Any) -> float:
+        return self._values.get(tuple(str(v) for v in label_values), 0.0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            out.append(f"{self.name}{_labels(self.labels, key)} {_num(v)}")
+        return out
+
+
+class Histogram:
+    __slots__ = ("name", "help", "labels", "buckets", "_series", "_lock")
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = BUCKETS_S) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket (not cumulative)..., sum, count]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *label_values: Any) -> None:
+        key = tuple(str(v) for v in label_values)
+        buckets = self.buckets
+        i = 0
+        while seconds > buckets[i]:
+            i += 1
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(buckets) + 2)
+            s[i] += 1
+            s[-2] += seconds
+            s[-1] += 1
+
+    def count(self, *label_values: Any) -> int:
+        s = self._series.get(tuple(str(v) for v in label_values))
+        return int(s[-1]) if s else 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(s)) for k, s in self._series.items())
+        for key, s in items:
+            cum = 0.0
+            for ub, n in zip(self.buckets, s):
+                cum += n
+                le = "+Inf" if math.isinf(ub) else repr(ub)
+                out.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {_num(cum)}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {s[-2]!r}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {_num(s[-1])}")
+        return out
+
+
+class Registry:
+    """
+    The metrics of one process. Check `enabled` before timing anything.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.phase_seconds = Histogram("sauna_phase_seconds", "Duration of one protocol phase.", ("phase",))
+        self.request_seconds = Histogram("sauna_request_seconds", "Duration of a whole poll or command.", ("path",))
+        self.requests = Counter("sauna_requests_total", "Polls and commands by outcome.", ("path", "result"))
+        self.errors = Counter("sauna_errors_total", "Failed polls and commands by error.", ("path", "error"))
+        self.frames = Counter("sauna_frames_total", "Complete CRC-checked frames received, by cmd.", ("cmd",))
+        self.crc_errors = Counter("sauna_frame_crc_errors_total", "Frames dropped on a bad CRC or tail.")
+        self.resyncs = Counter("sauna_frame_resyncs_total", "Decoder resyncs onto the next 000055aa prefix.")
+        self._metrics: tuple[Counter | Histogram, ...] = (
+            self.phase_seconds,
+            self.request_seconds,
+            self.requests,
+            self.errors,
+            self.frames,
+            self.crc_errors,
+            self.resyncs,
+        )
+
+    def request_done(self, path: str, seconds: float, error: str | None = None) -> None:
+        self.request_seconds.observe(seconds, path)
+        if error is None:
+            self.requests.inc(path, "ok")
+        else:
+            self.requests.inc(path, "error")
+            self.errors.inc(path, error)
+
+    def reset(self) -> None:
+        for m in self._metrics:
+            m.clear()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+def error_label(ex: BaseException) -> str:
+    """
+    The message for our own errors (they're the lastError strings); the type for socket errors,
+    whose messages carry addresses and errnos.
+    """
+    if isinstance(ex, OSError):
+        return type(ex).__name__
+    return str(ex) or type(ex).__name__
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    esc = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, esc)) + "}"
+
+
+def _num(v: float) -> str:
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+METRICS = Registry(os.environ.get("SAUNA_METRICS", "0") == "1")
+
+
+def set_metrics(enabled: bool) -> None:
+    METRICS.enabled = enabled
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(port: int, bind: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Enables metrics and serves GET /metrics from a daemon thread; shutdown() the returned server to stop.
+    """
+    set_metrics(True)
+    server = ThreadingHTTPServer((bind, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="sauna-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Stream Tuya 55aa frames out of pcap/pcapng captures (e.g. the PCAPdroid_*.pcap files in the repo root).
+
+- stdlib only; the capture is mmap'd and walked record by record (nothing is loaded whole)
+- classic pcap (either byte order, us/ns timestamps) and pcapng (SHB/IDB/EPB/SPB)
+- link types: raw IP (PCAPdroid uses 101), Ethernet, Linux SLL/SLL2, IPv4/IPv6
+- TCP payloads on the given port are reassembled per direction (seq-ordered, retransmits trimmed)
+  and run through sauna_frame.FrameDecoder, so frames split across segments come out whole;
+  a segment missing from the capture is skipped once MAX_PENDING_SEGMENTS/BYTES pile up behind it
+
+Usage:
+  python3 saunalogic_extract/sauna_pcap.py PCAPdroid_15_Jan_22_43_37.pcap
+  python3 saunalogic_extract/sauna_pcap.py --frames PCAPdroid_*.pcap
+"""
+
+from __future__ import annotations
+
+import argparse
+import mmap
+import struct
+import time
+from collections import Counter
+from typing import Iterator, NamedTuple
+
+from sauna_frame import FrameDecoder
+
+TUYA_PORT = 6668
+# Out-of-order data held per direction while waiting for a missing segment; past either limit the
+# segment is taken as lost (not captured), the decoder skips ahead and counts a resync.
+MAX_PENDING_SEGMENTS = 64
+MAX_PENDING_BYTES = 256 * 1024
+
+_PCAP_MAGIC = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+_PCAPNG_SHB = 0x0A0D0D0A
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+
+class PcapFrame(NamedTuple):
+    ts: float
+    direction: str  # "c2d" (client -> device, dst port 6668) or "d2c"
+    src: str
+    dst: str
+    seq: int
+    cmd: int
+    length: int
+    frame: bytes
+
+
+# ==== capture container ====
+def iter_packets(mm: mmap.mmap | bytes) -> Iterator[tuple[float, int, memoryview]]:
+    """
+    Yields (timestamp, linktype, packet bytes) for every record of a pcap or pcapng buffer.
+    """
+    with memoryview(mm) as mv:
+        yield from _iter_records(mv)
+
+
+def _iter_records(mv: memoryview) -> Iterator[tuple[float, int, memoryview]]:
+    if len(mv) < 24:
+        return
+    magic = bytes(mv[:4])
+    if magic in _PCAP_MAGIC:
+        endian, scale = _PCAP_MAGIC[magic]
+        linktype = struct.unpack_from(endian + "I", mv, 20)[0] & 0x0FFFFFFF
+        rec = struct.Struct(endian + "IIII")
+        off = 24
+        end = len(mv)
+        while off + 16 <= end:
+            sec, frac, incl, _orig = rec.unpack_from(mv, off)
+            off += 16
+            if off + incl > end:
+                break
+            yield sec + frac * scale, linktype, mv[off : off + incl]
+            off += incl
+        return
+    if struct.unpack_from("<I", mv, 0)[0] == _PCAPNG_SHB:
+        yield from _iter_pcapng(mv)
+        return
+    raise ValueError("not a pcap/pcapng capture")
+
+
+def _iter_pcapng(mv: memoryview) -> Iterator[tuple[float, int, memoryview]]:
+    end = len(mv)
+    off = 0
+    endian = "<"
+    interfaces: list[tuple[int, float]] = []  # (linktype, timestamp unit)
+    while off + 12 <= end:
+        btype = struct.unpack_from(endian + "I", mv, off)[0]
+        if btype == _PCAPNG_SHB:
+            bom = bytes(mv[off + 8 : off + 12])
+            endian = "<" if bom == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []
+        blen = struct.unpack_from(endian + "I", mv, off + 4)[0]
+        if blen < 12 or off + blen > end:
+            break
+        if btype == 1:  # Interface Description Block
+            linktype = struct.unpack_from(endian + "H", mv, off + 8)[0]
+            interfaces.append((linktype, _pcapng_tsresol(mv, off, blen, endian)))
+        elif btype == 6:  # Enhanced Packet Block
+            iface, ts_hi, ts_lo, caplen, _orig = struct.unpack_from(endian + "IIIII", mv, off + 8)
+            if iface < len(interfaces):
+                linktype, unit = interfaces[iface]
+                yield ((ts_hi << 32) | ts_lo) * unit, linktype, mv[off + 28 : off + 28 + caplen]
+        elif btype == 3 and interfaces:  # Simple Packet Block (no timestamp)
+            orig = struct.unpack_from(endian + "I", mv, off + 8)[0]
+            caplen = min(orig, blen - 16)
+            yield 0.0, interfaces[0][0], mv[off + 12 : off + 12 + caplen]
+        off += blen
+
+
+def _pcapng_tsresol(mv: memoryview, off: int, blen: int, endian: str) -> float:
+    opt = off + 16
+    end = off + blen - 4
+    while opt + 4 <= end:
+        code, olen = struct.unpack_from(endian + "HH", mv, opt)
+        if code == 0:
+            break
+        if code == 9 and olen >= 1:  # if_tsresol
+            v = mv[opt + 4]
+            return 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+        opt += 4 + ((olen + 3) & ~3)
+    return 1e-6
+
+
+# ==== link / IP / TCP ====
+def _ip_offset(linktype: int, pkt: memoryview) -> int:
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return 0
+    if linktype == LINKTYPE_ETHERNET:
+        off = 12
+        ethertype = struct.unpack_from(">H", pkt, off)[0]
+        while ethertype in (0x8100, 0x88A8):  # VLAN tags
+            off += 4
+            ethertype = struct.unpack_from(">H", pkt, off)[0]
+        return off + 2 if ethertype in (0x0800, 0x86DD) else -1
+    if linktype == LINKTYPE_LINUX_SLL:
+        return 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        return 20
+    return -1
+
+
+def _tcp_segment(linktype: int, pkt: memoryview) -> tuple[str, int, str, int, int, int, memoryview] | None:
+    """
+    Returns (src, sport, dst, dport, seq, flags, payload) for a TCP packet, else None.
+    """
+    try:
+        off = _ip_offset(linktype, pkt)
+        if off < 0 or len(pkt) < off + 20:
+            return None
+        ver = pkt[off] >> 4
+        if ver == 4:
+            ihl = (pkt[off] & 0x0F) * 4
+            if pkt[off + 9] != 6:
+                return None
+            total = struct.unpack_from(">H", pkt, off + 2)[0]
+            src = ".".join(str(b) for b in pkt[off + 12 : off + 16])
+            dst = ".".join(str(b) for b in pkt[off + 16 : off + 20])
+            ip_end = min(len(pkt), off + total) if total else len(pkt)
+            tcp = off + ihl
+        elif ver == 6:
+            if pkt[off + 6] != 6:  # extension headers not handled
+                return None
+            plen = struct.unpack_from(">H", pkt, off + 4)[0]
+            src = bytes(pkt[off + 8 : off + 24]).hex()
+            dst = bytes(pkt[off + 24 : off + 40]).hex()
+            tcp = off + 40
+            ip_end = min(len(pkt), tcp + plen)
+        else:
+            return None
+        sport, dport, seq = struct.unpack_from(">HHI", pkt, tcp)
+        doff = (pkt[tcp + 12] >> 4) * 4
+        flags = pkt[tcp + 13]
+        return src, sport, dst, dport, seq, flags, pkt[tcp + doff : ip_end]
+    except (IndexError, struct.error):
+        return None
+
+
+def _udp_datagram(linktype: int, pkt: memoryview) -> tuple[str, int, str, int, memoryview] | None:
+    """
+    Returns (src, sport, dst, dport, payload) for an IPv4 UDP packet, else None.
+    """
+    try:
+        off = _ip_offset(linktype, pkt)
+        if off < 0 or len(pkt) < off + 28 or pkt[off] >> 4 != 4 or pkt[off + 9] != 17:
+            return None
+        udp = off + (pkt[off] & 0x0F) * 4
+        sport, dport, ulen = struct.unpack_from(">HHH", pkt, udp)
+        src = ".".join(str(b) for b in pkt[off + 12 : off + 16])
+        dst = ".".join(str(b) for b in pkt[off + 16 : off + 20])
+        return src, sport, dst, dport, pkt[udp + 8 : udp + max(8, ulen)]
+    except (IndexError, struct.error):
+        return None
+
+
+class _Flow:
+    __slots__ = ("next_seq", "pending", "pending_bytes", "decoder")
+
+    def __init__(self) -> None:
+        self.next_seq: int | None = None
+        self.pending: dict[int, bytes] = {}
+        self.pending_bytes = 0
+        self.decoder = FrameDecoder()
+
+
+def _reassemble(flow: _Flow, seq: int, payload: memoryview) -> Iterator[memoryview]:
+    if flow.next_seq is None:
+        flow.next_seq = seq
+    delta = (seq - flow.next_seq) & 0xFFFFFFFF
+    if delta >= 0x80000000:
+        # Retransmission / overlap: keep only bytes past what we already have.
+        skip = (flow.next_seq - seq) & 0xFFFFFFFF
+        if skip >= len(payload):
+            return
+        payload = payload[skip:]
+    elif delta:
+        flow.pending[seq] = bytes(payload)  # out of order; wait for the gap to fill
+        flow.pending_bytes += len(payload)
+        if len(flow.pending) <= MAX_PENDING_SEGMENTS and flow.pending_bytes <= MAX_PENDING_BYTES:
+            return
+        # The missing segment isn't coming (not captured): skip to what we have.
+        flow.next_seq = min(flow.pending, key=lambda s: (s - flow.next_seq) & 0xFFFFFFFF)  # type: ignore[operator]
+        flow.decoder.reset()
+        flow.decoder.resyncs += 1
+        yield from _drain(flow)
+        return
+    flow.next_seq = (flow.next_seq + len(payload)) & 0xFFFFFFFF
+    yield from flow.decoder.feed(payload)
+    yield from _drain(flow)
+
+
+def _drain(flow: _Flow) -> Iterator[memoryview]:
+    """
+    Feeds pending segments that are now contiguous, trimming overlaps and dropping duplicates.
+    """
+    while flow.pending:
+        nxt = flow.next_seq
+        assert nxt is not None
+        seq = min(flow.pending, key=lambda s: (s - nxt + 0x80000000) & 0xFFFFFFFF)  # furthest behind first
+        behind = (nxt - seq) & 0xFFFFFFFF
+        if behind >= 0x80000000:
+            return  # still a gap before the lowest pending segment
+        data = flow.pending.pop(seq)
+        flow.pending_bytes -= len(data)
+        if behind >= len(data):
+            continue
+        flow.next_seq = (seq + len(data)) & 0xFFFFFFFF
+        yield from flow.decoder.feed(data[behind:])
+
+
+def iter_frames(path: str, port: int = TUYA_PORT) -> Iterator[PcapFrame]:
+    """
+    Yields every 55aa frame carried over TCP `port` in the capture, in capture order.
+    """
+    flows: dict[tuple[str, int, str, int], _Flow] = {}
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return
+    packets = iter_packets(mm)
+    try:
+        for ts, linktype, pkt in packets:
+            seg = _tcp_segment(linktype, pkt)
+            if seg is None:
+                continue
+            src, sport, dst, dport, seq, flags, payload = seg
+            if sport != port and dport != port:
+                continue
+            key = (src, sport, dst, dport)
+            flow = flows.get(key)
+            if flow is None or flags & 0x02:  # new flow or SYN (port reuse)
+                flow = flows[key] = _Flow()
+                if flags & 0x02:
+                    flow.next_seq = (seq + 1) & 0xFFFFFFFF
+            if not payload:
+                continue
+            direction = "c2d" if dport == port else "d2c"
+            for fr in _reassemble(flow, seq, payload):
+                yield PcapFrame(
+                    ts=ts,
+                    direction=direction,
+                    src=f"{src}:{sport}",
+                    dst=f"{dst}:{dport}",
+                    seq=int.from_bytes(fr[4:8], "big"),
+                    cmd=int.from_bytes(fr[8:12], "big"),
+                    length=len(fr),
+                    frame=bytes(fr),
+                )
+    finally:
+        # Views into the mapping must be gone before it can be closed.
+        pkt = seg = payload = None
+        packets.close()
+        try:
+            mm.close()
+        except BufferError:
+            pass
+
+
+def iter_udp(path: str, ports: tuple[int, ...]) -> Iterator[tuple[float, str, str, int, bytes]]:
+    """
+    Yields (ts, src, dst, dport, payload) for UDP datagrams to any of `ports` (e.g. discovery broadcasts).
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return
+    packets = iter_packets(mm)
+    try:
+        for ts, linktype, pkt in packets:
+            dgram = _udp_datagram(linktype, pkt)
+            if dgram is not None and dgram[3] in ports:
+                yield ts, dgram[0], dgram[2], dgram[3], bytes(dgram[4])
+    finally:
+        pkt = dgram = None
+        packets.close()
+        try:
+            mm.close()
+        except BufferError:
+            pass
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("pcap", nargs="+")
+    ap.add_argument("--port", type=int, default=TUYA_PORT)
+    ap.add_argument("--frames", action="store_true", help="print every frame (ts, dir, seq, cmd, len)")
+    args = ap.parse_args()
+
+    for path in args.pcap:
+        t0 = time.perf_counter()
+        counts: Counter[tuple[int, int, str]] = Counter()
+        for fr in iter_frames(path, args.port):
+            counts[(fr.cmd, fr.length, fr.direction)] += 1
+            if args.frames:
+                print(f"{fr.ts:.6f} {fr.direction} {fr.src} -> {fr.dst} seq=0x{fr.seq:04x} cmd={fr.cmd} len={fr.length}")
+        dt = (time.perf_counter() - t0) * 1000.0
+        print(f"== {path}: {sum(counts.values())} frames in {dt:.1f}ms")
+        for cmd in sorted({k[0] for k in counts}):
+            rows = sorted((k, n) for k, n in counts.items() if k[0] == cmd)
+            total = sum(n for _, n in rows)
+            detail = ", ".join(f"{length} {d} ({n})" for (_, length, d), n in rows)
+            print(f"  Type {cmd}: {total} frames — {detail}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,75 +1,240 @@
 #!/usr/bin/env python3
 """
-Quick stability test for SaunaLogic LAN polling.
+Stability/load test for SaunaLogic LAN polling.
 
-Runs N polls back-to-back using the Type-10 DP snapshot query and reports success rate and timings.
+Runs Type-10 DP snapshot polls in-process (sauna_live_poll.poll_snapshot, a fresh socket per poll,
+the same pattern as the Crestron client) and reports success rate plus a latency histogram per
+phase: connect, send, first_byte, frame, decrypt, total. No interpreter start-up or stdout scraping is
+included in the numbers.
+
+- stop after --count polls or --duration seconds
+- --rate caps the aggregate start rate (polls/s); --concurrency runs that many pollers in parallel
+- --json writes config, summary and every sample so runs can be compared over time
+- --max-age N makes the workers read through a sauna_snapshot_cache.SnapshotCache instead: they
+  share one in-flight poll and reuse snapshots up to N seconds old, so this measures what many
+  readers cost the device (the summary shows reads vs device polls; phases aren't recorded)
+- --metrics-port serves the sauna_metrics counters and histograms at /metrics while it runs
+- --trace FILE records sauna_trace spans for every poll (JSONL) and prints the span breakdown of
+  the slowest poll; --profile FILE writes a cProfile/pstats dump of the run (main-thread worker)
 
 Usage:
   python3 saunalogic_extract/sauna_poll_stability_test.py --host <DEVICE_IP> --key "<LOCAL_KEY>" --count 50
+  python3 saunalogic_extract/sauna_poll_stability_test.py --host <DEVICE_IP> --key "<LOCAL_KEY>" \\
+      --duration 60 --rate 2 --concurrency 2 --json stability.json
 """
 
 from __future__ import annotations
 
 import argparse
-import subprocess
+import json
+import math
+import threading
 import time
+from typing import Any
+
+from sauna_discovery import resolve_host
+from sauna_live_poll import POLL_PHASES, poll_snapshot
+from sauna_metrics import serve_metrics
+from sauna_trace import JsonlSink, RingSink, TeeSink, format_trace, profile_to, set_sink
+from sauna_session import SessionError
+from sauna_snapshot_cache import SnapshotCache, one_shot_fetch
+
+PHASES = POLL_PHASES + ("total",)
+# Histogram bucket upper bounds (ms), roughly x2 apart.
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, math.inf)
+
+
+class RateLimiter:
+    """Hands out start times spaced 1/rate apart across all workers (rate <= 0: no limit)."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def wait(self, stop: threading.Event | None = None) -> None:
+        """Sleeps until this caller's start time, or until `stop` is set."""
+        if not self.interval:
+            return
+        with self._lock:
+            start = max(self._next, time.perf_counter())
+            self._next = start + self.interval
+        delay = start - time.perf_counter()
+        if delay > 0:
+            if stop is not None:
+                stop.wait(delay)
+            else:
+                time.sleep(delay)
+
+
+def percentile(sorted_vals: list[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[int(q * (len(sorted_vals) - 1))]
+
+
+def summarize(vals: list[float]) -> dict[str, Any]:
+    v = sorted(vals)
+    hist = [0] * len(BUCKETS_MS)
+    for x in v:
+        for i, ub in enumerate(BUCKETS_MS):
+            if x <= ub:
+                hist[i] += 1
+                break
+    return {
+        "n": len(v),
+        "p50": percentile(v, 0.50),
+        "p95": percentile(v, 0.95),
+        "p99": percentile(v, 0.99),
+        "max": v[-1] if v else 0.0,
+        "mean": sum(v) / len(v) if v else 0.0,
+        "hist": {("inf" if math.isinf(ub) else str(ub)): n for ub, n in zip(BUCKETS_MS, hist)},
+    }
 
 
 def main() -> int:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--host", default="192.168.1.100")
+    ap.add_argument("--host", help="device IP (default: looked up by --devid in the discovery directory, else 192.168.1.100)")
+    ap.add_argument("--devid", help="resolve the host from the discovery directory")
+    ap.add_argument("--port", type=int, default=6668)
     ap.add_argument("--key", required=True)
-    ap.add_argument("--count", type=int, default=20)
+    ap.add_argument("--timeout", type=float, default=2.0)
+    ap.add_argument("--count", type=int, default=20, help="total polls (ignored when --duration is set)")
+    ap.add_argument("--duration", type=float, default=0.0, help="run for this many seconds instead of --count")
+    ap.add_argument("--rate", type=float, default=0.0, help="max polls/s across all workers (0 = back-to-back)")
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--max-age", type=float, default=0.0, help="read through a shared snapshot cache (seconds; 0 = off)")
+    ap.add_argument("--json", help="write results to this JSON file")
+    ap.add_argument("--metrics-port", type=int, help="serve Prometheus-style metrics on this local port")
+    ap.add_argument("--trace", help="append trace spans to this JSONL file and show the slowest poll")
+    ap.add_argument("--profile", help="write a cProfile/pstats dump of the run to this file")
+    ap.add_argument("--quiet", action="store_true", help="don't print a line per poll")
     args = ap.parse_args()
+    args.host = resolve_host(args.host, args.devid)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    ring = None
+    if args.trace:
+        ring = RingSink(100000)
+        set_sink(TeeSink(JsonlSink(args.trace), ring))
+    if args.profile:
+        with profile_to(args.profile):
+            return run(args, ring)
+    return run(args, ring)
+
+
+def run(args: argparse.Namespace, ring: RingSink | None) -> int:
+    limiter = RateLimiter(args.rate)
+    lock = threading.Lock()
+    samples: list[dict[str, Any]] = []
+    issued = 0
+    t_start = time.perf_counter()
+    stop_at = t_start + args.duration if args.duration > 0 else None
+    stop = threading.Event()  # set on Ctrl-C; workers finish their current poll and exit
+    last_dps: dict[str, Any] | None = None
+    cache = None
+    if args.max_age > 0:
+        cache = SnapshotCache(one_shot_fetch(args.host, args.key, port=args.port, timeout=args.timeout), args.max_age)
+
+    def next_index() -> int | None:
+        nonlocal issued
+        with lock:
+            if stop_at is None and issued >= args.count:
+                return None
+            issued += 1
+            return issued
 
-    ok = 0
-    fail = 0
-    times = []
-    last = None
-
-    for i in range(1, args.count + 1):
-        t0 = time.time()
-        p = subprocess.run(
-            [
-                "python3",
-                "saunalogic_extract/sauna_live_poll.py",
-                "--host",
-                args.host,
-                "--key",
-                args.key,
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            check=False,
-        )
-        dt = (time.time() - t0) * 1000.0
-        times.append(dt)
-        if p.returncode == 0 and "temp(dps3):" in p.stdout:
-            ok += 1
-            last = p.stdout.strip().splitlines()[-1] if p.stdout.strip() else None
-            print(f"[{i:02d}/{args.count}] ok {dt:.0f}ms")
-        else:
-            fail += 1
-            print(f"[{i:02d}/{args.count}] FAIL {dt:.0f}ms")
-            print(p.stdout.strip()[:500])
-
-    if times:
-        times_sorted = sorted(times)
-        p50 = times_sorted[int(0.50 * (len(times_sorted) - 1))]
-        p95 = times_sorted[int(0.95 * (len(times_sorted) - 1))]
-        mx = times_sorted[-1]
-    else:
-        p50 = p95 = mx = 0
+    def worker() -> None:
+        nonlocal last_dps
+        while not stop.is_set():
+            i = next_index()
+            if i is None:
+                return
+            limiter.wait(stop)
+            if stop.is_set() or (stop_at is not None and time.perf_counter() >= stop_at):
+                return
+            t0 = time.perf_counter()
+            extra: dict[str, Any] = {}
+            if cache is None:
+                got, phases, err = poll_snapshot(args.host, args.key, port=args.port, timeout=args.timeout)
+            else:
+                phases = {}
+                try:
+                    cached = cache.get()
+                    got, err = cached.value, None
+                    extra["age"] = cached.age * 1000.0
+                except (OSError, SessionError) as ex:
+                    got, err = None, str(ex)
+            total = (time.perf_counter() - t0) * 1000.0
+            ok = got is not None
+            sample = {"i": i, "t": t0 - t_start, "ok": ok, "total": total, "error": err, **phases, **extra}
+            with lock:
+                samples.append(sample)
+                if ok:
+                    last_dps = got.get("dps")
+            if not args.quiet:
+                label = f"[{i:03d}" + (f"/{args.count}]" if stop_at is None else "]")
+                detail = " ".join(f"{p}={phases[p]:.1f}" for p in POLL_PHASES if p in phases)
+                print(f"{label} {'ok' if ok else 'FAIL'} {total:.0f}ms  {detail}" + ("" if ok else f"  {err}"))
+
+    # One worker runs on the main thread, the only one --profile sees.
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, args.concurrency) - 1)]
+    for t in threads:
+        t.start()
+    try:
+        worker()
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        stop.set()
+        print("--- interrupted, waiting for polls in flight (Ctrl-C again to skip)")
+        try:
+            for t in threads:
+                t.join()
+        except KeyboardInterrupt:
+            pass
+    wall = time.perf_counter() - t_start
+    with lock:
+        done = list(samples)  # a worker still in flight after a second Ctrl-C can't change this copy
+
+    ok = sum(1 for s in done if s["ok"])
+    fail = len(done) - ok
+    phase_stats = {p: summarize([s[p] for s in done if s["ok"] and p in s]) for p in PHASES}
 
     print("---")
-    print("ok:", ok, "fail:", fail)
-    print(f"latency_ms p50={p50:.0f} p95={p95:.0f} max={mx:.0f}")
-    if last:
-        print("last_raw_dps_line:", last)
+    print("ok:", ok, "fail:", fail, f"wall={wall:.1f}s achieved_rate={len(done) / wall if wall else 0:.2f}/s")
+    print(f"{'phase':<11} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}   histogram (ms bucket: count)")
+    for p in PHASES:
+        st = phase_stats[p]
+        if not st["n"]:
+            continue
+        hist = " ".join(f"<={ub}:{n}" for ub, n in st["hist"].items() if n)
+        print(f"{p:<11} {st['p50']:8.1f} {st['p95']:8.1f} {st['p99']:8.1f} {st['max']:8.1f}   {hist}")
+    if cache is not None:
+        st = cache.stats
+        print(f"cache: reads={st['reads']} device_polls={st['fetches']} hits={st['hits']} joined={st['joined']} errors={st['errors']}")
+    if last_dps:
+        print("last_raw_dps:", last_dps)
+    if ring is not None:
+        polls = ring.roots("poll")
+        if polls:
+            slow = max(polls, key=lambda sp: sp["duration"])
+            print(f"slowest poll ({slow['duration'] * 1000.0:.1f}ms):")
+            print(format_trace(ring.trace(slow["trace_id"])))
+
+    if args.json:
+        result = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "config": {k: v for k, v in vars(args).items() if k not in ("key", "json")},
+            "summary": {"ok": ok, "fail": fail, "wall_s": wall, "cache": cache.stats if cache is not None else None},
+            "phases": phase_stats,
+            "samples": sorted(done, key=lambda s: s["i"]),
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print("wrote", args.json)
     return 0 if fail == 0 else 2
 
 
 if __name__ == "__main__":
     raise SystemExit(main())
-
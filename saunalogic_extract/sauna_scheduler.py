@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Adaptive poll intervals for SaunaLogic controllers, from heat-up rate, heater state and failures.
+
+A fixed 1 s timer spends most of its polls on saunas that are off and sitting at ambient, yet is
+barely fast enough while one heats (the ~156 -> 161 capture climbs about 1F a minute). PollScheduler
+keeps per device the recent dps 3 readings and the last dps 1/2, and after every poll picks the
+next interval:
+
+  failing      backoff_base x 2^(failures-1), capped at max_backoff
+  near target  heater on and within near_band of the setpoint while still rising: near_interval
+  heating      heater on and below the setpoint (setpoint unknown: dps 3 rising faster than
+               slope_threshold): heat_interval
+  holding      heater on at or above the setpoint: hold_interval
+  cooling      heater off, dps 3 still falling: cool_interval
+  idle         heater off and dps 3 flat: idle_interval
+
+Every interval gets +/- jitter so a fleet that started together drifts apart, and is clamped so no
+controller sees more than max_rate requests per second, counting requests reported through
+note_request() (FleetPoller.write() reports its writes while run_adaptive() runs). Each decision
+(device, interval, reason, slope) is kept in `decisions` and passed to an optional callback.
+sauna_fleet.py --adaptive polls through it.
+
+Usage:
+  sched = PollScheduler(SchedulerConfig(idle_interval=60))
+  sched.add("main")
+  for name in sched.due():
+      d = sched.note_poll(name, DpsSnapshot.from_dps(snap["dps"]))   # or note_failure(name, err)
+  time.sleep(sched.wait_time())
+"""
+
+from __future__ import annotations
+
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Collection
+
+from sauna_dps import DpsSnapshot
+
+
+@dataclass
+class SchedulerConfig:
+    heat_interval: float = 5.0
+    near_interval: float = 2.0
+    hold_interval: float = 15.0
+    cool_interval: float = 30.0
+    idle_interval: float = 60.0
+    backoff_base: float = 5.0
+    max_backoff: float = 300.0
+    jitter: float = 0.1  # +/- fraction of the interval
+    max_rate: float = 1.0  # requests/s per controller, all sources
+    near_band: float = 3.0  # degrees below the setpoint that count as "near target"
+    slope_window: float = 180.0  # seconds of dps 3 history used for the slope
+    slope_threshold: float = 0.2  # degrees/minute that count as rising or falling
+
+    def __post_init__(self) -> None:
+        if self.max_rate <= 0:
+            raise ValueError(f"max_rate must be > 0, got {self.max_rate}")
+
+
+@dataclass
+class Decision:
+    device: str
+    at: float
+    interval: float
+    reason: str
+    slope: float | None  # dps 3 degrees/minute, None until two readings
+
+    def __str__(self) -> str:
+        slope = "" if self.slope is None else f" ({self.slope:+.2f}/min)"
+        return f"{self.device:<16} next in {self.interval:5.1f}s  {self.reason}{slope}"
+
+
+@dataclass
+class DeviceSchedule:
+    name: str
+    next_at: float = 0.0
+    last_request: float = float("-inf")
+    failures: int = 0
+    heater: bool | None = None
+    setpoint: int | None = None
+    temp: int | None = None
+    samples: deque[tuple[float, float]] = field(default_factory=deque, repr=False)
+    polls: int = 0
+    failed: int = 0
+    last: Decision | None = None
+
+    def slope(self) -> float | None:
+        """
+        Least-squares dps 3 slope over the kept samples, in degrees per minute.
+        """
+        n = len(self.samples)
+        if n < 2:
+            return None
+        t0 = self.samples[0][0]
+        sx = sy = sxx = sxy = 0.0
+        for t, y in self.samples:
+            x = t - t0
+            sx += x
+            sy += y
+            sxx += x * x
+            sxy += x * y
+        den = n * sxx - sx * sx
+        if den <= 0:
+            return None
+        return (n * sxy - sx * sy) / den * 60.0
+
+
+class PollScheduler:
+    def __init__(
+        self,
+        config: SchedulerConfig | None = None,
+        on_decision: Callable[[Decision], None] | None = None,
+        rng: random.Random | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.config = config or SchedulerConfig()
+        self.on_decision = on_decision
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self.devices: dict[str, DeviceSchedule] = {}
+        self.decisions: deque[Decision] = deque(maxlen=1000)
+
+    def add(self, name: str) -> None:
+        if name not in self.devices:
+            # Spread the first polls over the first second instead of all at t=0.
+            self.devices[name] = DeviceSchedule(name, next_at=self.clock() + self.rng.random())
+
+    def due(self, now: float | None = None, exclude: Collection[str] = ()) -> list[str]:
+        """
+        Devices whose poll is due, leaving out `exclude` (e.g. polls still in flight).
+        """
+        now = self.clock() if now is None else now
+        return [d.name for d in self.devices.values() if d.next_at <= now and d.name not in exclude]
+
+    def wait_time(self, now: float | None = None, exclude: Collection[str] = ()) -> float:
+        """
+        Seconds until the next device outside `exclude` is due (0 if one already is).
+        """
+        pending = [d.next_at for d in self.devices.values() if d.name not in exclude]
+        if not pending:
+            return self.config.idle_interval
+        now = self.clock() if now is None else now
+        return max(0.0, min(pending) - now)
+
+    def note_request(self, name: str, now: float | None = None) -> None:
+        """
+        Counts a request made outside the scheduler (a write, another reader) against the rate cap.
+        """
+        d = self.devices[name]
+        d.last_request = self.clock() if now is None else now
+        d.next_at = max(d.next_at, d.last_request + 1.0 / self.config.max_rate)
+
+    def note_poll(self, name: str, snapshot: DpsSnapshot, now: float | None = None) -> Decision:
+        now = self.clock() if now is None else now
+        d = self.devices[name]
+        d.failures = 0
+        d.polls += 1
+        d.last_request = now
+        if snapshot.heater is not None:
+            d.heater = bool(snapshot.heater)
+        if snapshot.setpoint is not None:
+            d.setpoint = snapshot.setpoint
+        if snapshot.temp is not None:
+            d.temp = snapshot.temp
+            d.samples.append((now, float(snapshot.temp)))
+        while d.samples and now - d.samples[0][0] > self.config.slope_window:
+            d.samples.popleft()
+        interval, reason = self._classify(d)
+        return self._schedule(d, now, interval, reason)
+
+    def note_failure(self, name: str, error: str = "", now: float | None = None) -> Decision:
+        now = self.clock() if now is None else now
+        d = self.devices[name]
+        d.failures += 1
+        d.failed += 1
+        d.last_request = now
+        cfg = self.config
+        interval = min(cfg.max_backoff, cfg.backoff_base * 2 ** min(d.failures - 1, 32))  # no float overflow
+        reason = f"failing x{d.failures}" + (f": {error}" if error else "")
+        return self._schedule(d, now, interval, reason)
+
+    def _classify(self, d: DeviceSchedule) -> tuple[float, str]:
+        cfg = self.config
+        slope = d.slope()
+        rising = slope is not None and slope > cfg.slope_threshold
+        falling = slope is not None and slope < -cfg.slope_threshold
+        if d.heater:
+            if d.setpoint is None or d.temp is None:
+                return (cfg.heat_interval, "heating") if rising else (cfg.hold_interval, "holding")
+            if d.temp >= d.setpoint:
+                return cfg.hold_interval, "holding"
+            if d.setpoint - d.temp <= cfg.near_band and rising:
+                return cfg.near_interval, "near target"
+            return cfg.heat_interval, "heating"
+        if falling:
+            return cfg.cool_interval, "cooling"
+        return cfg.idle_interval, "idle"
+
+    def _schedule(self, d: DeviceSchedule, now: float, interval: float, reason: str) -> Decision:
+        cfg = self.config
+        if cfg.jitter > 0:
+            interval *= 1.0 + self.rng.uniform(-cfg.jitter, cfg.jitter)
+        interval = max(interval, 1.0 / cfg.max_rate)
+        d.next_at = now + interval
+        decision = Decision(d.name, now, interval, reason, d.slope())
+        d.last = decision
+        self.decisions.append(decision)
+        if self.on_decision is not None:
+            self.on_decision(decision)
+        return decision
+
+    def stats(self) -> dict[str, dict[str, object]]:
+        return {
+            d.name: {
+                "polls": d.polls,
+                "failed": d.failed,
+                "failures": d.failures,
+                "interval": round(d.last.interval, 2) if d.last else None,
+                "reason": d.last.reason if d.last else None,
+                "slope": d.slope(),
+            }
+            for d in self.devices.values()
+        }
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Long-lived LAN session to a SaunaLogic controller (TCP/6668, Tuya 55aa framing).
+
+Instead of connect -> Type-10 -> read -> close for every poll/command, one socket is kept open:
+- the captured Type-10 DP query doubles as the handshake (its response is the first snapshot)
+- a background thread reads frames and sends cmd=9 heartbeats (24-byte frames) when idle
+- Type-10 snapshot queries and Type-7 writes share the connection; responses are routed by cmd
+- on any socket error the session reconnects (with handshake) and retries the request once
+- write_dps() sends any dict of dps in one Type-7 frame; with write_window > 0, writes from several
+  threads that arrive within the window are merged (later values win) into a single frame
+- Type-8 telemetry pushes are decrypted and merged into `snapshot` (a sauna_dps.DpsSnapshot;
+  `state` is its dict form); subscribers get only the dps that changed, never an unchanged state.
+  With watch() the session reconnects on its own and resyncs `state` from the Type-10 handshake,
+  so temperature updates arrive as the device pushes them instead of by polling
+- with sauna_metrics enabled, connect/send/first_byte/reassembly times and the outcome of every
+  query ("query") and write ("write") are recorded; with a sauna_trace sink each query/write is a
+  span over its connect/send/decrypt spans, and each chunk the reader thread handles is a "recv" span
+
+Usage:
+  with SaunaSession("<DEVICE_IP>", "<LOCAL_KEY>", dev_id="<DEV_ID>") as s:
+      snap = s.query_snapshot()
+      s.write_dps({"1": True, "4": "ONLY_TRAD"})
+
+  s = SaunaSession("<DEVICE_IP>", "<LOCAL_KEY>")
+  s.subscribe(lambda delta, state: print(delta))
+  s.watch()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import queue
+import select
+import socket
+import sys
+import threading
+import time
+import traceback
+from typing import Any, AsyncIterator, Callable, TypeVar
+
+from sauna_crypto import aes_128_ecb_encrypt
+from sauna_dps import DpsSnapshot
+from sauna_frame import (
+    DP_QUERY_REQ,
+    FrameDecoder,
+    TYPE7_PREFIX_15,
+    build_dps_write_json,
+    build_frame,
+    decrypt_frame_dps,
+    decrypt_frame_json,
+    write_u32_be,
+)
+from sauna_metrics import METRICS, error_label
+from sauna_trace import TRACE, record
+from sauna_trace import span as trace_span
+
+CMD_WRITE = 7
+CMD_TELEMETRY = 8
+CMD_HEARTBEAT = 9
+CMD_DP_QUERY = 10
+
+T = TypeVar("T")
+DpsCallback = Callable[[dict[str, Any], dict[str, Any]], None]
+
+
+class SessionError(Exception):
+    pass
+
+
+class SaunaSession:
+    def __init__(
+        self,
+        host: str,
+        local_key: str,
+        dev_id: str = "",
+        uid: str = "",
+        port: int = 6668,
+        timeout: float = 2.0,
+        heartbeat_interval: float = 10.0,
+        write_window: float = 0.0,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.local_key = local_key
+        self.dev_id = dev_id
+        self.uid = uid
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.write_window = write_window
+
+        self._sock: socket.socket | None = None
+        self._reader: threading.Thread | None = None
+        self._closing = False
+        self._conn_lock = threading.RLock()  # connect/reconnect
+        self._send_lock = threading.Lock()
+        self._req_locks = {CMD_DP_QUERY: threading.Lock(), CMD_WRITE: threading.Lock()}
+        self._responses: dict[int, queue.Queue[bytes]] = {
+            CMD_DP_QUERY: queue.Queue(),
+            CMD_WRITE: queue.Queue(),
+        }
+        self._handshake_snapshot: dict[str, Any] | None = None
+        self._last_tx = 0.0
+        self._rx_at: dict[int, float] = {}  # cmd -> monotonic time the last such frame started arriving
+        self._seq = int(time.time() * 1000) & 0xFFFF
+        self.reconnects = 0
+        self.writes_sent = 0
+        self.writes_coalesced = 0
+        self._batch_lock = threading.Lock()
+        self._batch: _PendingWrite | None = None
+
+        # Merged dps state (Type-10 snapshots + Type-8 deltas) and its subscribers.
+        self.snapshot = DpsSnapshot()
+        self.state_at = 0.0  # wall time of the last snapshot/push, changed or not
+        self.pushes = 0
+        self._state_lock = threading.Lock()
+        self._subscribers: list[DpsCallback] = []
+        self._watcher: threading.Thread | None = None
+        self._watching = False
+        self._watch_stop = threading.Event()
+
+    # ---- lifecycle ----
+    def __enter__(self) -> SaunaSession:
+        self.connect()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    @property
+    def state(self) -> dict[str, Any]:
+        with self._state_lock:
+            return self.snapshot.to_dps()
+
+    def connect(self) -> None:
+        with self._conn_lock:
+            if self._sock is not None:
+                return
+            self._closing = False
+            t0 = time.monotonic()
+            s = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            if METRICS.enabled:
+                METRICS.phase_seconds.observe(time.monotonic() - t0, "connect")
+            if TRACE.enabled:
+                record("connect", time.perf_counter() - (time.monotonic() - t0), host=self.host)
+            s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for q in self._responses.values():
+                _drain(q)
+            self._sock = s
+            self._last_tx = time.monotonic()
+            self._reader = threading.Thread(target=self._read_loop, args=(s,), name="sauna-session", daemon=True)
+            self._reader.start()
+            try:
+                # Handshake: the device expects a Type-10 query first; keep its answer as the first snapshot.
+                self._handshake_snapshot = self._request(CMD_DP_QUERY, DP_QUERY_REQ)
+            except Exception:
+                self._drop(s)
+                raise
+            if self._handshake_snapshot is None:
+                self._drop(s)
+                raise SessionError("Handshake timeout: no cmd=10 response.")
+            self._apply_dps(self._handshake_snapshot.get("dps"), snapshot=True)
+
+    def close(self) -> None:
+        with self._conn_lock:
+            self._watching = False
+            self._watch_stop.set()
+            self._closing = True
+            s = self._sock
+            if s is not None:
+                self._drop(s)
+            reader = self._reader
+            watcher = self._watcher
+        for t in (reader, watcher):
+            if t is not None and t is not threading.current_thread():
+                t.join(timeout=self.timeout)
+
+    def _drop(self, s: socket.socket) -> None:
+        if self._sock is s:
+            self._sock = None
+        try:
+            s.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            s.close()
+        except OSError:
+            pass
+
+    # ---- public requests ----
+    def query_snapshot(self) -> dict[str, Any]:
+        """
+        Returns the decrypted Type-10 JSON ({"devId":..,"dps":{..}}) over the open connection.
+        """
+        t0 = time.monotonic()
+        try:
+            with trace_span("query", host=self.host), self._req_locks[CMD_DP_QUERY]:
+                j = self._with_reconnect(self._query_once)
+            if j is None:
+                raise SessionError("No DP snapshot response received.")
+        except (OSError, SessionError) as ex:
+            if METRICS.enabled:
+                METRICS.request_done("query", time.monotonic() - t0, error_label(ex))
+            raise
+        if METRICS.enabled:
+            METRICS.request_done("query", time.monotonic() - t0)
+        self._apply_dps(j.get("dps"), snapshot=True)
+        return j
+
+    def write_dps(self, dps: dict[str, Any]) -> bool:
+        """
+        Sends one Type-7 write carrying all of `dps`. Returns True if the device ACKed it
+        (some firmwares don't ACK; a missing ACK is not an error).
+
+        With write_window > 0 the first caller waits that long and sends everything written
+        meanwhile as one frame; every merged caller gets the same result.
+        """
+        if not self.dev_id:
+            raise SessionError("DevId empty.")
+        if self.write_window <= 0:
+            return self._send_write(dict(dps))
+
+        with self._batch_lock:
+            batch = self._batch
+            leader = batch is None
+            if batch is None:
+                batch = self._batch = _PendingWrite()
+            else:
+                self.writes_coalesced += 1
+            batch.dps.update(dps)
+        if not leader:
+            batch.done.wait()
+            if batch.error is not None:
+                raise batch.error
+            return batch.ok
+
+        time.sleep(self.write_window)
+        with self._batch_lock:
+            self._batch = None
+        try:
+            batch.ok = self._send_write(batch.dps)
+        except Exception as ex:
+            batch.error = ex
+            raise
+        finally:
+            batch.done.set()
+        return batch.ok
+
+    def _send_write(self, dps: dict[str, Any]) -> bool:
+        t0 = time.monotonic()
+        try:
+            with trace_span("write", host=self.host, dps=len(dps)) as sp, self._req_locks[CMD_WRITE]:
+                ok = self._with_reconnect(lambda: self._write_once(dps))
+                sp.set(acked=ok)
+        except (OSError, SessionError) as ex:
+            if METRICS.enabled:
+                METRICS.request_done("write", time.monotonic() - t0, error_label(ex))
+            raise
+        if METRICS.enabled:
+            METRICS.request_done("write", time.monotonic() - t0, None if ok else "no ACK")
+        self.writes_sent += 1
+        return ok
+
+    # ---- telemetry subscription ----
+    def subscribe(self, callback: DpsCallback) -> Callable[[], None]:
+        """
+        Registers callback(delta, state) for dps changes from Type-8 pushes, Type-10 snapshots and
+        reconnect handshakes. Runs on the reader thread, so keep it short; an exception it raises is
+        printed to stderr and doesn't affect the connection. Returns an unsubscribe function.
+        """
+        with self._state_lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._state_lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    async def updates(self) -> AsyncIterator[tuple[dict[str, Any], dict[str, Any]]]:
+        """
+        Async iterator of (delta, state) for the same events as subscribe().
+        """
+        loop = asyncio.get_running_loop()
+        q: asyncio.Queue[tuple[dict[str, Any], dict[str, Any]]] = asyncio.Queue()
+        unsubscribe = self.subscribe(lambda d, st: loop.call_soon_threadsafe(q.put_nowait, (d, st)))
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            unsubscribe()
+
+    def watch(self, reconnect_delay: float = 2.0) -> None:
+        """
+        Keeps the session connected in the background until close(): after a drop it reconnects
+        and the Type-10 handshake resyncs `state` (the only snapshot taken).
+        """
+        with self._conn_lock:
+            if self._watching:
+                return
+            self._watching = True
+            self._watch_stop.clear()
+            self._watcher = threading.Thread(
+                target=self._watch_loop, args=(reconnect_delay,), name="sauna-watch", daemon=True
+            )
+            self._watcher.start()
+
+    def _watch_loop(self, reconnect_delay: float) -> None:
+        connected_before = False
+        while True:
+            with self._conn_lock:
+                if not self._watching:
+                    return
+                try:
+                    self.connect()
+                    reader = self._reader
+                except (OSError, SessionError):
+                    reader = None
+            if reader is None:
+                if self._watch_stop.wait(reconnect_delay):
+                    return
+                continue
+            if connected_before:
+                self.reconnects += 1
+            connected_before = True
+            reader.join()
+
+    def _apply_dps(self, dps: Any, snapshot: bool = False) -> None:
+        if not isinstance(dps, dict):
+            return
+        with self._state_lock:
+            self.state_at = time.time()
+            if snapshot:
+                # A full snapshot replaces the state; dps it no longer reports come through as None.
+                new = DpsSnapshot.from_dps(dps)
+                delta = new.diff(self.snapshot)
+                self.snapshot = new
+            else:
+                delta = self.snapshot.apply(dps)
+            if not delta:
+                return
+            state = self.snapshot.to_dps()
+            subscribers = list(self._subscribers)
+        for cb in subscribers:
+            # On the reader thread: a failing callback must not drop the connection.
+            try:
+                cb(delta, state)
+            except Exception:
+                print(f"sauna_session: subscriber {cb!r} failed:", file=sys.stderr)
+                traceback.print_exc()
+
+    # ---- internals ----
+    def _with_reconnect(self, fn: Callable[[], T]) -> T:
+        last: Exception | None = None
+        for attempt in range(2):
+            try:
+                self.connect()
+                return fn()
+            except (OSError, SessionError) as ex:
+                last = ex
+                s = self._sock
+                if s is not None:
+                    self._drop(s)
+                if attempt == 0:
+                    self.reconnects += 1
+        raise SessionError(str(last) if last else "Request failed.")
+
+    def _query_once(self) -> dict[str, Any] | None:
+        j, self._handshake_snapshot = self._handshake_snapshot, None
+        if j is not None:
+            return j
+        return self._request(CMD_DP_QUERY, DP_QUERY_REQ)
+
+    def _write_once(self, dps: dict[str, Any]) -> bool:
+        body = build_dps_write_json(self.dev_id, self.uid or None, dps)
+        ct = aes_128_ecb_encrypt(body.encode("utf-8"), self.local_key)
+        prefix = bytearray(TYPE7_PREFIX_15)
+        write_u32_be(prefix, 11, int(time.time() * 1000) & 0xFFFFFFFF)
+        frame = build_frame(CMD_WRITE, ct, bytes(prefix), seq=self._next_seq())
+        self._handshake_snapshot = None  # stale once the write lands
+        _drain(self._responses[CMD_WRITE])
+        t_send = self._send(frame)
+        try:
+            ack = self._responses[CMD_WRITE].get(timeout=self.timeout)
+        except queue.Empty:
+            return False
+        if not ack:
+            raise SessionError("Connection closed by device.")
+        self._observe_first_byte(CMD_WRITE, t_send)
+        return True
+
+    def _request(self, cmd: int, frame: bytes) -> dict[str, Any] | None:
+        q = self._responses[cmd]
+        _drain(q)
+        t_send = self._send(frame)
+        deadline = t_send + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                resp = q.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if not resp:
+                raise SessionError("Connection closed by device.")
+            self._observe_first_byte(cmd, t_send)
+            j = decrypt_frame_json(resp, self.local_key)
+            if j is not None:
+                return j
+
+    def _send(self, frame: bytes) -> float:
+        """
+        Sends a whole frame; returns the monotonic time the send started.
+        """
+        s = self._sock
+        if s is None:
+            raise SessionError("Not connected.")
+        with self._send_lock:
+            t0 = time.monotonic()
+            s.sendall(frame)
+            self._last_tx = time.monotonic()
+        if METRICS.enabled:
+            METRICS.phase_seconds.observe(self._last_tx - t0, "send")
+        if TRACE.enabled:
+            record(
+                "send",
+                time.perf_counter() - (time.monotonic() - t0),
+                cmd=int.from_bytes(frame[8:12], "big"),
+                seq=int.from_bytes(frame[4:8], "big"),
+                bytes=len(frame),
+            )
+        return t0
+
+    def _observe_first_byte(self, cmd: int, t_send: float) -> None:
+        if METRICS.enabled:
+            rx_at = self._rx_at.get(cmd, 0.0)
+            if rx_at >= t_send:
+                METRICS.phase_seconds.observe(rx_at - t_send, "first_byte")
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        return self._seq
+
+    def _heartbeat(self) -> None:
+        self._send(build_frame(CMD_HEARTBEAT, b"", b"", seq=self._next_seq()))
+
+    def _dispatch(self, frame: bytes) -> None:
+        cmd = int.from_bytes(frame[8:12], "big")
+        if cmd == CMD_TELEMETRY:
+            dps = decrypt_frame_dps(frame, self.local_key)
+            if dps is not None:
+                self.pushes += 1
+                self._apply_dps(dps)
+            return
+        q = self._responses.get(cmd)
+        if q is not None:
+            q.put_nowait(frame)
+
+    def _read_loop(self, s: socket.socket) -> None:
+        decoder = FrameDecoder()
+        rx_at = time.monotonic()
+        try:
+            while not self._closing and self._sock is s:
+                wait = max(0.0, self._last_tx + self.heartbeat_interval - time.monotonic())
+                r, _, _ = select.select([s], [], [], wait)
+                if not r:
+                    if time.monotonic() - self._last_tx >= self.heartbeat_interval:
+                        self._heartbeat()
+                    continue
+                with trace_span("recv") as sp:
+                    data = s.recv(4096)
+                    sp.set(bytes=len(data))
+                    if not data:
+                        break
+                    if not METRICS.enabled:
+                        for frame in decoder.feed(data):
+                            self._dispatch(bytes(frame))
+                        continue
+                    # A frame starts arriving with the first chunk fed into an empty decoder.
+                    if not len(decoder):
+                        rx_at = time.monotonic()
+                    for frame in decoder.feed(data):
+                        now = time.monotonic()
+                        METRICS.phase_seconds.observe(now - rx_at, "reassembly")
+                        self._rx_at[int.from_bytes(frame[8:12], "big")] = rx_at
+                        self._dispatch(bytes(frame))
+                        rx_at = now
+        except (OSError, ValueError, SessionError):
+            pass
+        finally:
+            self._drop(s)
+            # Wake any waiter so it reconnects instead of sitting out its timeout.
+            for q in self._responses.values():
+                q.put_nowait(b"")
+
+
+class _PendingWrite:
+    __slots__ = ("dps", "done", "ok", "error")
+
+    def __init__(self) -> None:
+        self.dps: dict[str, Any] = {}
+        self.done = threading.Event()
+        self.ok = False
+        self.error: Exception | None = None
+
+
+def _drain(q: queue.Queue[bytes]) -> None:
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Local SL-2 controller simulator on TCP/6668 (Tuya 55aa framing, AES-128-ECB with a test localKey).
+
+Lets the poll/command tools run (and be load-tested) without a sauna on the LAN:
+- Type-10 DP query (the captured DP_QUERY_REQ_HEX) -> Type-10 snapshot {"devId":..,"dps":{..}}
+- Type-7 write -> 28-byte ACK; the written dps are applied to the device state
+- cmd=9 heartbeat -> 28-byte reply
+- every --push-interval seconds a Type-8 telemetry frame {"devId":..,"dps":{"3":<temp>},"t":..}
+  goes to every connection (encrypted once per tick and shared)
+- with --broadcast-interval, a 3.3-style UDP/6667 discovery broadcast (gwId + ip) like the SL-2 sends
+- while the heater (dps 1) is on, the current temp (dps 3) climbs toward the setpoint (dps 2);
+  when off it falls back to ambient
+
+One asyncio Protocol per connection and no per-connection tasks, so thousands of concurrent
+connections are fine (raise `ulimit -n` first).
+
+Usage:
+  python3 saunalogic_extract/sauna_simulator.py --port 6668 --key 0123456789abcdef
+  python3 saunalogic_extract/sauna_live_poll.py --host 127.0.0.1 --key 0123456789abcdef
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import socket
+import time
+from typing import Any
+
+from sauna_crypto import aes_128_ecb_decrypt, aes_128_ecb_encrypt
+from sauna_discovery import encode_broadcast_v33
+from sauna_frame import FrameDecoder, build_frame, locate_ciphertext, write_u32_be
+
+CMD_WRITE = 7
+CMD_TELEMETRY = 8
+CMD_HEARTBEAT = 9
+CMD_DP_QUERY = 10
+
+RETCODE_OK = b"\x00\x00\x00\x00"
+TEST_LOCAL_KEY = "0123456789abcdef"
+TEST_DEV_ID = "eb0000000000000000test"
+
+# Snapshot as captured (docs/saunalogic-pcap-notes.md), heater off at 73F.
+DEFAULT_DPS: dict[str, Any] = {
+    "1": False,
+    "2": 194,
+    "3": 73,
+    "4": "ONLY_TRAD",
+    "9": "1",
+    "10": 0,
+    "11": 0,
+    "101": "0",
+    "103": False,
+    "105": "1",
+    "106": 0,
+    "107": "F",
+}
+
+
+class SimDevice:
+    """
+    Device state shared by all connections.
+    """
+
+    def __init__(self, local_key: str, dev_id: str, ambient: int = 73, heat_rate: float = 1.0) -> None:
+        self.local_key = local_key
+        self.dev_id = dev_id
+        self.ambient = ambient
+        self.heat_rate = heat_rate  # degrees per push tick
+        self.dps: dict[str, Any] = dict(DEFAULT_DPS, **{"3": ambient})
+        self._temp = float(ambient)
+        self._push_seq = 0xDDAC  # counter carried in the Type-8 version header (as captured)
+        self.stats = {"connections": 0, "open": 0, "rx_frames": 0, "tx_frames": 0, "writes": 0, "bad_frames": 0}
+
+    def encrypt_json(self, obj: dict[str, Any]) -> bytes:
+        return aes_128_ecb_encrypt(json.dumps(obj, separators=(",", ":")).encode("utf-8"), self.local_key)
+
+    def snapshot_frame(self, seq: int) -> bytes:
+        ct = self.encrypt_json({"devId": self.dev_id, "dps": self.dps})
+        return build_frame(CMD_DP_QUERY, ct, RETCODE_OK, seq=seq)
+
+    def apply_write(self, frame: bytes) -> bool:
+        body = frame[16:]
+        span = locate_ciphertext(CMD_WRITE, body)
+        if span is None:
+            return False
+        pt = aes_128_ecb_decrypt(body[span[0] : span[1]], self.local_key)
+        try:
+            dps = json.loads(pt)["dps"] if pt is not None else None
+        except (ValueError, KeyError, TypeError):
+            dps = None
+        if not isinstance(dps, dict):
+            return False
+        self.dps.update(dps)
+        self.stats["writes"] += 1
+        return True
+
+    def tick(self) -> bytes:
+        """
+        Advances the temperature model and returns the Type-8 telemetry frame for this tick.
+        """
+        target = float(self.dps.get("2", self.ambient)) if self.dps.get("1") else float(self.ambient)
+        if self._temp < target:
+            self._temp = min(target, self._temp + self.heat_rate)
+        elif self._temp > target:
+            self._temp = max(target, self._temp - self.heat_rate / 2)
+        self.dps["3"] = int(round(self._temp))
+
+        self._push_seq = (self._push_seq + 1) & 0xFFFFFFFF
+        header = bytearray(RETCODE_OK + b"3.3" + bytes(12))
+        write_u32_be(header, 11, self._push_seq)
+        write_u32_be(header, 15, 1)
+        ct = self.encrypt_json({"devId": self.dev_id, "dps": {"3": self.dps["3"]}, "t": int(time.time())})
+        return build_frame(CMD_TELEMETRY, ct, bytes(header), seq=0)
+
+
+class SimProtocol(asyncio.Protocol):
+    def __init__(self, device: SimDevice, conns: set[SimProtocol]) -> None:
+        self.device = device
+        self.conns = conns
+        self.decoder = FrameDecoder()
+        self.transport: asyncio.Transport | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+        self.conns.add(self)
+        self.device.stats["connections"] += 1
+        self.device.stats["open"] += 1
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.conns.discard(self)
+        self.device.stats["open"] -= 1
+        self.transport = None
+
+    def data_received(self, data: bytes) -> None:
+        dev = self.device
+        crc_before = self.decoder.crc_errors
+        for frame in self.decoder.feed(data):
+            dev.stats["rx_frames"] += 1
+            seq = int.from_bytes(frame[4:8], "big")
+            cmd = int.from_bytes(frame[8:12], "big")
+            if cmd == CMD_DP_QUERY:
+                self.send(dev.snapshot_frame(seq))
+            elif cmd == CMD_HEARTBEAT:
+                self.send(build_frame(CMD_HEARTBEAT, RETCODE_OK, b"", seq=seq))
+            elif cmd == CMD_WRITE:
+                if dev.apply_write(bytes(frame)):
+                    self.send(build_frame(CMD_WRITE, RETCODE_OK, b"", seq=seq))
+                else:
+                    dev.stats["bad_frames"] += 1
+        dev.stats["bad_frames"] += self.decoder.crc_errors - crc_before
+
+    def send(self, frame: bytes) -> None:
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(frame)
+            self.device.stats["tx_frames"] += 1
+
+
+_background: set[asyncio.Task[None]] = set()
+
+
+def _spawn(coro: Any) -> None:
+    # The loop only keeps weak references to tasks.
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _push_loop(device: SimDevice, conns: set[SimProtocol], interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        frame = device.tick()
+        for p in list(conns):
+            p.send(frame)
+
+
+async def _broadcast_loop(device: SimDevice, announce_ip: str, addr: tuple[str, int], interval: float) -> None:
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    s.setblocking(False)
+    info = {
+        "ip": announce_ip,
+        "gwId": device.dev_id,
+        "active": 2,
+        "ability": 0,
+        "mode": 0,
+        "encrypt": True,
+        "productKey": "simulator",
+        "version": "3.3",
+    }
+    datagram = encode_broadcast_v33(info)
+    try:
+        while True:
+            try:
+                s.sendto(datagram, addr)
+            except OSError:
+                pass
+            await asyncio.sleep(interval)
+    finally:
+        s.close()
+
+
+async def _stats_loop(device: SimDevice, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        s = device.stats
+        print(
+            f"open={s['open']} total={s['connections']} rx={s['rx_frames']} tx={s['tx_frames']} "
+            f"writes={s['writes']} bad={s['bad_frames']} dps={json.dumps(device.dps, separators=(',', ':'))}",
+            flush=True,
+        )
+
+
+async def serve(
+    host: str = "127.0.0.1",
+    port: int = 6668,
+    local_key: str = TEST_LOCAL_KEY,
+    dev_id: str = TEST_DEV_ID,
+    push_interval: float = 5.0,
+    backlog: int = 4096,
+) -> tuple[asyncio.AbstractServer, SimDevice]:
+    """
+    Starts the simulator (Type-8 pushes included) and returns (server, device); port 0 picks a free port.
+    """
+    device = SimDevice(local_key, dev_id)
+    conns: set[SimProtocol] = set()
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: SimProtocol(device, conns), host, port, backlog=backlog)
+    if push_interval > 0:
+        _spawn(_push_loop(device, conns, push_interval))
+    return server, device
+
+
+async def _amain(args: argparse.Namespace) -> int:
+    server, device = await serve(args.bind, args.port, args.key, args.dev_id, args.push_interval, args.backlog)
+    addrs = ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in server.sockets)
+    print(f"SL-2 simulator on {addrs} devId={device.dev_id} key={device.local_key}", flush=True)
+    if args.stats_interval > 0:
+        _spawn(_stats_loop(device, args.stats_interval))
+    if args.broadcast_interval > 0:
+        announce_ip = args.announce_ip or server.sockets[0].getsockname()[0]
+        _spawn(_broadcast_loop(device, announce_ip, (args.broadcast_addr, args.broadcast_port), args.broadcast_interval))
+    async with server:
+        await server.serve_forever()
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bind", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6668)
+    ap.add_argument("--key", default=TEST_LOCAL_KEY, help="16-char test localKey")
+    ap.add_argument("--dev-id", default=TEST_DEV_ID)
+    ap.add_argument("--push-interval", type=float, default=5.0, help="Type-8 telemetry period (0 = off)")
+    ap.add_argument("--stats-interval", type=float, default=10.0, help="print counters every N seconds (0 = off)")
+    ap.add_argument("--backlog", type=int, default=4096)
+    ap.add_argument("--broadcast-interval", type=float, default=0.0, help="UDP discovery broadcast period (0 = off)")
+    ap.add_argument("--broadcast-addr", default="255.255.255.255")
+    ap.add_argument("--broadcast-port", type=int, default=6667)
+    ap.add_argument("--announce-ip", help="ip to announce (default: the bind address)")
+    args = ap.parse_args()
+    if len(args.key) != 16:
+        ap.error("--key must be 16 characters")
+    try:
+        return asyncio.run(_amain(args))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
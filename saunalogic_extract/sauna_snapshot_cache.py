@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Single-flight, max-age cache in front of the Type-10 snapshot poll.
+
+The controller copes badly with back-to-back connections, and several readers (dashboards, the
+stability script, the gateway) may want the same snapshot at once. SnapshotCache.get():
+- returns the cached snapshot if it is younger than max_age
+- otherwise joins the poll already in flight, or becomes the one caller that polls; everyone
+  waiting gets that one result (or its exception)
+- with allow_stale=True, returns the last snapshot right away whatever its age (check .age) and
+  refreshes in the background, and falls back to it if the refresh fails
+
+So the device sees at most one poll per max_age however many readers there are. The fetch is any
+callable (SaunaSession.query_snapshot, or a one-shot poll via one_shot_fetch()) that returns the
+snapshot or raises. Every reader gets the same value object, so treat it as read-only.
+
+Usage:
+  cache = SnapshotCache(session.query_snapshot, max_age=2.0)
+  snap = cache.get()                         # CachedSnapshot: .value, .age, .fetched_at
+  snap = cache.get(allow_stale=True)         # never waits once anything is cached
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class CachedSnapshot(Generic[T]):
+    """
+    A fetched value with its fetch time (fetched_at is wall clock; age is monotonic seconds).
+    """
+
+    __slots__ = ("value", "fetched_at", "_mono")
+
+    def __init__(self, value: T) -> None:
+        self.value = value
+        self.fetched_at = time.time()
+        self._mono = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self._mono
+
+
+class _Flight(Generic[T]):
+    __slots__ = ("generation", "done", "result", "error")
+
+    def __init__(self, generation: int) -> None:
+        self.generation = generation
+        self.done = threading.Event()
+        self.result: CachedSnapshot[T] | None = None
+        self.error: BaseException | None = None
+
+
+class SnapshotCache(Generic[T]):
+    def __init__(self, fetch: Callable[[], T], max_age: float = 1.0) -> None:
+        self.fetch = fetch
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entry: CachedSnapshot[T] | None = None
+        self._flight: _Flight[T] | None = None
+        self._generation = 0  # bumped by invalidate(); a poll started before it isn't cached
+        self.stats = {"reads": 0, "hits": 0, "joined": 0, "fetches": 0, "stale": 0, "errors": 0}
+
+    @property
+    def last(self) -> CachedSnapshot[T] | None:
+        return self._entry
+
+    def get(self, max_age: float | None = None, allow_stale: bool = False) -> CachedSnapshot[T]:
+        limit = self.max_age if max_age is None else max_age
+        with self._lock:
+            self.stats["reads"] += 1
+            entry = self._entry
+            if entry is not None and entry.age <= limit:
+                self.stats["hits"] += 1
+                return entry
+            flight = self._flight
+            # A poll started before invalidate() may return pre-invalidate state: don't join it.
+            leader = flight is None or flight.generation != self._generation
+            if leader:
+                flight = self._flight = _Flight(self._generation)
+                self.stats["fetches"] += 1
+            else:
+                self.stats["joined"] += 1
+            if entry is not None and allow_stale:
+                self.stats["stale"] += 1
+                if leader:
+                    threading.Thread(target=self._run, args=(flight,), name="sauna-snapshot", daemon=True).start()
+                return entry
+        assert flight is not None
+        if leader:
+            self._run(flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            if allow_stale and self._entry is not None:
+                return self._entry
+            raise flight.error
+        assert flight.result is not None
+        return flight.result
+
+    def invalidate(self) -> None:
+        """
+        Forgets the cached snapshot (e.g. after a write), so the next get() polls.
+        """
+        with self._lock:
+            self._entry = None
+            self._generation += 1
+
+    def _run(self, flight: _Flight[T]) -> None:
+        try:
+            flight.result = CachedSnapshot(self.fetch())
+        except BaseException as ex:  # handed to every waiter
+            flight.error = ex
+        with self._lock:
+            if flight.result is not None:
+                if flight.generation == self._generation:
+                    self._entry = flight.result
+            else:
+                self.stats["errors"] += 1
+            if self._flight is flight:
+                self._flight = None
+        flight.done.set()
+
+
+def one_shot_fetch(host: str, local_key: str, port: int = 6668, timeout: float = 2.0) -> Callable[[], dict[str, Any]]:
+    """
+    Fetch function polling on a fresh socket (sauna_live_poll.poll_snapshot); raises SessionError.
+    """
+    from sauna_live_poll import poll_snapshot
+    from sauna_session import SessionError
+
+    def fetch() -> dict[str, Any]:
+        got, _phases, err = poll_snapshot(host, local_key, port=port, timeout=timeout)
+        if got is None:
+            raise SessionError(err or "No DP snapshot response received.")
+        return got
+
+    return fetch
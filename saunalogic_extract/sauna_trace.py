@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Trace spans around each SaunaLogic protocol step, plus a cProfile helper, for chasing single slow polls.
+
+sauna_metrics says how often polls are slow; a trace says why one particular poll took 3 s. With a
+sink installed, each step emits a span (name, trace/span/parent ids, wall start, duration, attrs):
+
+  poll / query / write       one-shot poll (sauna_live_poll) and session requests; the root span
+  connect, send, recv        socket steps (bytes; recv also frames, cmd, seq)
+  frame                      one frame found by FrameDecoder.feed / Frame.parse (cmd, seq, bytes)
+  build_frame                cmd, seq, bytes
+  decrypt_frame_json         cmd, seq, bytes, attempts (decrypts tried; 0 = plaintext cache hit), ok
+  decrypt_frame_dps          cmd, seq, bytes, path (cache / partial / full), ok
+
+Spans nest through a contextvar, so a poll's children share its trace_id on threads and in asyncio
+tasks alike (the session's reader thread starts its own traces). Sinks: JsonlSink (one JSON object
+per line), RingSink (last N spans in memory, grouped by trace()), TeeSink (both). With no sink
+(the default) span() returns a shared no-op and call sites check TRACE.enabled first.
+SAUNA_TRACE=<file> installs a JsonlSink at import.
+
+profile_to(path) runs a block under cProfile, dumps pstats to `path` and prints the top entries.
+
+Usage:
+  from sauna_trace import RingSink, set_sink, span
+  ring = RingSink(10000)
+  set_sink(ring)
+  ...
+  slow = max(ring.roots(), key=lambda s: s["duration"])
+  print(format_trace(ring.trace(slow["trace_id"])))
+"""
+
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Iterator, Protocol
+
+_ids = itertools.count(1)
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("sauna_span", default=None)
+
+
+class Sink(Protocol):
+    def emit(self, span: dict[str, Any]) -> None: ...
+
+
+class Tracer:
+    """
+    Holds the installed sink; `enabled` is what the call sites test.
+    """
+
+    def __init__(self) -> None:
+        self.sink: Sink | None = None
+        self.enabled = False
+
+    def set_sink(self, sink: Sink | None) -> None:
+        self.sink = sink
+        self.enabled = sink is not None
+
+
+TRACE = Tracer()
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "_t0", "attrs", "_token")
+
+    def __init__(self, name: str, attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_ids)
+        self.parent_id: int | None = None
+        self.trace_id = self.span_id
+        self.start = 0.0
+        self._t0 = 0.0
+        self._token: contextvars.Token[Span | None] | None = None
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> Span:
+        parent = _current.get()
+        if parent is not None:
+            self.parent_id = parent.span_id
+            self.trace_id = parent.trace_id
+        self._token = _current.set(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        duration = time.perf_counter() - self._t0
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None)  # exited in another context (e.g. a generator resumed elsewhere)
+        if exc is not None:
+            self.attrs["error"] = str(exc) or type(exc).__name__
+        sink = TRACE.sink
+        if sink is not None:
+            sink.emit(
+                {
+                    "name": self.name,
+                    "trace_id": self.trace_id,
+                    "span_id": self.span_id,
+                    "parent_id": self.parent_id,
+                    "start": self.start,
+                    "duration": duration,
+                    "thread": threading.current_thread().name,
+                    "attrs": self.attrs,
+                }
+            )
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> _NoopSpan:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attrs: Any) -> Span | _NoopSpan:
+    if not TRACE.enabled:
+        return NOOP_SPAN
+    return Span(name, attrs)
+
+
+def record(name: str, t0: float, **attrs: Any) -> None:
+    """
+    Emits a finished leaf span that started at perf_counter() time t0, under the current span.
+    For steps that can't be a with-block, such as the work between two yields of a generator.
+    """
+    sink = TRACE.sink
+    if sink is None:
+        return
+    now = time.perf_counter()
+    parent = _current.get()
+    span_id = next(_ids)
+    sink.emit(
+        {
+            "name": name,
+            "trace_id": parent.trace_id if parent is not None else span_id,
+            "span_id": span_id,
+            "parent_id": parent.span_id if parent is not None else None,
+            "start": time.time() - (now - t0),
+            "duration": now - t0,
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+        }
+    )
+
+
+def set_sink(sink: Sink | None) -> None:
+    TRACE.set_sink(sink)
+
+
+# ---- sinks ----
+class RingSink:
+    """
+    The last `capacity` spans in memory.
+    """
+
+    def __init__(self, capacity: int = 10000) -> None:
+        self._spans: deque[dict[str, Any]] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, span: dict[str, Any]) -> None:
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return list(self._spans)
+
+    def roots(self, name: str | None = None) -> list[dict[str, Any]]:
+        return [s for s in self.spans() if s["parent_id"] is None and (name is None or s["name"] == name)]
+
+    def trace(self, trace_id: int) -> list[dict[str, Any]]:
+        """
+        All spans of one trace, in start order.
+        """
+        return sorted((s for s in self.spans() if s["trace_id"] == trace_id), key=lambda s: (s["start"], s["span_id"]))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+
+class JsonlSink:
+    """
+    Appends one JSON object per span to `path`, line-buffered so a crash loses at most one span.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._f = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def emit(self, span: dict[str, Any]) -> None:
+        line = json.dumps(span, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if not self._f.closed:
+                self._f.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+
+class TeeSink:
+    def __init__(self, *sinks: Sink) -> None:
+        self.sinks = sinks
+
+    def emit(self, span: dict[str, Any]) -> None:
+        for s in self.sinks:
+            s.emit(span)
+
+
+def format_trace(spans: list[dict[str, Any]]) -> str:
+    """
+    One line per span, indented under its parent, with its offset from the root in ms.
+    """
+    if not spans:
+        return ""
+    depth: dict[int, int] = {}
+    t0 = spans[0]["start"]
+    lines = []
+    for s in spans:
+        d = depth[s["span_id"]] = depth.get(s["parent_id"], -1) + 1 if s["parent_id"] is not None else 0
+        attrs = " ".join(f"{k}={v}" for k, v in s["attrs"].items())
+        lines.append(
+            f"{(s['start'] - t0) * 1000.0:9.1f}ms {'  ' * d}{s['name']:<20} {s['duration'] * 1000.0:8.2f}ms  {attrs}"
+        )
+    return "\n".join(lines)
+
+
+# ---- profiling ----
+@contextmanager
+def profile_to(path: str, top: int = 20) -> Iterator[cProfile.Profile]:
+    """
+    Profiles the block with cProfile, writes the pstats dump to `path` (load it with
+    pstats.Stats(path) or snakeviz) and prints the `top` entries by cumulative time to stderr.
+    """
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield prof
+    finally:
+        prof.disable()
+        prof.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(top)
+        print(out.getvalue(), file=sys.stderr)
+        print("wrote profile", path, file=sys.stderr)
+
+
+if os.environ.get("SAUNA_TRACE"):
+    set_sink(JsonlSink(os.environ["SAUNA_TRACE"]))
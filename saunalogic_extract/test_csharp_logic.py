@@ -112,63 +112,48 @@ class SaunaTuyaFrame:
         if buffer is None or count < 16:
             return False, -1, 0
         
-        for i in range(offset, offset + count - 15):
-            if (buffer[i] == 0x00 and buffer[i+1] == 0x00 and 
-                buffer[i+2] == 0x55 and buffer[i+3] == 0xAA):
-                len_field = cls.read_u32_be(buffer, i + 12)
-                total = 16 + len_field
-                if total <= 0:
-                    continue
-                if i + total <= offset + count:
-                    return True, i, total
+        # Same scan order as the C# loop, but jump between prefix hits with find()
+        # instead of comparing byte by byte.
+        i = buffer.find(b"\x00\x00\x55\xaa", offset, offset + count)
+        while 0 <= i <= offset + count - 16:
+            len_field = cls.read_u32_be(buffer, i + 12)
+            total = 16 + len_field
+            if total > 0 and i + total <= offset + count:
+                return True, i, total
+            i = buffer.find(b"\x00\x00\x55\xaa", i + 1, offset + count)
         return False, -1, 0
 
 
 # ============================================================================
 # EXACT PORT OF SaunaCrypto.cs + SaunaAes128EcbPkcs7.cs
 # ============================================================================
-import subprocess
+from sauna_crypto import aes_128_ecb_encrypt, get_cipher, pkcs7_unpad
 
 class SaunaCrypto:
-    """Exact port of C# SaunaCrypto class - uses openssl for AES"""
+    """Exact port of C# SaunaCrypto class - AES via the shared in-process sauna_crypto module"""
     
     @staticmethod
     def aes_128_ecb_encrypt(local_key_ascii: str, plaintext: bytes) -> bytes:
-        """Exact port of Aes128EcbEncrypt with PKCS7 padding (via openssl)"""
+        """Exact port of Aes128EcbEncrypt with PKCS7 padding"""
         key = local_key_ascii.encode('ascii')
         if len(key) != 16:
             raise ValueError("localKey must be 16 ASCII bytes")
         
-        key_hex = key.hex()
-        p = subprocess.run(
-            ["openssl", "enc", "-aes-128-ecb", "-e", "-K", key_hex, "-nosalt"],
-            input=plaintext,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False,
-        )
-        if p.returncode != 0:
-            raise RuntimeError("openssl encrypt failed: " + p.stderr.decode("utf-8", "ignore"))
-        return p.stdout
+        return aes_128_ecb_encrypt(plaintext, local_key_ascii)
     
     @staticmethod
     def aes_128_ecb_decrypt(local_key_ascii: str, ciphertext: bytes) -> bytes:
-        """Exact port of Aes128EcbDecrypt with PKCS7 unpadding (via openssl)"""
+        """Exact port of Aes128EcbDecrypt with PKCS7 unpadding"""
         key = local_key_ascii.encode('ascii')
         if len(key) != 16:
             raise ValueError("localKey must be 16 ASCII bytes")
+        if len(ciphertext) == 0 or len(ciphertext) % 16 != 0:
+            raise ValueError("ciphertext length must be a multiple of 16")
         
-        key_hex = key.hex()
-        p = subprocess.run(
-            ["openssl", "enc", "-aes-128-ecb", "-d", "-K", key_hex, "-nosalt"],
-            input=ciphertext,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False,
-        )
-        if p.returncode != 0:
-            raise RuntimeError("openssl decrypt failed: " + p.stderr.decode("utf-8", "ignore"))
-        return p.stdout
+        pt = pkcs7_unpad(get_cipher(local_key_ascii).decrypt_blocks(ciphertext))
+        if pt is None:
+            raise ValueError("Invalid PKCS7 padding")
+        return pt
 
 
 # ============================================================================
@@ -242,7 +227,7 @@ class SaunaLogicClient:
                 time.sleep(0.01)
                 continue
             
-            success, start, length = SaunaTuyaFrame.try_parse_one_frame(bytes(buf), 0, have)
+            success, start, length = SaunaTuyaFrame.try_parse_one_frame(buf, 0, have)
             if success:
                 cmd = SaunaTuyaFrame.read_u32_be(buf, start + 8)
                 if cmd == 10:
@@ -8,54 +8,62 @@ This is a pragmatic brute-force helper:
 - tries common offsets to find an AES-128-ECB + PKCS7 plaintext that parses as JSON
 
 Dependencies:
-- Python stdlib only
-- `openssl` available on PATH
+- Python stdlib only (AES via sauna_crypto: libcrypto through ctypes, or pure Python)
+
+Batch mode decrypts every Type-7/8/10 frame in one or more captures into a dataset
+(timestamp, direction, seq, cmd, devId, dps). Frames are read with sauna_pcap and decrypted
+across a process pool; each input file is committed once complete, so a rerun skips finished files.
+- jsonl: one row per frame appended to --out; each finished input is recorded in <out>.done with
+  the size of --out after its rows, and a rerun first truncates --out back to the last recorded
+  size, so rows of an input interrupted mid-write are never duplicated
+- columnar: one gzip'd JSON of column arrays per input in the --out directory (dps.<key> columns),
+  named <basename>.<hash of its absolute path>.cols.json.gz so same-named captures from different
+  directories don't collide; finished inputs are recorded in <out>/.done
+Repeated frames (same ciphertext) are served from sauna_frame's plaintext cache in each worker;
+--no-cache turns it off.
 
 Usage:
   python3 saunalogic_extract/tuya_try_decrypt.py --key "<LOCAL_KEY>" --hex "<packethex>"
+  python3 saunalogic_extract/tuya_try_decrypt.py --key "<LOCAL_KEY>" --pcap PCAPdroid_*.pcap --out telemetry.jsonl
+  python3 saunalogic_extract/tuya_try_decrypt.py --key "<LOCAL_KEY>" --pcap caps/*.pcap --format columnar --out dataset/
 """
 
 from __future__ import annotations
 
 import argparse
 import binascii
+import gzip
+import hashlib
 import json
-import subprocess
+import os
 import sys
 import textwrap
-import zlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator
+
+from sauna_crypto import aes_128_ecb_decrypt
+from sauna_frame import (
+    FRAME_PREFIX,
+    FRAME_TAIL,
+    HEADER,
+    TRAILER,
+    crc32_ieee,
+    decrypt_frame_json,
+    locate_ciphertext,
+    plaintext_cache_stats,
+    set_plaintext_cache,
+)
+from sauna_pcap import iter_frames
+
+BATCH_CMDS = (7, 8, 10)
+BATCH_CHUNK = 256
 
 
 def eprint(*a: object) -> None:
     print(*a, file=sys.stderr)
 
 
-def openssl_aes_128_ecb_decrypt(ciphertext: bytes, key_ascii: str) -> bytes | None:
-    # openssl requires hex key with -K
-    key_hex = key_ascii.encode("utf-8").hex()
-    try:
-        p = subprocess.run(
-            [
-                "openssl",
-                "enc",
-                "-aes-128-ecb",
-                "-d",
-                "-K",
-                key_hex,
-                "-nosalt",
-            ],
-            input=ciphertext,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=False,
-        )
-    except FileNotFoundError:
-        raise SystemExit("openssl not found on PATH")
-    if p.returncode != 0:
-        return None
-    return p.stdout
-
-
 def parse_packet(hex_str: str) -> bytes:
     s = hex_str.strip().replace(" ", "").replace("\n", "").replace("\t", "")
     if s.startswith("0x") or s.startswith("0X"):
@@ -66,39 +74,235 @@ def parse_packet(hex_str: str) -> bytes:
         raise SystemExit(f"Invalid hex: {ex}")
 
 
-def crc32_be(data: bytes) -> bytes:
-    # CRC32 as big-endian bytes (matches notes: f39f406f)
-    v = zlib.crc32(data) & 0xFFFFFFFF
-    return v.to_bytes(4, "big")
+# ==== batch mode ====
+_worker_key = ""
+
+
+def _init_worker(key: str, cache: bool = True) -> None:
+    global _worker_key
+    _worker_key = key
+    set_plaintext_cache(cache)
+
+
+def _decrypt_chunk(chunk: list[tuple[float, str, int, int, bytes]]) -> tuple[list[dict[str, Any]], int]:
+    """
+    Decrypted rows for one chunk, plus how many frames the plaintext cache answered.
+    """
+    hits0 = plaintext_cache_stats()["hits"]
+    rows = []
+    for ts, direction, seq, cmd, frame in chunk:
+        j = decrypt_frame_json(frame, _worker_key)
+        if j is None:
+            continue
+        dps = j.get("dps")
+        rows.append(
+            {
+                "ts": ts,
+                "direction": direction,
+                "seq": seq,
+                "cmd": cmd,
+                "devId": j.get("devId"),
+                "dps": dps if isinstance(dps, dict) else {},
+            }
+        )
+    return rows, plaintext_cache_stats()["hits"] - hits0
+
+
+def _chunks(path: str) -> Iterator[list[tuple[float, str, int, int, bytes]]]:
+    chunk: list[tuple[float, str, int, int, bytes]] = []
+    for fr in iter_frames(path):
+        if fr.cmd not in BATCH_CMDS:
+            continue
+        chunk.append((fr.ts, fr.direction, fr.seq, fr.cmd, fr.frame))
+        if len(chunk) >= BATCH_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _file_id(path: str) -> str:
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}\t{st.st_size}\t{int(st.st_mtime)}"
+
+
+def _read_manifest(path: str) -> tuple[set[str], int | None]:
+    """
+    Finished file ids and the last committed offset from a manifest (<out>.done, or <out>/.done
+    for columnar output, where the offset is the size of the input's file).
+    Every line is "<id>\t<offset>" ("#start\t<offset>" first); a torn last line is ignored and
+    anything else is a ValueError.
+    """
+    done: set[str] = set()
+    committed: int | None = None
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.endswith("\n"):
+                break
+            fid, tab, offset = line[:-1].rpartition("\t")
+            if not tab or not fid or not offset.isdigit():
+                raise ValueError(f"{path}:{n}: not a manifest line: {line[:-1]!r}")
+            if fid != "#start":
+                done.add(fid)
+            committed = int(offset)
+    return done, committed
+
+
+def _commit(manifest: str, fid: str, offset: int) -> None:
+    with open(manifest, "a", encoding="utf-8") as f:
+        f.write(f"{fid}\t{offset}\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _columnar_name(path: str) -> str:
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return f"{os.path.basename(path)}.{digest}.cols.json.gz"
+
+
+class _Columns:
+    """
+    Column arrays of one input, filled chunk by chunk; a dps key first seen late is None-padded.
+    """
+
+    BASE = ("ts", "direction", "seq", "cmd", "devId")
+
+    def __init__(self) -> None:
+        self.rows = 0
+        self.base: dict[str, list[Any]] = {c: [] for c in self.BASE}
+        self.dps: dict[str, list[Any]] = {}
+
+    def add(self, rows: list[dict[str, Any]]) -> None:
+        for r in rows:
+            for c in self.BASE:
+                self.base[c].append(r[c])
+            for k, v in r["dps"].items():
+                col = self.dps.get(k)
+                if col is None:
+                    col = self.dps[k] = [None] * self.rows
+                col.append(v)
+            self.rows += 1
+            for col in self.dps.values():
+                if len(col) < self.rows:
+                    col.append(None)
+
+    def write(self, source: str, dest: str) -> None:
+        cols = dict(self.base)
+        for k in sorted(self.dps, key=lambda k: (len(k), k)):
+            cols["dps." + k] = self.dps[k]
+        tmp = dest + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"source": source, "rows": self.rows, "columns": cols}, f, separators=(",", ":"))
+        os.replace(tmp, dest)
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    columnar = args.format == "columnar"
+    done: set[str] = set()
+    committed: int | None = None
+    if columnar:
+        os.makedirs(args.out, exist_ok=True)
+        manifest = os.path.join(args.out, ".done")
+    else:
+        manifest = args.out + ".done"
+    if os.path.exists(manifest):
+        try:
+            done, committed = _read_manifest(manifest)
+        except ValueError as ex:
+            eprint(f"[error] {ex}")
+            return 2
+    if not columnar:
+        size = os.path.getsize(args.out) if os.path.exists(args.out) else 0
+        if committed is None:
+            _commit(manifest, "#start", size)
+        elif size > committed:
+            # Rows of an input that was still being written when the last run stopped.
+            eprint(f"[resume] dropping {size - committed} uncommitted bytes from {args.out}")
+            with open(args.out, "r+b") as f:
+                f.truncate(committed)
+
+    total_rows = 0
+    t0 = time.perf_counter()
+    pool_args = (args.key, not args.no_cache)
+    with ProcessPoolExecutor(max_workers=args.workers or None, initializer=_init_worker, initargs=pool_args) as pool:
+        for path in args.pcap:
+            fid = _file_id(path)
+            if fid in done:
+                eprint(f"[skip] {path} (already done)")
+                continue
+            t1 = time.perf_counter()
+            nrows = 0
+            hits = 0
+            parts = pool.map(_decrypt_chunk, _chunks(path))
+            if columnar:
+                # The output is one JSON object, so one input's columns are held until it is written.
+                cols = _Columns()
+                for part, part_hits in parts:
+                    cols.add(part)
+                    hits += part_hits
+                dest = os.path.join(args.out, _columnar_name(path))
+                cols.write(path, dest)
+                nrows = cols.rows
+                offset = os.path.getsize(dest)
+            else:
+                # Rows go out chunk by chunk; until the commit below a rerun truncates them away.
+                source = os.path.basename(path)
+                with open(args.out, "a", encoding="utf-8") as f:
+                    for part, part_hits in parts:
+                        for r in part:
+                            r["source"] = source
+                            f.write(json.dumps(r, separators=(",", ":")) + "\n")
+                        nrows += len(part)
+                        hits += part_hits
+                    f.flush()
+                    os.fsync(f.fileno())
+                    offset = f.tell()
+            # Only mark the file done once its rows are on disk.
+            _commit(manifest, fid, offset)
+            total_rows += nrows
+            eprint(f"[ok] {path}: {nrows} rows ({hits} from cache) in {(time.perf_counter() - t1) * 1000.0:.0f}ms")
+    eprint(f"[done] {total_rows} rows in {time.perf_counter() - t0:.2f}s")
+    return 0
 
 
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--key", required=True, help="Tuya/Thing localKey (ASCII; typically 16 chars)")
-    ap.add_argument("--hex", required=True, help="Full packet hex including 55aa prefix and aa55 tail")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--hex", help="Full packet hex including 55aa prefix and aa55 tail")
+    src.add_argument("--pcap", nargs="+", help="batch mode: decrypt every Type-7/8/10 frame in these captures")
+    ap.add_argument("--out", help="batch output (.jsonl file, or directory for --format columnar)")
+    ap.add_argument("--format", choices=["jsonl", "columnar"], default="jsonl")
+    ap.add_argument("--workers", type=int, default=0, help="decrypt processes (default: CPU count)")
+    ap.add_argument("--no-cache", action="store_true", help="batch mode: don't reuse plaintexts of repeated frames")
     args = ap.parse_args()
 
+    if args.pcap:
+        if not args.out:
+            ap.error("--pcap requires --out")
+        return run_batch(args)
+
     pkt = parse_packet(args.hex)
     if len(pkt) < 24:
         eprint("Packet too short")
         return 2
 
-    if pkt[0:4] != b"\x00\x00\x55\xaa":
+    prefix, _seq, cmd, body_len = HEADER.unpack_from(pkt)
+    expected_crc, tail = TRAILER.unpack_from(pkt, len(pkt) - TRAILER.size)
+    if prefix != FRAME_PREFIX:
         eprint(f"Unexpected prefix: {pkt[0:4].hex()}")
-    if pkt[-4:] != b"\x00\x00\xaa\x55":
+    if tail != FRAME_TAIL:
         eprint(f"Unexpected suffix: {pkt[-4:].hex()}")
 
-    # Verify CRC: bytes [-8:-4] are CRC32(packet[:-8])
-    expected_crc = pkt[-8:-4]
-    actual_crc = crc32_be(pkt[:-8])
+    # Verify CRC: bytes [-8:-4] are CRC32(packet[:-8]) (matches notes: f39f406f)
+    actual_crc = crc32_ieee(pkt[:-8])
     if expected_crc != actual_crc:
-        eprint(f"CRC mismatch: expected={expected_crc.hex()} actual={actual_crc.hex()}")
+        eprint(f"CRC mismatch: expected={expected_crc:08x} actual={actual_crc:08x}")
     else:
-        print(f"[ok] CRC32 matches: {expected_crc.hex()}")
+        print(f"[ok] CRC32 matches: {expected_crc:08x}")
 
     # Tuya header is 16 bytes, body length is stored at bytes 12..15 (big-endian)
-    body_len = int.from_bytes(pkt[12:16], "big")
-    body = pkt[16 : 16 + body_len]
+    body = pkt[HEADER.size : HEADER.size + body_len]
     print(f"[info] body_len={body_len} actual_body_bytes={len(body)}")
 
     # Find version marker (optional; some message types do not include it)
@@ -108,6 +312,23 @@ def main() -> int:
     else:
         print("[info] no '3.3' marker found in body (this is normal for some message types, e.g. cmd=10).")
 
+    # Fast path: the span computed from the header markers (return code / "3.3" header / crc+tail).
+    span = locate_ciphertext(cmd, body)
+    if span is not None:
+        pt = aes_128_ecb_decrypt(body[span[0] : span[1]], args.key)
+        pt2 = pt.strip(b"\x00").strip() if pt else b""
+        try:
+            j = json.loads(pt2.decode("utf-8", "ignore")) if pt2 else None
+        except Exception:
+            j = None
+        if isinstance(j, dict):
+            start, end = span
+            print(f"[hit] kind=json start={start} end={end} ct_len={end-start} score=1.00 (header locator)")
+            print("[hit] JSON keys:", ", ".join(sorted(map(str, j.keys()))[:30]))
+            print("[hit] preview (utf-8-ish):", pt2[:300].decode("utf-8", "ignore"))
+            return 0
+        print(f"[info] header locator span {span} did not decrypt to JSON; falling back to brute force")
+
     def score_plaintext(pt: bytes) -> float:
         if not pt:
             return 0.0
@@ -139,7 +360,7 @@ def main() -> int:
             ct = body[start:end]
             if len(ct) % 16 != 0:
                 continue
-            pt = openssl_aes_128_ecb_decrypt(ct, args.key)
+            pt = aes_128_ecb_decrypt(ct, args.key)
             if not pt:
                 continue
             pt2 = pt.strip(b"\x00").strip()